@@ -0,0 +1,370 @@
+# type: ignore
+import os
+import sys
+import json
+import time
+import re
+import random
+import argparse
+import tempfile
+import threading
+from pathlib import Path
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+sys.path.append(str(Path(__file__).parent / "src"))
+
+from laser_detector import LaserDetector
+from frame_source import FrameSampler, open_frame_source
+
+
+def load_frames(video_path: str, count: int):
+    """从视频中均匀取 count 帧；没有视频时生成随机噪声帧"""
+    if not video_path:
+        rng = np.random.default_rng(0)
+        return [rng.integers(0, 256, (1080, 1920, 3), dtype=np.uint8)
+                for _ in range(count)]
+
+    sampler = FrameSampler(video_path)
+    step = max(1, sampler.total_frames // count)
+    sampler.release()
+    frames = [f for _, f in FrameSampler(video_path, step)]
+    return frames[:count]
+
+
+def timed(fn, frames, repeat: int):
+    """返回每帧平均毫秒数和最后一轮的输出"""
+    out = None
+    start = time.perf_counter()
+    for _ in range(repeat):
+        out = [fn(f) for f in frames]
+    elapsed = time.perf_counter() - start
+    return elapsed / (repeat * len(frames)) * 1000, out
+
+
+def bench_lut(args):
+    """查找表分类 vs HSV 转换 + inRange"""
+    frames = load_frames(args.video, args.frames)
+    h, w = frames[0].shape[:2]
+    print(f"测试帧: {len(frames)} 帧 {w}x{h}，重复 {args.repeat} 轮")
+
+    hsv_detector = LaserDetector(args.color)
+    base_ms, base_masks = timed(hsv_detector._color_mask, frames, args.repeat)
+    print(f"  HSV + inRange:      {base_ms:7.2f} ms/帧")
+
+    for bits in args.bits:
+        t0 = time.perf_counter()
+        detector = LaserDetector(args.color, use_lut=True, lut_bits=bits)
+        build = time.perf_counter() - t0
+
+        ms, masks = timed(detector._color_mask, frames, args.repeat)
+        total = sum(m.size for m in base_masks)
+        diff = sum(int(np.count_nonzero(a != b)) for a, b in zip(base_masks, masks))
+        print(f"  LUT {bits} 位:          {ms:7.2f} ms/帧  加速 {base_ms / ms:4.2f}x  "
+              f"构建/加载 {build:.2f}s  不一致像素 {diff}/{total}  "
+              f"量化误差 {detector.lut.mismatch:.4%}")
+
+
+def bench_pyramid(args):
+    """全分辨率检测 vs 金字塔检测"""
+    frames = load_frames(args.video, args.frames)
+    h, w = frames[0].shape[:2]
+    print(f"测试帧: {len(frames)} 帧 {w}x{h}，重复 {args.repeat} 轮")
+
+    base_ms, base_points = timed(LaserDetector(args.color).detect_frame, frames, args.repeat)
+    print(f"  全分辨率:  {base_ms:7.2f} ms/帧")
+    for level in args.levels:
+        detector = LaserDetector(args.color, pyramid_level=level)
+        ms, points = timed(detector.detect_frame, frames, args.repeat)
+        mismatched = sum(sorted(a) != sorted(b) for a, b in zip(base_points, points))
+        print(f"  第 {level} 层:    {ms:7.2f} ms/帧  加速 {base_ms / ms:5.2f}x  "
+              f"结果不同的帧 {mismatched}/{len(frames)}")
+
+
+def bench_pipeline(args):
+    """解码与检测串行 vs 后台线程预读"""
+    print(f"视频: {args.video}，采样间隔 {args.interval}")
+    for depth in [0] + args.depth:
+        detector = LaserDetector(args.color)
+        start = time.perf_counter()
+        source = open_frame_source(args.video, depth, sample_interval=args.interval)
+        frames = 0
+        for _, frame in source:
+            detector.detect_frame(frame)
+            frames += 1
+        elapsed = time.perf_counter() - start
+
+        if depth:
+            memory = f"缓冲区上限 {source.memory_ceiling / 2 ** 20:.0f}MB"
+            name = f"预读 深度 {depth}"
+        else:
+            memory = ""
+            name = "串行"
+        print(f"  {name:10s} {frames / elapsed:7.1f} 帧/秒  {elapsed:6.2f}s  {memory}")
+
+
+def bench_recall(args):
+    """粗到细扫描 vs 密集扫描：召回率和解码帧数"""
+    print(f"视频: {args.video}，采样间隔 {args.interval}，粗扫间隔 {args.coarse}s")
+    detector = LaserDetector(args.color, prefilter=True)
+    report = detector.adaptive_recall_report(args.video, args.interval,
+                                             coarse_interval=args.coarse)
+    print(f"  片段召回 {report['segment_recall']:.1%}  "
+          f"激光帧召回 {report['frame_recall']:.1%}  "
+          f"扫描帧数 {report['dense_decoded']} -> {report['adaptive_decoded']}  "
+          f"耗时 {report['dense_seconds']:.2f}s -> {report['adaptive_seconds']:.2f}s")
+
+
+def bench_parallel(args):
+    """单进程 vs 分块多进程检测，确认片段一致"""
+    print(f"视频: {args.video}，采样间隔 {args.interval}")
+    baseline = None
+    for workers in [1] + args.workers:
+        detector = LaserDetector(args.color, prefilter=True)
+        start = time.perf_counter()
+        segments = detector.extract_segments(args.video, args.interval, workers=workers)
+        elapsed = time.perf_counter() - start
+        if baseline is None:
+            baseline = (segments, elapsed)
+            name, note = "单进程", ""
+        else:
+            name = f"{workers} 个进程"
+            note = (f"加速 {baseline[1] / elapsed:4.2f}x  "
+                    f"片段{'一致' if segments == baseline[0] else '不一致'}")
+        print(f"  {name:8s} {elapsed:6.2f}s  片段 {len(segments)}  {note}")
+
+
+class StubVLMServer:
+    """本地模拟的 OpenAI 兼容 /chat/completions 接口
+
+    每个请求等待 latency 秒后返回固定描述；按 error_rate 的概率随机返回 429
+    （带 Retry-After）或 500。批量请求（提示词要求 JSON 数组）按编号返回每个标记的
+    描述，按 bad_batch_rate 的概率返回无法解析的内容。记录同时处理的最大请求数和
+    每个请求的到达时间。
+    """
+
+    def __init__(self, latency: float = 1.0, error_rate: float = 0.0, seed: int = 0,
+                 bad_batch_rate: float = 0.0):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.bad_batch_rate = bad_batch_rate
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.active = 0
+        self.max_active = 0
+        self.arrivals = []
+        self.errors = 0
+
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+                prompt = request["messages"][0]["content"][0]["text"]
+                marks = re.search(r"#1 到 #(\d+)", prompt)
+                with stub.lock:
+                    bad_batch = stub.rng.random() < stub.bad_batch_rate
+                    stub.active += 1
+                    stub.max_active = max(stub.max_active, stub.active)
+                    stub.arrivals.append(time.perf_counter())
+                    fail = stub.rng.random() < stub.error_rate
+                    status = stub.rng.choice([429, 500]) if fail else 200
+                time.sleep(stub.latency)
+                with stub.lock:
+                    stub.active -= 1
+                    if fail:
+                        stub.errors += 1
+
+                if status == 200:
+                    text = "模拟的画面描述"
+                    if marks:
+                        count = int(marks.group(1))
+                        text = "好的，结果如下" if bad_batch else json.dumps(
+                            [{"mark": k, "description": f"模拟的画面描述 #{k}"}
+                             for k in range(1, count + 1)], ensure_ascii=False)
+                    body = {
+                        "id": "stub", "object": "chat.completion", "model": "stub",
+                        "choices": [{"index": 0, "finish_reason": "stop",
+                                     "message": {"role": "assistant", "content": text}}],
+                        "usage": {"prompt_tokens": 1200, "completion_tokens": 100,
+                                  "total_tokens": 1300},
+                    }
+                else:
+                    body = {"error": {"message": f"stub error {status}", "type": "stub"}}
+                data = json.dumps(body, ensure_ascii=False).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                if status == 429:
+                    self.send_header('Retry-After', '0.2')
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.server.server_address[1]}/v1"
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def reset(self):
+        with self.lock:
+            self.max_active = 0
+            self.arrivals = []
+            self.errors = 0
+
+
+def bench_vlm(args):
+    """串行调用 vs 并发限流请求引擎（对本地模拟接口）"""
+    from qa_generator import QAGenerator
+
+    with tempfile.TemporaryDirectory() as tmp, \
+            StubVLMServer(args.latency, args.error_rate,
+                          bad_batch_rate=args.bad_batch_rate) as stub:
+        rng = np.random.default_rng(0)
+        images = [(os.path.join(tmp, "roi.jpg"), f"{i}.0s - {i + 1}.0s", 1.0,
+                   rng.integers(0, 256, (200, 300, 3), dtype=np.uint8))
+                  for i in range(args.images)]
+        print(f"模拟接口: 延迟 {args.latency}s，错误率 {args.error_rate:.0%}，{args.images} 张图片")
+
+        for name, in_flight in (("串行", 1), (f"并发 {args.in_flight}", args.in_flight)):
+            stub.reset()
+            # 非智谱/OpenAI 域名会被识别为 openai 兼容接口
+            qa_gen = QAGenerator(api_key="sk-stub", base_url=stub.base_url,
+                                 max_in_flight=in_flight, qps=args.qps, tpm=args.tpm,
+                                 max_retries=args.retries, cache_dir=None,
+                                 batch_size=1 if in_flight == 1 else args.batch_size,
+                                 batch_mode=args.batch_mode)
+            qa_gen.engine.backoff_base = 0.2
+            start = time.perf_counter()
+            if in_flight == 1:
+                results = [qa_gen.analyze_image(*img) for img in images]
+            else:
+                results = qa_gen.analyze_batch(images)
+            elapsed = time.perf_counter() - start
+            qa_gen.engine.shutdown()
+
+            arrivals = stub.arrivals
+            span = arrivals[-1] - arrivals[0] if len(arrivals) > 1 else 0
+            rate = (len(arrivals) - 1) / span if span else 0
+            ok = sum(r["tags"] != ["API失败"] for r in results)
+            print(f"  {name:8s} {elapsed:6.2f}s  成功 {ok}/{len(results)}  "
+                  f"请求 {qa_gen.engine.requests}（重试 {qa_gen.engine.retries}，"
+                  f"批量 {qa_gen.batches}，批量退回单张 {qa_gen.batch_fallbacks}）  "
+                  f"最大并发 {stub.max_active}  平均到达速率 {rate:.2f} 次/秒")
+
+
+def bench_encode(args):
+    """截图编码：原方式（2 倍放大 + 默认质量）vs 按服务商预算编码"""
+    import cv2
+    from content_analyzer import ContentAnalyzer
+    from image_encoder import ImageEncoder, PROVIDER_BUDGETS
+
+    segments = LaserDetector(args.color).extract_segments(args.video)
+    with tempfile.TemporaryDirectory() as tmp:
+        contents = [c for c in ContentAnalyzer().analyze_batch(args.video, segments, tmp) if c]
+    if not contents:
+        print("没有可用的截图")
+        return
+    uplink = args.uplink * 1e6 / 8
+    print(f"截图 {len(contents)} 张，上行带宽 {args.uplink} Mbps")
+    # 原方式上传的是 2 倍 INTER_CUBIC 放大、按默认质量保存的截图
+    baseline_bytes = sum(
+        len(cv2.imencode('.jpg', cv2.resize(c['roi_image'], None, fx=2, fy=2,
+                                            interpolation=cv2.INTER_CUBIC))[1])
+        for c in contents)
+
+    for provider in PROVIDER_BUDGETS:
+        encoder = ImageEncoder(provider)
+        start = time.perf_counter()
+        for c in contents:
+            encoder.encode(c['roi_image'])
+        ms = (time.perf_counter() - start) / len(contents) * 1000
+        # base64 使上传体积增加 1/3
+        before = baseline_bytes * 4 / 3 / uplink / len(contents)
+        after = encoder.bytes_out * 4 / 3 / uplink / len(contents)
+        print(f"  {provider:8s} 字节 {baseline_bytes / 1024:7.0f}KB -> "
+              f"{encoder.bytes_out / 1024:6.0f}KB  token {encoder.tokens_baseline:6d} -> "
+              f"{encoder.tokens_out:6d}  每张上传 {before:5.2f}s -> {after:5.2f}s  "
+              f"编码 {ms:.1f} ms/张")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="性能基准测试")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("lut", help="查找表颜色分类 vs HSV 路径")
+    p.add_argument("--video", default="", help="测试视频（默认随机噪声帧）")
+    p.add_argument("--frames", type=int, default=30)
+    p.add_argument("--repeat", type=int, default=3)
+    p.add_argument("--color", default="both", choices=["both", "red", "green"])
+    p.add_argument("--bits", type=int, nargs="+", default=[8, 6])
+    p.set_defaults(func=bench_lut)
+
+    p = sub.add_parser("pyramid", help="金字塔检测 vs 全分辨率检测")
+    p.add_argument("--video", default="", help="测试视频（默认随机噪声帧）")
+    p.add_argument("--frames", type=int, default=30)
+    p.add_argument("--repeat", type=int, default=3)
+    p.add_argument("--color", default="both", choices=["both", "red", "green"])
+    p.add_argument("--levels", type=int, nargs="+", default=[1, 2])
+    p.set_defaults(func=bench_pyramid)
+
+    p = sub.add_parser("pipeline", help="解码/检测流水线吞吐")
+    p.add_argument("video")
+    p.add_argument("--interval", type=int, default=3)
+    p.add_argument("--color", default="both", choices=["both", "red", "green"])
+    p.add_argument("--depth", type=int, nargs="+", default=[2, 4, 8])
+    p.set_defaults(func=bench_pipeline)
+
+    p = sub.add_parser("recall", help="粗到细扫描的召回率和扫描帧数")
+    p.add_argument("video")
+    p.add_argument("--interval", type=int, default=3)
+    p.add_argument("--coarse", type=float, default=1.5, help="粗扫间隔（秒）")
+    p.add_argument("--color", default="both", choices=["both", "red", "green"])
+    p.set_defaults(func=bench_recall)
+
+    p = sub.add_parser("parallel", help="单进程 vs 多进程分块检测")
+    p.add_argument("video")
+    p.add_argument("--interval", type=int, default=3)
+    p.add_argument("--color", default="both", choices=["both", "red", "green"])
+    p.add_argument("--workers", type=int, nargs="+", default=[2, 4])
+    p.set_defaults(func=bench_parallel)
+
+    p = sub.add_parser("encode", help="截图编码预算")
+    p.add_argument("video")
+    p.add_argument("--color", default="both", choices=["both", "red", "green"])
+    p.add_argument("--uplink", type=float, default=2.0, help="上行带宽（Mbps）")
+    p.set_defaults(func=bench_encode)
+
+    p = sub.add_parser("vlm", help="视觉模型请求引擎（本地模拟接口）")
+    p.add_argument("--images", type=int, default=20)
+    p.add_argument("--latency", type=float, default=1.0, help="模拟接口的响应时间（秒）")
+    p.add_argument("--error-rate", type=float, default=0.2, help="模拟 429/500 的概率")
+    p.add_argument("--in-flight", type=int, default=8)
+    p.add_argument("--qps", type=float, default=None)
+    p.add_argument("--tpm", type=float, default=None)
+    p.add_argument("--retries", type=int, default=4)
+    p.add_argument("--batch-size", type=int, default=1, help="并发模式下每个请求的标记数")
+    p.add_argument("--batch-mode", default=None, choices=["images", "montage"])
+    p.add_argument("--bad-batch-rate", type=float, default=0.0,
+                   help="模拟批量回复无法解析的概率")
+    p.set_defaults(func=bench_vlm)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
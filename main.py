@@ -1,192 +1,394 @@
 # type: ignore
 import sys
 import os
+import argparse
 from pathlib import Path
 
 # 添加 src 到路径
 sys.path.append(str(Path(__file__).parent / "src"))
 
-def main():
-    print("="*60)
-    print("  数字人激光标记系统")
-    print("  智谱GLM-4V视觉识别版")
-    print("="*60)
-    
-    # 延迟导入，避免初始化错误
+
+def ask_answer(qa):
+    """交互式收集回答、标签和一句话总结，直接修改 qa"""
+    print(f"\n❓ {qa['question']}")
+    try:
+        your_answer = input("\n💡 你的回答（为什么标记这里，直接回车跳过）：\n> ").strip()
+    except:
+        your_answer = ""
+
+    if your_answer:
+        qa['ai_answer'] = your_answer
+        qa['confidence'] = "已确认"
+
+        # 标签
+        try:
+            tags = input("\n🏷️ 标签（空格分隔，如：算法 重点，直接回车跳过）：\n> ").strip()
+            if tags:
+                qa['tags'] = tags.split()
+        except:
+            pass
+
+        # 关键点
+        try:
+            key_point = input("\n🎯 一句话总结（直接回车跳过）：\n> ").strip()
+            if key_point:
+                qa['key_point'] = key_point
+        except:
+            pass
+    else:
+        print("  （已跳过，可稍后补充）")
+
+
+class InitializationError(Exception):
+    """组件初始化失败（配置、API Key、知识库等），与处理过程中的错误区分"""
+
+
+def process_video(video_path, laser_color="both", interactive=True, restart=False, workers=1,
+                  pyramid_level=0):
+    """检测 → 截图 → AI分析 → 知识库
+
+    interactive 为 False 时不等待输入，所有标记以未回答状态保存，之后用 review 命令补充。
+    workers > 1 时按帧区间分块多进程检测；pyramid_level 为 1/2 时先在 1/2、1/4 缩小的帧上
+    找候选区域，再回到全分辨率确认（高分辨率视频检测更快）。
+    进度记录在断点文件中，中断后再处理同一个视频时从第一个未保存的标记继续；
+    restart 为 True 时丢弃进度从头处理。
+    返回处理的片段数；初始化失败时抛出 InitializationError。
+    """
+    print(f"\n{'='*60}")
+    print(f"开始处理: {os.path.basename(video_path)}")
+    print(f"激光检测模式: {laser_color}")
+    print(f"{'='*60}")
+
+    # 初始化组件（导入失败、缺少 API Key 等都算初始化错误）
+    print("\n初始化组件...")
     try:
         from laser_detector import LaserDetector
         from content_analyzer import ContentAnalyzer
         from qa_generator import QAGenerator
-        from knowledge_base import SimpleKnowledgeBase
-        print("所有模块导入成功")
+        from knowledge_base import open_knowledge_base
+        from pipeline import SegmentPipeline
+        from checkpoint import VideoCheckpoint
+        detector = LaserDetector(laser_color=laser_color, prefilter=True,
+                                 pyramid_level=pyramid_level)
+        analyzer = ContentAnalyzer()
+        qa_gen = QAGenerator()
+        kb = open_knowledge_base()
     except Exception as e:
-        print(f"导入错误: {e}")
-        import traceback
-        traceback.print_exc()
-        input("按回车退出...")
+        raise InitializationError(str(e)) from e
+    print("组件初始化完成")
+
+    # 断点：上次中断时已检测的片段、已完成的截图和AI分析、已保存的标记
+    checkpoint = VideoCheckpoint(video_path, {'laser_color': laser_color})
+    if checkpoint.is_started() and not restart:
+        saved = checkpoint.saved()
+        if checkpoint.is_complete():
+            print(f"\n该视频已处理完成（{len(saved)} 个标记已保存）")
+        else:
+            print(f"\n发现上次的进度：已保存 {len(saved)} 个标记")
+        if interactive:
+            choice = input("继续上次的进度？（Y/n，n 表示从头处理）: ").strip().lower()
+            restart = choice == "n"
+        elif checkpoint.is_complete():
+            print("如需重新处理请加 --restart")
+            return 0
+    if restart:
+        checkpoint.clear()
+    saved = checkpoint.saved()
+    analyzed = checkpoint.analyzed()
+
+    # 检测、截图、AI分析在后台流水线中同时进行，检测到第一个片段后很快就能开始回答
+    print("\n开始处理（检测激光标记的同时提取截图、调用AI分析）...")
+    pipeline = SegmentPipeline(detector, analyzer, qa_gen)
+    # 默认单进程检测：逐帧产出的帧图像才能留作片段的中间帧，截图时不再解码；
+    # 多进程检测时片段不带中间帧，截图时重新定位解码
+    results = pipeline.run(video_path, "output",
+                           segments=checkpoint.segments, skip=saved,
+                           restored={i: (a['content'], a['qa']) for i, a in analyzed.items()},
+                           on_detected=checkpoint.set_segments,
+                           workers=workers, cache_dir="output/cache", keyframes=True)
+
+    count = 0
+    while True:
+        try:
+            item = next(results, None)
+        except Exception as e:
+            print(f"检测错误: {e}")
+            import traceback
+            traceback.print_exc()
+            break
+        if item is None:
+            break
+
+        count += 1
+        seg = item.segment
+        print(f"\n{'─'*60}")
+        print(f"【标记 {item.index}】{seg.start_time:.1f}s - {seg.end_time:.1f}s")
+        print(f"{'─'*60}")
+
+        # 截图
+        content = item.content
+        if content is None:
+            print(f"  截图错误: {item.error}")
+            continue
+        print(f"  截图保存: {content['roi_path']}")
+
+        # 智谱分析
+        qa = item.qa
+        if qa is None:
+            print(f"  AI分析错误: {item.error}")
+            qa = {
+                "ai_description": f"【分析失败】{item.error}",
+                "question": f"【{content['timestamp']}】请查看截图，手动描述内容",
+                "ai_answer": "【待你回答】",
+                "confidence": "低",
+                "tags": ["分析失败"],
+                "key_point": "【待补充】"
+            }
+
+        if item.index not in analyzed:
+            checkpoint.record(item.index, content, qa)
+
+        if interactive:
+            # 显示结果
+            print(f"\n{'='*60}")
+            print("🤖 智谱看到的画面：")
+            print(f"{qa['ai_description']}")
+            print(f"{'='*60}")
+
+            # 用户回答
+            ask_answer(qa)
+
+        # 保存
+        try:
+            entry_id = checkpoint.save_entry(kb, item.index, os.path.basename(video_path),
+                                             content, qa)
+            print(f"\n✅ 已保存到知识库，ID: {entry_id}")
+        except Exception as e:
+            print(f"\n保存错误: {e}")
+
+    # 等待后台压缩知识库日志完成
+    kb.close()
+
+    if count == 0 and saved:
+        print("没有剩余的标记，处理结束。")
+        return 0
+    if count == 0:
+        print("未检测到激光标记，处理结束。")
+        print("提示：请检查视频是否包含红色或绿色激光笔标记")
+        return 0
+
+    print(f"\n{'='*60}")
+    print(f"处理完成！共处理 {count} 个片段")
+    pipeline.report()
+    if qa_gen.cache is not None:
+        qa_gen.cache.report()
+    qa_gen.encoder.report()
+    print(f"数据保存在: {kb.location}")
+    if not interactive:
+        print("所有标记均未回答，运行 python main.py review 补充回答")
+    print(f"{'='*60}")
+    return count
+
+
+def review(video=None):
+    """逐条补充未回答标记的回答、标签和一句话总结"""
+    from knowledge_base import open_knowledge_base
+
+    kb = open_knowledge_base()
+    entries = kb.filter(video=video, unanswered=True)
+
+    if not entries:
+        print("所有标记都已回答")
         return
-    
+
+    print(f"有 {len(entries)} 条未回答的标记（直接回车跳过，输入 q 结束）")
+    answered = 0
+    for i, entry in enumerate(entries, 1):
+        print(f"\n{'─'*60}")
+        print(f"【{i}/{len(entries)}】[{entry['id']}] {entry.get('video_file', '未知')} "
+              f"{entry['timestamp']}")
+        print(f"截图: {entry.get('screenshot', '无')}")
+        print(f"{'─'*60}")
+        print("🤖 智谱看到的画面：")
+        print(entry.get('ai_description', '无描述'))
+
+        print(f"\n❓ {entry.get('question', '')}")
+        try:
+            your_answer = input("\n💡 你的回答（为什么标记这里，直接回车跳过，q 结束）：\n> ").strip()
+        except (EOFError, KeyboardInterrupt):
+            break
+        if your_answer.lower() == "q":
+            break
+        if not your_answer:
+            continue
+
+        fields = {'your_answer': your_answer, 'confidence': "已确认"}
+        try:
+            tags = input("\n🏷️ 标签（空格分隔，直接回车保持不变）：\n> ").strip()
+            if tags:
+                fields['tags'] = tags.split()
+            key_point = input("\n🎯 一句话总结（直接回车跳过）：\n> ").strip()
+            if key_point:
+                fields['key_point'] = key_point
+        except (EOFError, KeyboardInterrupt):
+            pass
+
+        kb.update(entry['id'], **fields)
+        answered += 1
+        print(f"✅ 已更新 ID: {entry['id']}")
+
+    remaining = kb.count(unanswered=True)
+    kb.close()
+    print(f"\n本次回答了 {answered} 条，还剩 {remaining} 条未回答")
+
+
+def batch(source, laser_color="both", jobs=None, recursive=False, workers=1):
+    """批量处理目录或清单文件中的视频，已完成的视频跳过"""
+    from qa_generator import QAGenerator
+    from knowledge_base import open_knowledge_base
+    from batch_runner import BatchRunner, discover_videos
+
+    videos = discover_videos(source, recursive)
+    if not videos:
+        print(f"没有找到视频: {source}")
+        return 0
+
+    runner = BatchRunner(QAGenerator(), open_knowledge_base(), laser_color, jobs,
+                         workers=workers)
+    summary = runner.run(videos)
+    runner.kb.close()
+    if runner.qa_gen.cache is not None:
+        runner.qa_gen.cache.report()
+    runner.qa_gen.encoder.report()
+    print("所有标记均未回答，运行 python main.py review 补充回答")
+    return summary['failed']
+
+
+def interactive():
+    print("="*60)
+    print("  数字人激光标记系统")
+    print("  智谱GLM-4V视觉识别版")
+    print("="*60)
+
     # 获取视频路径
     try:
         video_path = input("\n视频路径（拖入或输入）: ").strip().strip('"')
-        
+
         if not video_path:
             print("错误：未输入路径")
             input("按回车退出...")
             return
-            
+
         if not os.path.exists(video_path):
             print(f"错误：文件不存在 - {video_path}")
             input("按回车退出...")
             return
-        
+
         # 选择激光颜色
         print("\n选择激光笔颜色：")
         print("  1. 自动检测（红绿都检测）")
         print("  2. 红色激光")
         print("  3. 绿色激光")
         color_choice = input("请输入选项（1/2/3，默认1）: ").strip()
-        
+
         laser_color = "both"
         if color_choice == "2":
             laser_color = "red"
         elif color_choice == "3":
             laser_color = "green"
-        
-        # 获取视频背景
-        print("\n视频主题/背景（帮助AI理解，可直接回车跳过）:")
-        video_context = input("> ").strip()
-        
-        # 开始处理
-        print(f"\n{'='*60}")
-        print(f"开始处理: {os.path.basename(video_path)}")
-        print(f"激光检测模式: {laser_color}")
-        print(f"{'='*60}")
-        
-        # 初始化组件
-        print("\n初始化组件...")
+
         try:
-            detector = LaserDetector(laser_color=laser_color)
-            analyzer = ContentAnalyzer()
-            qa_gen = QAGenerator()
-            kb = SimpleKnowledgeBase()
-            print("组件初始化完成")
-        except Exception as e:
+            process_video(video_path, laser_color, interactive=True)
+        except InitializationError as e:
             print(f"初始化错误: {e}")
             import traceback
             traceback.print_exc()
-            input("按回车退出...")
-            return
-        
-        # 检测激光
-        print("\n【步骤1/3】检测激光标记...")
-        try:
-            segments = detector.extract_segments(video_path)
         except Exception as e:
-            print(f"检测错误: {e}")
+            print(f"处理错误: {e}")
             import traceback
             traceback.print_exc()
-            input("按回车退出...")
-            return
-        
-        if not segments:
-            print("未检测到激光标记，处理结束。")
-            print("提示：请检查视频是否包含红色或绿色激光笔标记")
-            input("按回车退出...")
-            return
-        
-        print(f"检测到 {len(segments)} 个激光标记片段\n")
-        
-        # 逐个处理
-        for i, seg in enumerate(segments, 1):
-            print(f"\n{'─'*60}")
-            print(f"【标记 {i}/{len(segments)}】{seg.start_time:.1f}s - {seg.end_time:.1f}s")
-            print(f"{'─'*60}")
-            
-            # 截图
-            print("步骤1：提取截图...")
-            try:
-                content = analyzer.analyze(video_path, seg, "output")
-                print(f"  截图保存: {content['roi_path']}")
-            except Exception as e:
-                print(f"  截图错误: {e}")
-                continue
-            
-            # 智谱分析
-            print("\n步骤2：智谱GLM-4V分析图片中...")
-            try:
-                qa = qa_gen.analyze_image(
-                    content['roi_path'],
-                    content['timestamp'],
-                    content['laser_duration']
-                )
-            except Exception as e:
-                print(f"  AI分析错误: {e}")
-                qa = {
-                    "ai_description": f"【分析失败】{e}",
-                    "question": f"【{content['timestamp']}】请查看截图，手动描述内容",
-                    "ai_answer": "【待你回答】",
-                    "confidence": "低",
-                    "tags": ["分析失败"],
-                    "key_point": "【待补充】"
-                }
-            
-            # 显示结果
-            print(f"\n{'='*60}")
-            print("🤖 智谱看到的画面：")
-            print(f"{qa['ai_description']}")
-            print(f"{'='*60}")
-            
-            # 用户回答
-            print(f"\n❓ {qa['question']}")
-            try:
-                your_answer = input("\n💡 你的回答（为什么标记这里，直接回车跳过）：\n> ").strip()
-            except:
-                your_answer = ""
-            
-            if your_answer:
-                qa['ai_answer'] = your_answer
-                qa['confidence'] = "已确认"
-                
-                # 标签
-                try:
-                    tags = input("\n🏷️ 标签（空格分隔，如：算法 重点，直接回车跳过）：\n> ").strip()
-                    if tags:
-                        qa['tags'] = tags.split()
-                except:
-                    pass
-                
-                # 关键点
-                try:
-                    key_point = input("\n🎯 一句话总结（直接回车跳过）：\n> ").strip()
-                    if key_point:
-                        qa['key_point'] = key_point
-                except:
-                    pass
-            else:
-                print("  （已跳过，可稍后补充）")
-            
-            # 保存
-            try:
-                entry_id = kb.add(os.path.basename(video_path), content, qa)
-                print(f"\n✅ 已保存到知识库，ID: {entry_id}")
-            except Exception as e:
-                print(f"\n保存错误: {e}")
-        
-        print(f"\n{'='*60}")
-        print(f"处理完成！共处理 {len(segments)} 个片段")
-        print(f"数据保存在: output/qa_database.json")
-        print(f"{'='*60}")
-        
+
     except KeyboardInterrupt:
         print("\n\n用户中断")
     except Exception as e:
         print(f"\n程序错误: {e}")
         import traceback
         traceback.print_exc()
-    
+
     finally:
         input("\n按回车退出...")
 
+
+def main():
+    # 不带参数时保持原来的交互流程
+    if len(sys.argv) == 1:
+        interactive()
+        return
+
+    parser = argparse.ArgumentParser(description="数字人激光标记系统")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("process", help="无人值守处理视频，标记以未回答状态保存")
+    p.add_argument("videos", nargs="+", help="视频路径")
+    p.add_argument("--color", default="both", choices=["both", "red", "green"],
+                   help="激光笔颜色")
+    p.add_argument("--restart", action="store_true", help="丢弃断点进度，从头处理")
+    p.add_argument("--workers", type=int, default=1,
+                   help="单个视频检测的进程数，默认 1（大于 1 时分块并行检测）")
+    p.add_argument("--pyramid-level", type=int, default=0, choices=[0, 1, 2],
+                   help="金字塔检测层级：0 全分辨率（默认），1/2 先在 1/2、1/4 缩小的帧上找候选")
+
+    p = sub.add_parser("batch", help="批量处理目录或清单文件中的视频，重新运行时跳过已完成的")
+    p.add_argument("source", nargs="?", default="input_videos",
+                   help="视频目录或清单文件（每行一个路径），默认 input_videos")
+    p.add_argument("--color", default="both", choices=["both", "red", "green"],
+                   help="激光笔颜色")
+    p.add_argument("--jobs", type=int, default=None, help="并行处理的视频数，默认 CPU 核心数")
+    p.add_argument("--workers", type=int, default=1,
+                   help="单个视频检测的进程数，默认 1（视频数少于核心数时可以调大）")
+    p.add_argument("-r", "--recursive", action="store_true", help="包含子目录")
+
+    p = sub.add_parser("review", help="补充未回答标记的回答")
+    p.add_argument("--video", default=None, help="只处理该视频文件名的标记")
+
+    p = sub.add_parser("migrate-sqlite", help="把知识库导入 SQLite（之后设置 KB_BACKEND=sqlite 使用）")
+    p.add_argument("--db", default="output/qa_database.json", help="原知识库路径")
+    p.add_argument("--out", default="output/qa_database.sqlite", help="SQLite 数据库路径")
+
+    args = parser.parse_args()
+
+    if args.command == "process":
+        failed = 0
+        for video_path in args.videos:
+            if not os.path.exists(video_path):
+                print(f"错误：文件不存在 - {video_path}")
+                failed += 1
+                continue
+            try:
+                process_video(video_path, args.color, interactive=False, restart=args.restart,
+                              workers=args.workers, pyramid_level=args.pyramid_level)
+            except Exception as e:
+                print(f"处理失败 {video_path}: {e}")
+                import traceback
+                traceback.print_exc()
+                failed += 1
+        sys.exit(1 if failed else 0)
+
+    elif args.command == "batch":
+        sys.exit(1 if batch(args.source, args.color, args.jobs, args.recursive,
+                            args.workers) else 0)
+
+    elif args.command == "review":
+        review(args.video)
+
+    elif args.command == "migrate-sqlite":
+        from sqlite_store import migrate_to_sqlite
+        try:
+            migrate_to_sqlite(args.db, args.out)
+        except ValueError as e:
+            print(f"迁移失败: {e}")
+            sys.exit(1)
+
+
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -8,12 +8,25 @@ sys.path.append(str(Path(__file__).parent / "src"))
 from query_tool import QueryTool
 
 
+def show_pages(show):
+    """show(cursor) 显示一页并返回下一页的游标；按回车翻页，输入 q 停止"""
+    cursor = show(None)
+    while cursor is not None:
+        if input("\n按回车显示下一页，输入 q 返回：").strip().lower() == "q":
+            break
+        cursor = show(cursor)
+
+
 def main():
     print("="*70)
     print("  知识库查询工具")
     print("="*70)
     
-    tool = QueryTool()
+    try:
+        tool = QueryTool()
+    except ValueError as e:
+        print(f"无法打开知识库: {e}")
+        return
     
     while True:
         print("\n请选择操作：")
@@ -24,24 +37,26 @@ def main():
         print("  5. 列出所有标签")
         print("  6. 查看未回答的标记")
         print("  7. 导出为 Markdown")
+        print("  8. 组合筛选（标签、视频、未回答、日期）")
+        print("  9. 查找相似标记")
         print("  0. 退出")
         
         choice = input("\n> ").strip()
         
         if choice == "1":
-            limit = input("显示数量（默认20，直接回车）：").strip()
-            limit = int(limit) if limit.isdigit() else 20
-            tool.list_all(limit=limit)
+            limit = input("每页数量（默认20，直接回车）：").strip()
+            limit = int(limit) if limit.isdigit() and int(limit) > 0 else 20
+            show_pages(lambda cursor: tool.list_all(limit=limit, after_id=cursor))
         
         elif choice == "2":
-            keyword = input("请输入关键词：").strip()
+            keyword = input("请输入关键词（空格分隔表示同时包含，OR 表示或）：").strip()
             if keyword:
-                tool.search(keyword)
+                show_pages(lambda cursor: tool.search(keyword, cursor=cursor))
         
         elif choice == "3":
             tag = input("请输入标签：").strip()
             if tag:
-                tool.search_by_tag(tag)
+                show_pages(lambda cursor: tool.search_by_tag(tag, after_id=cursor))
         
         elif choice == "4":
             id_str = input("请输入ID：").strip()
@@ -52,11 +67,26 @@ def main():
             tool.list_tags()
         
         elif choice == "6":
-            tool.list_unanswered()
+            show_pages(lambda cursor: tool.list_unanswered(after_id=cursor))
         
         elif choice == "7":
             tool.export_to_markdown()
         
+        elif choice == "8":
+            print("各项直接回车表示不限")
+            tag = input("标签：").strip() or None
+            video = input("视频文件名：").strip() or None
+            unanswered = input("只看未回答（y/N）：").strip().lower() == "y"
+            start_date = input("开始日期（YYYY-MM-DD）：").strip() or None
+            end_date = input("结束日期（YYYY-MM-DD）：").strip() or None
+            show_pages(lambda cursor: tool.filter_entries(tag, video, unanswered, start_date,
+                                                          end_date, after_id=cursor))
+        
+        elif choice == "9":
+            id_str = input("请输入ID：").strip()
+            if id_str.isdigit():
+                tool.related(int(id_str))
+        
         elif choice == "0":
             print("再见！")
             break
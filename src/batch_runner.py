@@ -0,0 +1,255 @@
+import os
+import json
+import time
+import hashlib
+import multiprocessing
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from datetime import datetime
+from typing import Dict, List, Optional, Set, Tuple
+
+from checkpoint import VideoCheckpoint
+
+# 目录扫描时识别的视频扩展名
+VIDEO_EXTENSIONS = ('.mp4', '.mov', '.mkv', '.avi', '.flv', '.webm', '.m4v', '.wmv')
+STATE_FILE = "batch_state.json"
+
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+def discover_videos(source: str, recursive: bool = False) -> List[str]:
+    """列出目录中的视频，或读取清单文件
+
+    清单文件每行一个视频路径，空行和 # 开头的行忽略，相对路径相对于清单文件所在目录。
+    """
+    if os.path.isdir(source):
+        videos = []
+        for root, dirs, files in os.walk(source):
+            dirs.sort()
+            videos.extend(os.path.join(root, name) for name in sorted(files)
+                          if name.lower().endswith(VIDEO_EXTENSIONS))
+            if not recursive:
+                break
+        return videos
+
+    base = os.path.dirname(os.path.abspath(source))
+    videos = []
+    with open(source, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            videos.append(line if os.path.isabs(line) else os.path.join(base, line))
+    return videos
+
+
+def video_output_dir(output_dir: str, video_path: str) -> str:
+    """每个视频的截图目录，避免不同视频同一帧号的截图互相覆盖"""
+    path = os.path.abspath(video_path)
+    stem = os.path.splitext(os.path.basename(path))[0]
+    digest = hashlib.sha1(path.encode('utf-8')).hexdigest()[:8]
+    return os.path.join(output_dir, "videos", f"{stem}_{digest}")
+
+
+class BatchState:
+    """批量处理的状态文件：视频绝对路径 → 状态（pending/running/done/failed）和处理信息
+
+    每次状态变化都原子地重写整个文件（写临时文件后替换），中断时不会损坏。
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.videos: Dict[str, Dict] = {}
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                self.videos = json.load(f)
+
+    def status(self, video_path: str) -> str:
+        return self.videos.get(os.path.abspath(video_path), {}).get('status', PENDING)
+
+    def mark(self, video_path: str, status: str, **info):
+        entry = self.videos.setdefault(os.path.abspath(video_path), {})
+        entry.update(info, status=status, updated_at=datetime.now().isoformat())
+        if status != FAILED:
+            entry.pop('error', None)
+        self._save()
+
+    def counts(self) -> Counter:
+        return Counter(v['status'] for v in self.videos.values())
+
+    def _save(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.videos, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.path)
+
+
+def _detect_video(video_path: str, laser_color: str, output_dir: str,
+                  cache_dir: Optional[str], checkpoint_dir: str,
+                  workers: int = 1) -> Tuple[str, List, Dict[int, Dict]]:
+    """在子进程中检测一个视频并提取截图，workers > 1 时检测再分块多进程并行
+
+    视频哈希和断点也在子进程里计算和读取：断点里已有片段列表时（从断点恢复）不再检测，
+    已分析或已保存的片段（序号从 1 开始）不再截图。
+    返回 (视频哈希, 片段列表, 序号 → 截图信息（含原分辨率的截图数组）)。
+    """
+    from laser_detector import LaserDetector
+    from content_analyzer import ContentAnalyzer
+
+    checkpoint = VideoCheckpoint(video_path, {'laser_color': laser_color},
+                                 checkpoint_dir, cache_dir)
+    segments = checkpoint.segments
+    if segments is None:
+        detector = LaserDetector(laser_color=laser_color, prefilter=True)
+        segments = detector.extract_segments(video_path, workers=workers, cache_dir=cache_dir,
+                                             keyframes=True)
+        checkpoint.set_segments(segments)
+    done = set(checkpoint.saved()) | set(checkpoint.analyzed())
+    todo = [(i, seg) for i, seg in enumerate(segments, 1) if i not in done]
+    contents = ContentAnalyzer().analyze_batch(video_path, [seg for _, seg in todo], output_dir)
+    for seg in segments:
+        # 中间帧不必传回主进程
+        seg.keyframe = None
+    return (checkpoint.video_hash, segments,
+            {i: c for (i, _), c in zip(todo, contents) if c is not None})
+
+
+def _failed_qa(content: Dict, error: Exception) -> Dict:
+    return {
+        "ai_description": f"【分析失败】{error}",
+        "question": f"【{content['timestamp']}】请查看截图，手动描述内容",
+        "ai_answer": "【待你回答】",
+        "confidence": "低",
+        "tags": ["分析失败"],
+        "key_point": "【待补充】"
+    }
+
+
+class BatchRunner:
+    """批量处理多个视频
+
+    检测和截图（CPU 密集）在进程池中按视频并行；每个视频检测完后在主进程里
+    提交视觉模型请求（共享 QAGenerator 的并发、限流和缓存），全部返回后按片段顺序
+    写入知识库。只有主进程写知识库和状态文件，所以不会互相覆盖。
+
+    状态文件记录每个视频的状态，重新运行时跳过已完成（done）的视频；
+    失败或中断时仍在处理（running）的视频重新处理，并从该视频的断点继续
+    （已检测的片段、已完成的截图和模型结果、已保存的标记都不重复）。
+    所有标记以未回答状态保存。
+    """
+
+    def __init__(self, qa_gen, kb, laser_color: str = "both", jobs: Optional[int] = None,
+                 output_dir: str = "output", cache_dir: Optional[str] = "output/cache",
+                 workers: int = 1):
+        self.qa_gen = qa_gen
+        self.kb = kb
+        self.laser_color = laser_color
+        self.jobs = max(1, jobs or os.cpu_count() or 1)
+        # 视频之间已经按 jobs 并行，单个视频默认不再开多进程
+        self.workers = workers
+        self.output_dir = output_dir
+        self.cache_dir = cache_dir
+        self.state = BatchState(os.path.join(output_dir, STATE_FILE))
+        self._checkpoint_dir = os.path.join(output_dir, "checkpoints")
+
+    def run(self, videos: List[str]) -> Counter:
+        """处理 videos 中未完成的视频，返回本次各状态的视频数"""
+        summary = Counter()
+        todo = []
+        for video in videos:
+            if self.state.status(video) == DONE:
+                summary['skipped'] += 1
+            elif not os.path.exists(video):
+                print(f"文件不存在: {video}")
+                self.state.mark(video, FAILED, error="文件不存在")
+                summary[FAILED] += 1
+            else:
+                self.state.mark(video, PENDING)
+                todo.append(video)
+
+        print(f"共 {len(videos)} 个视频，待处理 {len(todo)} 个，"
+              f"跳过已完成 {summary['skipped']} 个，{self.jobs} 个进程")
+        if not todo:
+            return summary
+
+        start = time.time()
+        queue = list(reversed(todo))
+        detecting = {}  # 检测 Future → 视频
+        analyzing = {}  # 视频 → (断点, 截图信息列表, 视觉模型 Future 列表)
+        # 主进程有请求线程，用 spawn 启动子进程，避免 fork 复制线程状态
+        with ProcessPoolExecutor(max_workers=self.jobs,
+                                 mp_context=multiprocessing.get_context("spawn")) as pool:
+            while queue or detecting or analyzing:
+                # 进程池里同时只放 jobs 个视频，提交即开始处理，状态才准确
+                while queue and len(detecting) < self.jobs:
+                    video = queue.pop()
+                    self.state.mark(video, RUNNING, started_at=datetime.now().isoformat())
+                    # 视频哈希要读完整个文件，放到子进程里算，不阻塞调度
+                    detecting[pool.submit(_detect_video, video, self.laser_color,
+                                          video_output_dir(self.output_dir, video),
+                                          self.cache_dir, self._checkpoint_dir,
+                                          self.workers)] = video
+
+                pending = set(detecting)
+                for _, _, futures in analyzing.values():
+                    pending.update(f for f in futures if not f.done())
+                if pending:
+                    wait(pending, return_when=FIRST_COMPLETED)
+
+                for future in [f for f in detecting if f.done()]:
+                    video = detecting.pop(future)
+                    try:
+                        digest, segments, contents = future.result()
+                    except Exception as e:
+                        print(f"处理失败 {video}: {e}")
+                        self.state.mark(video, FAILED, error=str(e))
+                        summary[FAILED] += 1
+                        continue
+                    # 子进程已写入片段列表，这里用传回的哈希读取断点
+                    checkpoint = VideoCheckpoint(video, {'laser_color': self.laser_color},
+                                                 self._checkpoint_dir, self.cache_dir, digest)
+                    contents = sorted(contents.items())
+                    analyzing[video] = (checkpoint, contents, self.qa_gen.submit_images([
+                        (c['roi_path'], c['timestamp'], c['laser_duration'], c.get('roi_image'))
+                        for _, c in contents]))
+
+                for video in [v for v, (_, _, fs) in analyzing.items()
+                              if all(f.done() for f in fs)]:
+                    # 写入失败（磁盘满、知识库出错等）只影响这个视频，已保存的标记记在断点里，
+                    # 重新运行时从断点继续
+                    try:
+                        self._save(video, *analyzing.pop(video))
+                    except Exception as e:
+                        print(f"保存失败 {video}: {e}")
+                        self.state.mark(video, FAILED, error=str(e))
+                        summary[FAILED] += 1
+                        continue
+                    summary[DONE] += 1
+
+        print(f"批量处理完成: 完成 {summary[DONE]} 个，失败 {summary[FAILED]} 个，"
+              f"跳过 {summary['skipped']} 个，耗时 {time.time() - start:.1f}s")
+        return summary
+
+    def _save(self, video: str, checkpoint: VideoCheckpoint, contents: List[Tuple[int, Dict]],
+              futures):
+        name = os.path.basename(video)
+        for (index, content), future in zip(contents, futures):
+            content.pop('roi_image', None)
+            try:
+                qa = future.result()
+            except Exception as e:
+                qa = _failed_qa(content, e)
+            checkpoint.record(index, content, qa)
+
+        # 本次和之前中断时已分析的片段一起按顺序写入知识库
+        analyzed = checkpoint.analyzed()
+        for index in sorted(analyzed):
+            checkpoint.save_entry(self.kb, index, name, analyzed[index]['content'],
+                                  analyzed[index]['qa'])
+        self.state.mark(video, DONE, entries=len(checkpoint.saved()),
+                        finished_at=datetime.now().isoformat())
+        print(f"✅ {name}: {len(analyzed)} 个标记已保存")
@@ -0,0 +1,150 @@
+import os
+import json
+import hashlib
+import threading
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from detection_cache import video_hash
+from laser_detector import LaserSegment
+
+# 断点文件格式版本，改动存储格式时递增
+CHECKPOINT_VERSION = 1
+CHECKPOINT_DIR = "output/checkpoints"
+
+
+def segment_to_dict(seg: LaserSegment) -> Dict:
+    return {
+        'start_time': float(seg.start_time),
+        'end_time': float(seg.end_time),
+        'laser_duration': float(seg.laser_duration),
+        'center_frame': int(seg.center_frame),
+        'positions': [[int(x), int(y)] for x, y in seg.positions],
+        'trajectory_box': [int(v) for v in seg.trajectory_box],
+        'tracks': {str(k): [[int(x), int(y)] for x, y in pts] for k, pts in seg.tracks.items()},
+    }
+
+
+def segment_from_dict(data: Dict) -> LaserSegment:
+    return LaserSegment(
+        start_time=data['start_time'],
+        end_time=data['end_time'],
+        laser_duration=data['laser_duration'],
+        center_frame=data['center_frame'],
+        positions=[tuple(p) for p in data['positions']],
+        trajectory_box=tuple(data['trajectory_box']),
+        tracks={int(k): [tuple(p) for p in pts] for k, pts in data['tracks'].items()},
+    )
+
+
+class VideoCheckpoint:
+    """单个视频的处理进度，按视频内容哈希（加文件名）保存在 checkpoint_dir 下
+
+    记录检测出的片段列表，以及每个片段（按 1 开始的序号）的截图信息、视觉模型结果
+    和写入知识库后的条目 ID。中断后重新处理同一个视频时：片段列表已保存就不再检测，
+    已写入知识库的片段跳过，已有截图和模型结果的片段直接复用，不再调用接口。
+    settings（激光颜色等）与保存时不同时丢弃旧进度。每次记录都原子地重写文件。线程安全。
+    """
+
+    def __init__(self, video_path: str, settings: Dict,
+                 checkpoint_dir: str = CHECKPOINT_DIR, hash_memo_dir: Optional[str] = "output/cache",
+                 digest: Optional[str] = None):
+        # digest：已经算好的视频哈希（如检测子进程传回的），不必再读一遍文件
+        self.video_hash = digest or video_hash(video_path, hash_memo_dir)
+        # 知识库按文件名区分视频，内容相同的两个文件各自记录进度
+        name = hashlib.sha1(os.path.basename(video_path).encode('utf-8')).hexdigest()[:8]
+        self.path = os.path.join(checkpoint_dir, f"{self.video_hash}_{name}.json")
+        self.settings = dict(settings, version=CHECKPOINT_VERSION)
+        self.lock = threading.Lock()
+
+        self.data = {'video': os.path.abspath(video_path), 'settings': self.settings,
+                     'segments': None, 'items': {}}
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+            except (OSError, ValueError):
+                data = None
+            if data and data.get('settings') == self.settings:
+                self.data = data
+        # 上次运行已分析、但没有记录条目 ID 的片段
+        self.resumed = set(self.analyzed())
+
+    @property
+    def segments(self) -> Optional[List[LaserSegment]]:
+        """已保存的片段列表，检测未完成时为 None"""
+        if self.data['segments'] is None:
+            return None
+        return [segment_from_dict(s) for s in self.data['segments']]
+
+    def saved(self) -> Dict[int, int]:
+        """已写入知识库的片段：序号 → 条目 ID"""
+        return {int(i): item['entry_id'] for i, item in self.data['items'].items()
+                if item.get('entry_id') is not None}
+
+    def analyzed(self) -> Dict[int, Dict]:
+        """已有截图和模型结果、但还没写入知识库的片段：序号 → {'content', 'qa'}"""
+        return {int(i): item for i, item in self.data['items'].items()
+                if item.get('entry_id') is None and item.get('qa') is not None}
+
+    def is_started(self) -> bool:
+        return self.data['segments'] is not None or bool(self.data['items'])
+
+    def is_complete(self) -> bool:
+        return (self.data['segments'] is not None
+                and len(self.saved()) >= len(self.data['segments']))
+
+    def set_segments(self, segments: List[LaserSegment]):
+        with self.lock:
+            self.data['segments'] = [segment_to_dict(s) for s in segments]
+            self._save()
+
+    def record(self, index: int, content: Dict, qa: Dict):
+        """记录片段的截图信息和视觉模型结果"""
+        content = {k: v for k, v in content.items() if k != 'roi_image'}
+        with self.lock:
+            self.data['items'][str(index)] = {'content': content, 'qa': dict(qa), 'entry_id': None}
+            self._save()
+
+    def mark_saved(self, index: int, entry_id: int):
+        with self.lock:
+            item = self.data['items'].setdefault(str(index), {})
+            item['entry_id'] = entry_id
+            item['saved_at'] = datetime.now().isoformat()
+            self._save()
+
+    def save_entry(self, kb, index: int, video_file: str, content: Dict, qa: Dict) -> int:
+        """写入知识库并记录条目 ID，返回条目 ID
+
+        上次运行可能在写入知识库之后、记录条目 ID 之前中断，
+        所以从断点恢复的片段先在知识库里查找同一条记录，找到就不再重复写入。
+        """
+        entry = None
+        if index in self.resumed:
+            entry = kb.find(video_file, content.get('roi_path', ''), content['timestamp'])
+        entry_id = entry['id'] if entry else kb.add(video_file, content, qa)
+        self.mark_saved(index, entry_id)
+        return entry_id
+
+    def clear(self):
+        """丢弃进度，从头处理"""
+        with self.lock:
+            self.data['segments'] = None
+            self.data['items'] = {}
+            self.resumed = set()
+            if os.path.exists(self.path):
+                os.remove(self.path)
+
+    def _save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.data, f, ensure_ascii=False, default=_json_default)
+        os.replace(tmp_path, self.path)
+
+
+def _json_default(value):
+    # 截图信息里可能有 numpy 标量
+    if hasattr(value, 'item'):
+        return value.item()
+    raise TypeError(f"无法序列化: {type(value).__name__}")
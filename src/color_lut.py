@@ -0,0 +1,137 @@
+import os
+import json
+import hashlib
+import cv2
+import numpy as np
+from typing import Dict, List, Tuple
+
+# 查找表中的像素类别
+CLASS_NONE = 0
+CLASS_RED = 1
+CLASS_GREEN = 2
+
+# 查找表格式版本，改动构建方式时递增，使旧的磁盘缓存失效
+LUT_VERSION = 1
+
+
+class ColorLUT:
+    """BGR → 激光颜色类别的预计算查找表
+
+    对每个（量化后的）BGR 颜色预先跑一遍 OpenCV 的 BGR→HSV 转换和 inRange 判断，
+    之后每帧只需一次向量化查表。bits=8 时不做量化，分类结果与 HSV 路径逐像素一致；
+    bits<8 时每个量化格取格子中心的颜色，只有跨越阈值边界的格子会出错，
+    出错的 24 位颜色占比记录在 mismatch 中。
+
+    构建好的表按阈值集合缓存到磁盘，下次构造时直接加载。
+    """
+
+    def __init__(self, bands: Dict[int, List[Tuple[tuple, tuple]]], bits: int = 8,
+                 cache_dir: str = "output/cache"):
+        if not 1 <= bits <= 8:
+            raise ValueError(f"bits 必须在 1~8 之间: {bits}")
+
+        self.bands = bands
+        self.bits = bits
+        self.cache_dir = cache_dir
+        self.mismatch = 0.0
+
+        self.table = self._load_or_build()
+        self._mask_tables = {}
+
+    def _cache_key(self) -> str:
+        key = json.dumps({
+            'version': LUT_VERSION,
+            'bits': self.bits,
+            'bands': sorted((cls, [list(map(list, b)) for b in bands])
+                            for cls, bands in self.bands.items()),
+            'opencv': cv2.__version__,
+        })
+        return hashlib.sha1(key.encode('utf-8')).hexdigest()[:16]
+
+    def _load_or_build(self) -> np.ndarray:
+        path = None
+        if self.cache_dir:
+            path = os.path.join(self.cache_dir, f"laser_lut_{self._cache_key()}.npz")
+            if os.path.exists(path):
+                with np.load(path) as data:
+                    self.mismatch = float(data['mismatch'])
+                    return data['table']
+
+        table = self._classify(self._representatives(self.bits))
+        if self.bits < 8:
+            exact = self._classify(self._representatives(8))
+            expanded = table[self._expand_index(self.bits)]
+            self.mismatch = float(np.count_nonzero(expanded != exact)) / exact.size
+
+        if path:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            tmp_path = path + ".tmp.npz"
+            np.savez(tmp_path, table=table, mismatch=self.mismatch)
+            os.replace(tmp_path, path)
+
+        return table
+
+    @staticmethod
+    def _representatives(bits: int) -> np.ndarray:
+        """每个量化格的代表色（格子中心），按查找表下标排列，形状 (n³, 3)，BGR 顺序"""
+        n = 1 << bits
+        shift = 8 - bits
+        values = np.arange(n) << shift
+        if shift:
+            values |= 1 << (shift - 1)
+        values = values.astype(np.uint8)
+
+        # 下标 = R << 2bits | G << bits | B
+        colors = np.empty((n, n, n, 3), np.uint8)
+        colors[..., 0] = values[None, None, :]
+        colors[..., 1] = values[None, :, None]
+        colors[..., 2] = values[:, None, None]
+        return colors.reshape(-1, 3)
+
+    @staticmethod
+    def _expand_index(bits: int) -> np.ndarray:
+        """每个 24 位颜色所在量化格的下标"""
+        q = np.arange(256, dtype=np.uint32) >> (8 - bits)
+        index = (q[:, None, None] << (2 * bits)) | (q[None, :, None] << bits) | q[None, None, :]
+        return index.ravel()
+
+    def _classify(self, colors: np.ndarray) -> np.ndarray:
+        """用 HSV 阈值给一组 BGR 颜色分类"""
+        n = 1 << 8
+        img = colors.reshape(-1, n if len(colors) >= n else len(colors), 3)
+        hsv = cv2.cvtColor(img, cv2.COLOR_BGR2HSV)
+
+        classes = np.zeros(hsv.shape[:2], np.uint8)
+        for cls, ranges in self.bands.items():
+            for lower, upper in ranges:
+                classes[cv2.inRange(hsv, lower, upper) > 0] = cls
+        return classes.ravel()
+
+    def mask_table(self, classes) -> np.ndarray:
+        """类别集合对应的 0/255 掩码查找表"""
+        key = tuple(sorted(classes))
+        if key not in self._mask_tables:
+            self._mask_tables[key] = np.where(
+                np.isin(self.table, key), 255, 0).astype(np.uint8)
+        return self._mask_tables[key]
+
+    def lookup_index(self, frame: np.ndarray) -> np.ndarray:
+        """计算每个像素在查找表中的下标"""
+        # BGRA 按小端 uint32 解释正好是 B | G<<8 | R<<16 | A<<24
+        packed = cv2.cvtColor(frame, cv2.COLOR_BGR2BGRA).view(np.uint32)[..., 0]
+        if self.bits == 8:
+            return packed & 0xFFFFFF
+
+        bits, shift = self.bits, 8 - self.bits
+        m = (1 << bits) - 1
+        return (((packed >> (16 + shift)) & m) << (2 * bits) |
+                ((packed >> (8 + shift)) & m) << bits |
+                ((packed >> shift) & m))
+
+    def classify(self, frame: np.ndarray) -> np.ndarray:
+        """返回每个像素的类别（CLASS_NONE / CLASS_RED / CLASS_GREEN）"""
+        return np.take(self.table, self.lookup_index(frame))
+
+    def mask(self, frame: np.ndarray, classes) -> np.ndarray:
+        """返回属于给定类别的像素掩码（0/255），与 inRange 输出格式一致"""
+        return np.take(self.mask_table(classes), self.lookup_index(frame))
@@ -1,23 +1,60 @@
 import cv2
 import os
-from typing import Dict
+import numpy as np
+from typing import Dict, List, Optional
+from frame_source import open_frame_source
 
 class ContentAnalyzer:
-    def __init__(self):
-        pass
+    def __init__(self, prefetch: int = 0):
+        # 预读队列深度，大于 0 时解码在后台线程中进行
+        self.prefetch = prefetch
     
     def analyze(self, video_path: str, segment, output_dir: str) -> Dict:
         """提取激光标记区域的截图"""
-        cap = cv2.VideoCapture(video_path)
+        # 检测时已保留中间帧的话直接使用
+        if getattr(segment, 'keyframe', None) is not None:
+            return self.analyze_frame(segment.keyframe, segment, output_dir)
         
         # 取激光中间帧
-        cap.set(cv2.CAP_PROP_POS_FRAMES, segment.center_frame)
-        ret, frame = cap.read()
-        cap.release()
+        source = open_frame_source(video_path, self.prefetch,
+                                   frames=[segment.center_frame])
+        frame = None
+        for _, frame in source:
+            break
+        source.release()
         
-        if not ret:
+        if frame is None:
             raise ValueError("无法读取帧")
         
+        return self.analyze_frame(frame, segment, output_dir)
+    
+    def analyze_batch(self, video_path: str, segments, output_dir: str) -> List[Optional[Dict]]:
+        """一次顺序解码提取所有片段的截图
+
+        所有中间帧按帧号排序后在同一个帧源里读取，不必每个片段都重新打开视频并 seek；
+        片段间隔较近时只 grab 过去。检测时已保留中间帧（segment.keyframe）的片段不再解码。
+        结果与 segments 顺序一致，读不到帧的片段对应 None。
+        """
+        frames = {seg.center_frame: seg.keyframe for seg in segments
+                  if getattr(seg, 'keyframe', None) is not None}
+        missing = [seg.center_frame for seg in segments if seg.center_frame not in frames]
+        
+        if missing:
+            source = open_frame_source(video_path, self.prefetch, frames=missing)
+            for frame_idx, frame in source:
+                # 预读模式下缓冲区会被复用，需要拷贝
+                frames[frame_idx] = frame.copy() if self.prefetch else frame
+            source.release()
+        
+        results = []
+        for seg in segments:
+            frame = frames.get(seg.center_frame)
+            results.append(self.analyze_frame(frame, seg, output_dir)
+                           if frame is not None else None)
+        return results
+    
+    def analyze_frame(self, frame: np.ndarray, segment, output_dir: str) -> Dict:
+        """从已解码的中间帧提取截图，帧可以来自任意帧源"""
         # 保存截图
         os.makedirs(f"{output_dir}/keyframes", exist_ok=True)
         
@@ -25,10 +62,11 @@ class ContentAnalyzer:
         raw_path = f"{output_dir}/keyframes/frame_{segment.center_frame}_raw.jpg"
         cv2.imwrite(raw_path, frame)
         
-        # 激光区域放大图
-        roi = self._extract_roi(frame, segment.trajectory_box)
+        # 激光区域截图：按原分辨率保存供查看（知识库中的 screenshot）；交给视觉模型时
+        # 由 ImageEncoder 在内存中按预算缩放
+        roi_image = self._crop_roi(frame, segment.trajectory_box)
         roi_path = f"{output_dir}/keyframes/frame_{segment.center_frame}_roi.jpg"
-        cv2.imwrite(roi_path, roi)
+        cv2.imwrite(roi_path, roi_image)
         
         return {
             'raw_path': raw_path,
@@ -37,10 +75,12 @@ class ContentAnalyzer:
             'laser_duration': segment.laser_duration,
             'start_time': segment.start_time,
             'end_time': segment.end_time,
+            # 原分辨率的截图区域，交给视觉模型时在内存中按预算编码，不必再读 roi_path
+            'roi_image': roi_image.copy(),
         }
     
-    def _extract_roi(self, frame, trajectory_box):
-        """提取激光区域并放大"""
+    def _crop_roi(self, frame, trajectory_box):
+        """裁出激光区域（带 50% 边距）"""
         h, w = frame.shape[:2]
         x1, y1, x2, y2 = trajectory_box
         
@@ -53,10 +93,4 @@ class ContentAnalyzer:
         x2 = min(w, int(x2) + margin_x)
         y2 = min(h, int(y2) + margin_y)
         
-        roi = frame[y1:y2, x1:x2]
-        
-        # 放大2倍
-        if roi.size > 0:
-            roi = cv2.resize(roi, None, fx=2, fy=2, interpolation=cv2.INTER_CUBIC)
-        
-        return roi
\ No newline at end of file
+        return frame[y1:y2, x1:x2]
\ No newline at end of file
@@ -0,0 +1,120 @@
+import os
+import json
+import hashlib
+import numpy as np
+from typing import Dict, List, Optional, Tuple
+
+# 缓存格式版本，改动存储格式或检测语义时递增
+CACHE_VERSION = 1
+# 视频哈希备忘录：路径+大小+修改时间 → 内容哈希，避免每次重新读完整个文件
+HASH_MEMO = "video_hashes.json"
+
+
+def video_hash(video_path: str, memo_dir: Optional[str] = None) -> str:
+    """视频内容的 SHA-1
+
+    memo_dir 不为空时，按 (绝对路径, 大小, 修改时间) 把结果记在备忘录里，
+    文件没变就直接返回记录的哈希。
+    """
+    stat = os.stat(video_path)
+    memo_key = f"{os.path.abspath(video_path)}|{stat.st_size}|{stat.st_mtime_ns}"
+
+    memo = {}
+    memo_path = os.path.join(memo_dir, HASH_MEMO) if memo_dir else None
+    if memo_path and os.path.exists(memo_path):
+        try:
+            with open(memo_path, 'r', encoding='utf-8') as f:
+                memo = json.load(f)
+        except (OSError, ValueError):
+            memo = {}
+        if memo_key in memo:
+            return memo[memo_key]
+
+    sha1 = hashlib.sha1()
+    with open(video_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            sha1.update(chunk)
+    digest = sha1.hexdigest()
+
+    if memo_path:
+        memo[memo_key] = digest
+        os.makedirs(memo_dir, exist_ok=True)
+        # 批量处理时多个进程可能同时写备忘录，临时文件按进程区分
+        tmp_path = f"{memo_path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(memo, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, memo_path)
+
+    return digest
+
+
+class DetectionCache:
+    """逐帧检测结果（laser_frames）的磁盘缓存
+
+    聚类参数（min_laser_frames / merge_gap / pre_context / post_context）只作用于
+    laser_frames，所以把它按 视频内容哈希 + 检测阈值 + 采样设置 缓存成 .npz：
+    帧号、时间、每帧点数和展平的点坐标数组。调聚类参数时不必重新解码视频。
+    """
+
+    def __init__(self, cache_dir: str = "output/cache"):
+        self.cache_dir = cache_dir
+
+    def key(self, video_path: str, settings: Dict) -> str:
+        digest = video_hash(video_path, self.cache_dir)
+        payload = json.dumps({'version': CACHE_VERSION, 'video': digest,
+                              'settings': settings}, sort_keys=True)
+        return hashlib.sha1(payload.encode('utf-8')).hexdigest()[:20]
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"detections_{key}.npz")
+
+    def load(self, key: str) -> Optional[Tuple[List[Dict], float, int]]:
+        """读取缓存，返回 (laser_frames, fps, total_frames)；没有缓存时返回 None"""
+        path = self._path(key)
+        if not os.path.exists(path):
+            return None
+
+        with np.load(path) as data:
+            frames = data['frames'].tolist()
+            times = data['times'].tolist()
+            counts = data['counts'].tolist()
+            points = data['points'].tolist()
+            tracks = data['tracks'].tolist() if data['has_tracks'] else None
+            fps = float(data['fps'])
+            total_frames = int(data['total_frames'])
+
+        laser_frames = []
+        offset = 0
+        for frame_idx, t, n in zip(frames, times, counts):
+            entry = {
+                'frame': frame_idx,
+                'time': t,
+                'points': [tuple(p) for p in points[offset:offset + n]],
+            }
+            if tracks is not None:
+                entry['tracks'] = tracks[offset:offset + n]
+            laser_frames.append(entry)
+            offset += n
+
+        return laser_frames, fps, total_frames
+
+    def save(self, key: str, laser_frames: List[Dict], fps: float, total_frames: int):
+        points = [p for f in laser_frames for p in f['points']]
+        has_tracks = any('tracks' in f for f in laser_frames)
+        tracks = [t for f in laser_frames for t in f.get('tracks', [])]
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = self._path(key)
+        tmp_path = path + ".tmp.npz"
+        np.savez_compressed(
+            tmp_path,
+            frames=np.array([f['frame'] for f in laser_frames], np.int64),
+            times=np.array([f['time'] for f in laser_frames], np.float64),
+            counts=np.array([len(f['points']) for f in laser_frames], np.int32),
+            points=np.array(points, np.int32).reshape(-1, 2),
+            tracks=np.array(tracks, np.int64),
+            has_tracks=has_tracks,
+            fps=fps,
+            total_frames=total_frames,
+        )
+        os.replace(tmp_path, path)
@@ -0,0 +1,210 @@
+import os
+import json
+from array import array
+from bisect import bisect_left, insort
+from datetime import datetime
+from typing import Dict, List, Optional
+
+# 索引文件格式版本
+FACET_VERSION = 1
+CONFIRMED = '已确认'
+
+
+def _created_ts(entry: Dict) -> float:
+    try:
+        return datetime.fromisoformat(entry['created_at']).timestamp()
+    except (KeyError, TypeError, ValueError):
+        return 0.0
+
+
+def _contains(posting: array, entry_id: int) -> bool:
+    i = bisect_left(posting, entry_id)
+    return i < len(posting) and posting[i] == entry_id
+
+
+class FacetIndex:
+    """标签、视频和回答状态的分面索引
+
+    ids 按加入顺序记录条目 ID（位置即 offset），offsets 是 ID → offset；
+    标签和视频各有 值 → 升序条目 ID 数组 的倒排表，回答状态是按 offset 的位图
+    （已确认为 1），创建时间按 offset 存成时间戳数组。
+    单个标签 / 视频 / 状态的计数就是倒排表长度或计数器，O(1)；组合筛选从最短的倒排表
+    出发，其余条件用二分查找和位测试逐条过滤。
+    """
+
+    def __init__(self):
+        self.ids = array('i')
+        self.offsets: Dict[int, int] = {}
+        self.created = array('d')
+        self.confirmed = bytearray()
+        self.confirmed_count = 0
+        self.tags: Dict[str, array] = {}
+        self.videos: Dict[str, array] = {}
+        self.generation = 0
+
+    def add(self, entry: Dict):
+        """加入（或更新）一条记录"""
+        entry_id = entry['id']
+        offset = self.offsets.get(entry_id)
+        if offset is None:
+            offset = len(self.ids)
+            self.ids.append(entry_id)
+            self.offsets[entry_id] = offset
+            self.created.append(_created_ts(entry))
+            if offset % 8 == 0:
+                self.confirmed.append(0)
+        else:
+            self._remove_postings(entry_id)
+            self.created[offset] = _created_ts(entry)
+            self._set_confirmed(offset, False)
+
+        for tag in dict.fromkeys(entry.get('tags') or []):
+            insort(self.tags.setdefault(tag, array('i')), entry_id)
+        insort(self.videos.setdefault(entry.get('video_file', ''), array('i')), entry_id)
+        self._set_confirmed(offset, entry.get('confidence') == CONFIRMED)
+
+    def _remove_postings(self, entry_id: int):
+        # 不记录每条记录原来的标签，逐个倒排表二分查找，只在更新时发生
+        for postings in (self.tags, self.videos):
+            for key in list(postings):
+                posting = postings[key]
+                i = bisect_left(posting, entry_id)
+                if i < len(posting) and posting[i] == entry_id:
+                    del posting[i]
+                    if not posting:
+                        del postings[key]
+
+    def _set_confirmed(self, offset: int, value: bool):
+        mask = 1 << (offset % 8)
+        old = bool(self.confirmed[offset // 8] & mask)
+        if value and not old:
+            self.confirmed[offset // 8] |= mask
+            self.confirmed_count += 1
+        elif old and not value:
+            self.confirmed[offset // 8] &= ~mask
+            self.confirmed_count -= 1
+
+    def is_confirmed(self, entry_id: int) -> bool:
+        offset = self.offsets[entry_id]
+        return bool(self.confirmed[offset // 8] & (1 << (offset % 8)))
+
+    def tag_counts(self) -> Dict[str, int]:
+        """每个标签的记录数，按数量从多到少排列"""
+        return dict(sorted(((tag, len(p)) for tag, p in self.tags.items()),
+                           key=lambda x: (-x[1], x[0])))
+
+    def count(self, tag: Optional[str] = None, video: Optional[str] = None,
+              unanswered: bool = False, since: Optional[datetime] = None,
+              until: Optional[datetime] = None) -> int:
+        """符合条件的记录数；不加条件或只按标签、视频、未回答之一计数时 O(1)"""
+        conditions = [tag is not None, video is not None, unanswered,
+                      since is not None or until is not None]
+        if sum(conditions) > 1 or conditions[3]:
+            return len(self.filter(tag, video, unanswered, since, until))
+        if tag is not None:
+            return len(self.tags.get(tag, ()))
+        if video is not None:
+            return len(self.videos.get(video, ()))
+        if unanswered:
+            return len(self.ids) - self.confirmed_count
+        return len(self.ids)
+
+    def filter(self, tag: Optional[str] = None, video: Optional[str] = None,
+               unanswered: bool = False, since: Optional[datetime] = None,
+               until: Optional[datetime] = None) -> List[int]:
+        """按 标签 AND 视频 AND 未回答 AND 创建时间 [since, until) 筛选，返回升序条目 ID"""
+        postings = []
+        if tag is not None:
+            postings.append(self.tags.get(tag, array('i')))
+        if video is not None:
+            postings.append(self.videos.get(video, array('i')))
+        postings.sort(key=len)
+
+        if postings:
+            candidates = [i for i in postings[0]
+                          if all(_contains(p, i) for p in postings[1:])]
+        elif unanswered:
+            candidates = self._unanswered_ids()
+            unanswered = False
+        else:
+            candidates = sorted(self.ids)
+
+        start = since.timestamp() if since is not None else None
+        end = until.timestamp() if until is not None else None
+        if not (unanswered or start is not None or end is not None):
+            return candidates
+        results = []
+        for entry_id in candidates:
+            offset = self.offsets[entry_id]
+            if unanswered and self.confirmed[offset // 8] & (1 << (offset % 8)):
+                continue
+            created = self.created[offset]
+            if (start is not None and created < start) or (end is not None and created >= end):
+                continue
+            results.append(entry_id)
+        return results
+
+    def _unanswered_ids(self) -> List[int]:
+        # 按字节找出未确认的位，全部已确认的字节直接跳过
+        ids = []
+        for byte_index, byte in enumerate(self.confirmed):
+            if byte == 0xFF:
+                continue
+            for bit in range(8):
+                offset = byte_index * 8 + bit
+                if offset < len(self.ids) and not byte & (1 << bit):
+                    ids.append(self.ids[offset])
+        return sorted(ids)
+
+    def freeze(self):
+        """当前状态的拷贝，供 save() 在后台线程中写入（倒排表会原地修改，需要复制）"""
+        return (self.ids[:], self.created[:], bytes(self.confirmed),
+                {t: p[:] for t, p in self.tags.items()},
+                {v: p[:] for v, p in self.videos.items()})
+
+    def save(self, path: str, frozen=None, generation: Optional[int] = None):
+        """写入索引文件（写临时文件后原子替换）
+
+        文件格式：首行 JSON 元数据（含标签和视频名及各自的记录数），之后依次是
+        offset → 条目 ID、创建时间、状态位图、全部标签倒排、全部视频倒排。
+        """
+        ids, created, confirmed, tags, videos = frozen or self.freeze()
+        header = {'version': FACET_VERSION, 'entries': len(ids), 'bitmap_bytes': len(confirmed),
+                  'tags': [[t, len(p)] for t, p in tags.items()],
+                  'videos': [[v, len(p)] for v, p in videos.items()],
+                  'generation': self.generation if generation is None else generation}
+        tmp_path = path + ".tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(json.dumps(header, ensure_ascii=False).encode('utf-8') + b"\n")
+            ids.tofile(f)
+            created.tofile(f)
+            f.write(confirmed)
+            for posting in list(tags.values()) + list(videos.values()):
+                posting.tofile(f)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> Optional["FacetIndex"]:
+        """读取索引文件，不存在或版本不符时返回 None"""
+        if not os.path.exists(path):
+            return None
+        index = cls()
+        with open(path, 'rb') as f:
+            try:
+                header = json.loads(f.readline())
+            except ValueError:
+                return None
+            if header.get('version') != FACET_VERSION:
+                return None
+            index.ids.fromfile(f, header['entries'])
+            index.created.fromfile(f, header['entries'])
+            index.confirmed = bytearray(f.read(header['bitmap_bytes']))
+            for key, postings in (('tags', index.tags), ('videos', index.videos)):
+                for name, n in header[key]:
+                    posting = postings[name] = array('i')
+                    posting.fromfile(f, n)
+
+        index.offsets = {entry_id: offset for offset, entry_id in enumerate(index.ids)}
+        index.confirmed_count = sum(bin(byte).count('1') for byte in index.confirmed)
+        index.generation = header['generation']
+        return index
@@ -0,0 +1,105 @@
+import cv2
+import numpy as np
+from typing import List, Tuple
+
+# 帧签名的缩小倍数：4 倍时一个 5 像素的光斑至少让签名变化 15 个灰度级
+SIGNATURE_SCALE = 4
+# 签名单元任一通道变化超过这个值视为画面有变化（需高于视频压缩噪声）
+CHANGE_THRESHOLD = 8
+# 分块大小（全分辨率像素）
+TILE_SIZE = 120
+# 局部检测时图块向外扩展的像素数，需大于激光光斑直径，保证边界上的光斑能被完整检测
+DETECT_PAD = 40
+
+
+class StaticFrameCache:
+    """基于帧差的检测结果复用
+
+    为上一次分析过的画面保存一个缩小的彩色签名。新帧签名与之相比没有变化时直接
+    复用上次的检测结果；只有部分分块变化时，只在变化的分块（及相邻一圈分块）
+    内重新检测，其余区域沿用上次的激光点。签名只在重新检测过的区域更新，缓慢的
+    渐变会逐步累积，最终仍会触发重新检测。
+
+    每个扫描区间使用一个独立的实例。
+    """
+
+    def __init__(self, detector, tile_size: int = TILE_SIZE,
+                 threshold: int = CHANGE_THRESHOLD):
+        self.detector = detector
+        self.tile_size = tile_size
+        self.threshold = threshold
+
+        self.signature = None
+        self.points: List[Tuple[int, int]] = []
+
+        # 统计：分析的帧数、整帧复用次数、实际检测的分块数、总分块数
+        self.frames = 0
+        self.hits = 0
+        self.tiles_scanned = 0
+        self.tiles_total = 0
+
+    def detect(self, frame: np.ndarray) -> List[Tuple[int, int]]:
+        """检测激光点，画面未变化的区域复用上次的结果"""
+        h, w = frame.shape[:2]
+        sig = cv2.resize(frame, (max(1, w // SIGNATURE_SCALE), max(1, h // SIGNATURE_SCALE)),
+                         interpolation=cv2.INTER_AREA)
+        cells = self.tile_size // SIGNATURE_SCALE
+        th, tw = -(-sig.shape[0] // cells), -(-sig.shape[1] // cells)
+
+        self.frames += 1
+        self.tiles_total += th * tw
+
+        if self.signature is None or self.signature.shape != sig.shape:
+            self.signature = sig
+            self.points = self.detector.detect_frame(frame)
+            self.tiles_scanned += th * tw
+            return list(self.points)
+
+        changed = cv2.absdiff(sig, self.signature).max(axis=2) > self.threshold
+        padded = np.zeros((th * cells, tw * cells), bool)
+        padded[:sig.shape[0], :sig.shape[1]] = changed
+        tiles = padded.reshape(th, cells, tw, cells).any(axis=(1, 3))
+
+        if not tiles.any():
+            self.hits += 1
+            return list(self.points)
+
+        prefilter = self.detector.prefilter
+        if prefilter is not None and not prefilter(frame):
+            # 预筛选已证明整帧都没有激光，整帧签名都可以更新
+            self.signature = sig
+            self.points = []
+            return []
+
+        # 光斑可能跨越分块边界或移动到相邻分块，向外扩展一圈
+        tiles = cv2.dilate(tiles.astype(np.uint8), np.ones((3, 3), np.uint8))
+        n, _, stats, _ = cv2.connectedComponentsWithStats(tiles)
+
+        rects = []
+        new_points = []
+        for tx, ty, tbw, tbh, _ in stats[1:].tolist():
+            self.tiles_scanned += tbw * tbh
+            x1, y1 = tx * self.tile_size, ty * self.tile_size
+            x2, y2 = min(w, (tx + tbw) * self.tile_size), min(h, (ty + tbh) * self.tile_size)
+            rects.append((x1, y1, x2, y2))
+
+            px1, py1 = max(0, x1 - DETECT_PAD), max(0, y1 - DETECT_PAD)
+            px2, py2 = min(w, x2 + DETECT_PAD), min(h, y2 + DETECT_PAD)
+            found = self.detector._detect_points(
+                frame[py1:py2, px1:px2], (px1, py1),
+                (px1 > 0, py1 > 0, px2 < w, py2 < h))
+            # 不同连通块的外接矩形可能重叠，去掉重复的点
+            new_points.extend(p for p in found
+                              if x1 <= p[0] < x2 and y1 <= p[1] < y2
+                              and p not in new_points)
+
+            # 只更新重新检测过的区域的签名
+            sx1, sy1 = tx * cells, ty * cells
+            sx2, sy2 = (tx + tbw) * cells, (ty + tbh) * cells
+            self.signature[sy1:sy2, sx1:sx2] = sig[sy1:sy2, sx1:sx2]
+
+        kept = [p for p in self.points
+                if not any(x1 <= p[0] < x2 and y1 <= p[1] < y2
+                           for x1, y1, x2, y2 in rects)]
+        self.points = kept + new_points
+        return list(self.points)
@@ -0,0 +1,214 @@
+import cv2
+import queue
+import threading
+from typing import Callable, Iterator, List, Optional, Tuple
+import numpy as np
+
+# 两个采样帧之间超过这么多帧时直接 seek，而不是逐帧 grab
+SEEK_THRESHOLD = 300
+# 预读队列默认深度（帧）
+PREFETCH_DEPTH = 4
+
+
+class FrameSampler:
+    """按帧号或按时间采样视频帧
+
+    跳过的帧只调用 grab() 推进解码位置，不做 retrieve()（省去 BGR 转换和拷贝）；
+    间隔超过 seek_threshold 帧时直接 seek。只有被采样的帧才会被完整解码。
+
+    采样帧号只由全局帧号决定，与 start_frame 无关，因此分块采样的结果拼起来
+    与整段采样完全一致。也可以用 frames 直接指定要读取的帧号列表。
+    """
+
+    def __init__(self, video_path: str, sample_interval: int = 3,
+                 sample_fps: Optional[float] = None, start_frame: int = 0,
+                 end_frame: Optional[int] = None,
+                 seek_threshold: int = SEEK_THRESHOLD,
+                 frames: Optional[List[int]] = None):
+        self.video_path = video_path
+        self.sample_interval = max(1, int(sample_interval))
+        self.sample_fps = sample_fps
+        self.start_frame = start_frame
+        self.end_frame = end_frame
+        self.seek_threshold = seek_threshold
+        self.frames = sorted(set(frames)) if frames is not None else None
+
+        self.cap = cv2.VideoCapture(video_path)
+        if not self.cap.isOpened():
+            raise ValueError(f"无法打开视频: {video_path}")
+
+        self.fps = self.cap.get(cv2.CAP_PROP_FPS)
+        self.total_frames = int(self.cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        self.width = int(self.cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+        self.height = int(self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+
+        # 统计：完整解码的帧、只 grab 的帧、seek 次数
+        self.decoded = 0
+        self.grabbed = 0
+        self.seeks = 0
+
+    def sample_indices(self) -> Iterator[int]:
+        """生成 start_frame 之后的采样帧号（不受 end_frame 限制）"""
+        start = self.start_frame
+
+        if self.frames is not None:
+            yield from (idx for idx in self.frames if idx >= start)
+        elif self.sample_fps:
+            # 按时间采样：第 k 个采样点取最接近 k / sample_fps 秒的帧
+            step = self.fps / self.sample_fps
+            k = max(0, int(start / step) - 1)
+            last = -1
+            while True:
+                idx = int(k * step + 0.5)
+                k += 1
+                if idx < start or idx == last:
+                    continue
+                last = idx
+                yield idx
+        else:
+            idx = -(-start // self.sample_interval) * self.sample_interval
+            while True:
+                yield idx
+                idx += self.sample_interval
+
+    @property
+    def frame_shape(self) -> Tuple[int, int, int]:
+        return self.height, self.width, 3
+
+    def __iter__(self) -> Iterator[Tuple[int, np.ndarray]]:
+        """依次产出 (帧号, 帧)"""
+        return self.read_frames()
+
+    def read_frames(self, get_buffer: Optional[Callable[[], Optional[np.ndarray]]] = None
+                    ) -> Iterator[Tuple[int, np.ndarray]]:
+        """依次产出 (帧号, 帧)
+
+        get_buffer 不为空时，每帧解码到它返回的预分配数组中（尺寸匹配时不会新分配内存）；
+        它返回 None 表示停止读取。
+        """
+        cap = self.cap
+        try:
+            pos = 0
+            if self.start_frame > 0:
+                cap.set(cv2.CAP_PROP_POS_FRAMES, self.start_frame)
+                pos = self.start_frame
+
+            for target in self.sample_indices():
+                if self.end_frame is not None and target >= self.end_frame:
+                    break
+
+                if target - pos > self.seek_threshold:
+                    cap.set(cv2.CAP_PROP_POS_FRAMES, target)
+                    self.seeks += 1
+                    pos = target
+                else:
+                    while pos < target:
+                        if not cap.grab():
+                            return
+                        self.grabbed += 1
+                        pos += 1
+
+                if get_buffer is not None:
+                    buf = get_buffer()
+                    if buf is None:
+                        return
+                    ret, frame = cap.read(buf)
+                else:
+                    ret, frame = cap.read()
+                if not ret:
+                    return
+                self.decoded += 1
+                pos += 1
+
+                yield target, frame
+        finally:
+            self.release()
+
+    def release(self):
+        if self.cap is not None:
+            self.cap.release()
+            self.cap = None
+
+
+class PrefetchFrameSource:
+    """后台线程预读帧
+
+    解码线程把采样帧读进预分配的缓冲区，放入有界队列，检测在主线程中与解码重叠进行。
+    缓冲区循环复用，不会每帧分配新数组，内存上限为 (depth + 1) 帧：
+    队列中最多 depth 帧，加上消费者手里的 1 帧。
+
+    产出的帧在下一次迭代时会被回收复用，需要保留时请自行 copy()。
+    """
+
+    def __init__(self, sampler: FrameSampler, depth: int = PREFETCH_DEPTH):
+        self.sampler = sampler
+        self.depth = max(1, depth)
+
+    @property
+    def fps(self) -> float:
+        return self.sampler.fps
+
+    @property
+    def total_frames(self) -> int:
+        return self.sampler.total_frames
+
+    @property
+    def decoded(self) -> int:
+        return self.sampler.decoded
+
+    @property
+    def memory_ceiling(self) -> int:
+        """缓冲区占用的最大字节数"""
+        h, w, c = self.sampler.frame_shape
+        return (self.depth + 1) * h * w * c
+
+    def __iter__(self) -> Iterator[Tuple[int, np.ndarray]]:
+        shape = self.sampler.frame_shape
+        free = queue.Queue()
+        for _ in range(self.depth + 1):
+            free.put(np.empty(shape, np.uint8))
+        ready = queue.Queue()
+        stop = threading.Event()
+
+        def get_buffer():
+            while not stop.is_set():
+                try:
+                    return free.get(timeout=0.1)
+                except queue.Empty:
+                    continue
+            return None
+
+        def produce():
+            try:
+                for item in self.sampler.read_frames(get_buffer):
+                    ready.put(item)
+                ready.put(None)
+            except Exception as e:
+                ready.put(e)
+
+        thread = threading.Thread(target=produce, daemon=True)
+        thread.start()
+        try:
+            while True:
+                item = ready.get()
+                if item is None:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+                # 消费者处理完这一帧，缓冲区回收
+                free.put(item[1])
+        finally:
+            stop.set()
+            thread.join()
+
+    def release(self):
+        self.sampler.release()
+
+
+def open_frame_source(video_path: str, prefetch: int = 0, **kwargs):
+    """创建帧源：prefetch > 0 时用后台线程预读，队列深度为 prefetch"""
+    sampler = FrameSampler(video_path, **kwargs)
+    if prefetch > 0:
+        return PrefetchFrameSource(sampler, prefetch)
+    return sampler
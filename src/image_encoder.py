@@ -0,0 +1,174 @@
+import math
+import base64
+import threading
+import cv2
+import numpy as np
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+# 依次尝试的 JPEG 质量，字节数仍超预算时再缩小尺寸
+JPEG_QUALITIES = (90, 80, 70, 60)
+# 超预算时每轮缩小的比例
+SHRINK_STEP = 0.8
+# 截图太小时放大到的最短边（最多放大 2 倍，与原来上传的 ROI 截图一致），保证小字可读
+MIN_SIDE = 448
+# 拼图中每个格子上方编号栏的高度（像素）
+MONTAGE_LABEL_HEIGHT = 36
+
+
+def _openai_tokens(width: int, height: int) -> int:
+    """GPT-4V high detail：缩放到 2048 以内、短边 768，按 512 图块计费"""
+    scale = min(1.0, 2048 / max(width, height))
+    width, height = width * scale, height * scale
+    scale = min(1.0, 768 / min(width, height))
+    width, height = width * scale, height * scale
+    tiles = math.ceil(width / 512) * math.ceil(height / 512)
+    return 85 + 170 * tiles
+
+
+def _patch_tokens(width: int, height: int, patch: int = 28) -> int:
+    """按 patch x patch 像素一个 token 估算（GLM-4V 等 ViT 类模型的近似）"""
+    return math.ceil(width / patch) * math.ceil(height / patch)
+
+
+# 各服务商的默认预算：像素上限、字节上限、token 估算方式（都是估算值，可以覆盖）
+PROVIDER_BUDGETS: Dict[str, Dict] = {
+    'openai': {'max_pixels': 768 * 768, 'max_bytes': 300 * 1024, 'tokens': _openai_tokens},
+    'zhipu': {'max_pixels': 1120 * 1120, 'max_bytes': 400 * 1024, 'tokens': _patch_tokens},
+    'default': {'max_pixels': 1024 * 1024, 'max_bytes': 400 * 1024, 'tokens': _patch_tokens},
+}
+
+
+@dataclass
+class EncodedImage:
+    data: bytes
+    width: int
+    height: int
+    quality: int
+    tokens: int
+
+    def data_url(self) -> str:
+        return "data:image/jpeg;base64," + base64.b64encode(self.data).decode('utf-8')
+
+
+class ImageEncoder:
+    """按服务商的像素/字节预算在内存中编码截图
+
+    先把截图缩放到像素上限以内（太小的截图放大到 MIN_SIDE，最多 2 倍），
+    再从高到低尝试 JPEG 质量，直到字节数不超过上限；最低质量仍超预算时继续缩小尺寸。
+    不经过磁盘文件。
+
+    统计上传的字节数和预估图片 token 数，token 数与原方式（上传 2 倍放大的截图）
+    对比；原方式的字节数要再编码一次才知道，不在每次请求时统计（见 benchmark.py encode）。
+    线程安全。
+    """
+
+    def __init__(self, provider: str = 'default', max_pixels: Optional[int] = None,
+                 max_bytes: Optional[int] = None):
+        budget = PROVIDER_BUDGETS.get(provider, PROVIDER_BUDGETS['default'])
+        self.max_pixels = max_pixels or budget['max_pixels']
+        self.max_bytes = max_bytes or budget['max_bytes']
+        self.count_tokens = budget['tokens']
+        self.lock = threading.Lock()
+
+        # 统计：编码的图片数、上传的字节数、实际/原方式的预估 token 数
+        self.images = 0
+        self.bytes_out = 0
+        self.tokens_out = 0
+        self.tokens_baseline = 0
+
+    def encode(self, roi: np.ndarray) -> EncodedImage:
+        """编码截图，roi 是原分辨率的截图区域"""
+        encoded = self._encode(roi)
+        h, w = roi.shape[:2]
+        self._record(encoded, self.count_tokens(w * 2, h * 2))
+        return encoded
+
+    def _encode(self, roi: np.ndarray) -> EncodedImage:
+        if roi.size == 0:
+            raise ValueError("截图区域为空")
+        h, w = roi.shape[:2]
+        scale = min(math.sqrt(self.max_pixels / (w * h)),
+                    max(1.0, min(2.0, MIN_SIDE / min(w, h))))
+        size = _scaled(w, h, scale)
+
+        while True:
+            image = self._resize(roi, size)
+            for quality in JPEG_QUALITIES:
+                data = _jpeg(image, quality)
+                if len(data) <= self.max_bytes:
+                    break
+            if len(data) <= self.max_bytes or min(size) <= 32:
+                break
+            size = _scaled(size[0], size[1], SHRINK_STEP)
+
+        return EncodedImage(data, size[0], size[1], quality,
+                            self.count_tokens(size[0], size[1]))
+
+    def report(self):
+        if not self.images:
+            return
+        print(f"图片编码: {self.images} 张，上传 {self.bytes_out / 1024:.0f}KB，"
+              f"预估图片 token {self.tokens_out}（原方式 {self.tokens_baseline}）")
+
+    def _resize(self, roi: np.ndarray, size: Tuple[int, int]) -> np.ndarray:
+        h, w = roi.shape[:2]
+        if size == (w, h):
+            return roi
+        interpolation = cv2.INTER_AREA if size[0] < w else cv2.INTER_CUBIC
+        return cv2.resize(roi, size, interpolation=interpolation)
+
+    def _record(self, encoded: EncodedImage, baseline_tokens: int):
+        with self.lock:
+            self.images += 1
+            self.bytes_out += len(encoded.data)
+            self.tokens_out += encoded.tokens
+            self.tokens_baseline += baseline_tokens
+
+
+def build_montage(images: List[np.ndarray], labels: List[str],
+                  max_pixels: int) -> np.ndarray:
+    """把多张截图拼成带编号的网格图
+
+    每个格子上方有一条标签栏，截图等比缩放后居中放在格子里，整张图不超过 max_pixels。
+    """
+    n = len(images)
+    cols = math.ceil(math.sqrt(n))
+    rows = math.ceil(n / cols)
+    # 格子取所有截图的最大宽高，再整体缩放到像素预算以内
+    cell_w = max(img.shape[1] for img in images)
+    cell_h = max(img.shape[0] for img in images)
+    label_h = MONTAGE_LABEL_HEIGHT
+    scale = min(1.0, math.sqrt(max_pixels / (cols * cell_w * rows * (cell_h + label_h))))
+    cell_w, cell_h = max(1, int(cell_w * scale)), max(1, int(cell_h * scale))
+
+    montage = np.full((rows * (cell_h + label_h), cols * cell_w, 3), 255, np.uint8)
+    for k, (img, label) in enumerate(zip(images, labels)):
+        r, c = divmod(k, cols)
+        x0, y0 = c * cell_w, r * (cell_h + label_h)
+        cv2.rectangle(montage, (x0, y0), (x0 + cell_w - 1, y0 + label_h - 1), (0, 220, 255), -1)
+        cv2.putText(montage, label, (x0 + 6, y0 + label_h - 10), cv2.FONT_HERSHEY_SIMPLEX,
+                    0.9, (0, 0, 0), 2)
+
+        h, w = img.shape[:2]
+        s = min(cell_w / w, cell_h / h)
+        tw, th = max(1, int(w * s)), max(1, int(h * s))
+        tile = cv2.resize(img, (tw, th), interpolation=cv2.INTER_AREA if s < 1 else cv2.INTER_CUBIC)
+        ty = y0 + label_h + (cell_h - th) // 2
+        tx = x0 + (cell_w - tw) // 2
+        montage[ty:ty + th, tx:tx + tw] = tile
+        # 格子之间画分隔线，避免模型把相邻截图看成一张
+        cv2.rectangle(montage, (x0, y0), (x0 + cell_w - 1, y0 + cell_h + label_h - 1),
+                      (0, 0, 0), 2)
+    return montage
+
+
+def _scaled(w: int, h: int, scale: float) -> Tuple[int, int]:
+    return max(1, int(round(w * scale))), max(1, int(round(h * scale)))
+
+
+def _jpeg(image: np.ndarray, quality: int) -> bytes:
+    ok, buf = cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    if not ok:
+        raise ValueError("图片编码失败")
+    return buf.tobytes()
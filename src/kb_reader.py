@@ -0,0 +1,309 @@
+import os
+import re
+import json
+from array import array
+from bisect import bisect_left, bisect_right
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from facet_index import FacetIndex
+from knowledge_base import (DB_PATH, open_index, page_matches, read_offsets,
+                            rotated_journals, store_paths)
+from text_index import TextIndex, matches
+from vector_index import VectorIndex
+
+# 快照行以 {"id": N, 开头（add 写入的记录 id 在第一个），其他情况再完整解析
+_ID_RE = re.compile(rb'^\{"id": (\d+)[,}]')
+
+
+class LegacyFormatError(ValueError):
+    """只有原来的 JSON 文件，需要先以读写方式打开一次完成迁移"""
+
+
+class ReadOnlyKnowledgeBase:
+    """只读打开追加日志格式的知识库，查询接口与 SimpleKnowledgeBase 相同
+
+    打开时只映射快照的偏移索引（每条记录的 ID 和字节偏移，只读取首行）并读取追加日志，
+    不解析快照中的记录；记录在显示或需要确认匹配时才按偏移读出一行解析。关键词、分面和相似度索引
+    在第一次用到时才读取。内存中只有偏移索引、日志中的记录和已打开的索引。
+
+    每次查询前检查文件：其他进程追加了日志时读取新增部分，压缩换了快照时重新打开。
+    快照文件只在每次查询期间打开，不妨碍写入进程替换它。
+    不写任何文件：只有原来的 JSON 文件时抛出 LegacyFormatError，不替它迁移。
+    """
+
+    def __init__(self, db_path: str = DB_PATH):
+        self.db_path = db_path
+        self.paths = store_paths(db_path)
+        self.location = f"{self.paths['snapshot']}（快照）和 {self.paths['journal']}（追加日志）"
+        if not self.exists() and os.path.exists(db_path):
+            raise LegacyFormatError(
+                f"知识库还是原来的 JSON 格式: {db_path}，只读打开不会迁移；"
+                f"请先运行一次写入（如 python main.py review）完成迁移")
+        self._load()
+
+    def exists(self) -> bool:
+        return (os.path.exists(self.paths['snapshot']) or os.path.exists(self.paths['journal'])
+                or bool(rotated_journals(self.paths['journal'])))
+
+    def _load(self):
+        self.generation = 0
+        self.ids = array('i')      # 快照中的条目 ID（递增）
+        self.offsets = array('q')  # 对应行的字节偏移
+        self.added: Dict[int, Dict] = {}    # 日志中 add 的记录（完整内容）
+        self.added_ids: List[int] = []      # 其中不在快照里的 ID（递增）
+        self.updates: Dict[int, Dict] = {}  # 日志中对快照记录的修改
+        self.journal_ids = set()
+        self._index: Optional[TextIndex] = None
+        self._facets: Optional[FacetIndex] = None
+        self._vectors: Optional[VectorIndex] = None
+        self._last_search: Tuple[Optional[str], List[int]] = (None, [])
+        self.signature = self._signature()
+
+        snapshot = self.paths['snapshot']
+        if os.path.exists(snapshot):
+            with open(snapshot, 'rb') as f:
+                self.generation = json.loads(f.readline()).get('generation', 0)
+            saved = read_offsets(self.paths['offsets'])
+            if (saved is not None and saved[0]['generation'] == self.generation
+                    and saved[0]['snapshot_size'] == os.path.getsize(snapshot)):
+                _, self.ids, self.offsets = saved
+            else:
+                self._scan_snapshot()
+        for path in rotated_journals(self.paths['journal']):
+            self._replay(path, 0)
+        self.journal_pos = self._replay(self.paths['journal'], 0)
+
+    def _scan_snapshot(self):
+        """偏移索引缺失或过期（旧版本写的快照）时逐行扫描建立，不写文件"""
+        with open(self.paths['snapshot'], 'rb') as f:
+            pos = len(f.readline())
+            for line in f:
+                match = _ID_RE.match(line)
+                self.ids.append(int(match.group(1)) if match else json.loads(line)['id'])
+                self.offsets.append(pos)
+                pos += len(line)
+
+    def _signature(self):
+        """快照和旧日志的状态，变化说明发生了压缩"""
+        files = [self.paths['snapshot']] + rotated_journals(self.paths['journal'])
+        signature = []
+        for path in files:
+            try:
+                stat = os.stat(path)
+                signature.append((path, stat.st_mtime_ns, stat.st_size))
+            except OSError:
+                signature.append((path, None, None))
+        return signature
+
+    def _refresh(self):
+        """快照或旧日志变化时重新打开，当前日志变长时读取新增的记录"""
+        if self._signature() != self.signature:
+            self._load()
+            return
+        try:
+            size = os.path.getsize(self.paths['journal'])
+        except OSError:
+            size = 0
+        if size < self.journal_pos:
+            self._load()
+        elif size > self.journal_pos:
+            self.journal_pos = self._replay(self.paths['journal'], self.journal_pos)
+
+    def _replay(self, path: str, start: int) -> int:
+        """从 start 处读取日志，返回读到的位置（不含写到一半的最后一行）"""
+        if not os.path.exists(path):
+            return start
+        pos = start
+        with open(path, 'rb') as f:
+            f.seek(start)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                self._apply(json.loads(line))
+                pos += len(line)
+        return pos
+
+    def _apply(self, record: Dict):
+        if record['op'] == 'add':
+            entry = record['entry']
+            entry_id = entry['id']
+            if entry_id not in self.added and not self._in_snapshot(entry_id):
+                self.added_ids.append(entry_id)
+            self.added[entry_id] = entry
+            self.updates.pop(entry_id, None)
+        else:
+            entry_id = record['id']
+            if entry_id in self.added:
+                self.added[entry_id].update(record['fields'])
+            elif self._in_snapshot(entry_id):
+                self.updates.setdefault(entry_id, {}).update(record['fields'])
+            else:
+                return
+        self.journal_ids.add(entry_id)
+        self._last_search = (None, [])
+        for index in (self._index, self._facets, self._vectors):
+            if index is not None:
+                index.add(self._get(entry_id))
+
+    def _in_snapshot(self, entry_id: int) -> bool:
+        i = bisect_left(self.ids, entry_id)
+        return i < len(self.ids) and self.ids[i] == entry_id
+
+    def _get(self, entry_id: int, f=None) -> Optional[Dict]:
+        """取一条记录：日志中的直接返回，快照中的按偏移读一行；f 是已打开的快照文件"""
+        if entry_id in self.added:
+            return self.added[entry_id]
+        i = bisect_left(self.ids, entry_id)
+        if i == len(self.ids) or self.ids[i] != entry_id:
+            return None
+        if f is None:
+            with open(self.paths['snapshot'], 'rb') as f:
+                return self._get(entry_id, f)
+        f.seek(self.offsets[i])
+        entry = json.loads(f.readline())
+        entry.update(self.updates.get(entry_id, {}))
+        return entry
+
+    def _get_many(self, ids: Iterable[int]) -> List[Dict]:
+        with open(self.paths['snapshot'], 'rb') if len(self.ids) else _NoFile() as f:
+            return [e for e in (self._get(i, f) for i in ids) if e is not None]
+
+    def _open(self, cls, key: str, loader=None):
+        """按需打开索引，不写文件（缺失或过期时在内存中重建）"""
+        return open_index(cls, self.paths[key], self.generation, self.iter_all,
+                          lambda: self._get_many(sorted(self.journal_ids)),
+                          save=False, loader=loader)
+
+    @property
+    def index(self) -> TextIndex:
+        if self._index is None:
+            self._index = self._open(TextIndex, 'index')
+        return self._index
+
+    @property
+    def facets(self) -> FacetIndex:
+        if self._facets is None:
+            self._facets = self._open(FacetIndex, 'facets')
+        return self._facets
+
+    @property
+    def vectors(self) -> VectorIndex:
+        if self._vectors is None:
+            self._vectors = self._open(VectorIndex, 'vectors',
+                                       lambda path: VectorIndex.load(path, readonly=True))
+        return self._vectors
+
+    def get(self, entry_id: int) -> Optional[Dict]:
+        self._refresh()
+        return self._get(entry_id)
+
+    def get_all(self) -> List[Dict]:
+        return list(self.iter_all())
+
+    def iter_all(self) -> Iterable[Dict]:
+        """按 ID 顺序逐条返回全部记录（顺序读快照，不必逐条定位）"""
+        if len(self.ids):
+            with open(self.paths['snapshot'], 'rb') as f:
+                f.readline()
+                for entry_id, line in zip(self.ids, f):
+                    if entry_id in self.added:
+                        yield self.added[entry_id]
+                        continue
+                    entry = json.loads(line)
+                    entry.update(self.updates.get(entry_id, {}))
+                    yield entry
+        for entry_id in self.added_ids:
+            yield self.added[entry_id]
+
+    def count(self, **filters) -> int:
+        """记录数，可带 filter() 的条件；不加条件时不需要打开任何索引"""
+        self._refresh()
+        if filters:
+            return self.facets.count(**filters)
+        return len(self.ids) + len(self.added_ids)
+
+    def page(self, offset: int = 0, limit: int = 20) -> List[Dict]:
+        """按 ID 顺序取一页记录"""
+        self._refresh()
+        snapshot_ids = self.ids[offset:offset + limit].tolist()
+        rest = max(0, offset - len(self.ids))
+        ids = snapshot_ids + self.added_ids[rest:rest + limit - len(snapshot_ids)]
+        return self._get_many(ids)
+
+    def filter_page(self, after_id: int = 0, limit: int = 20,
+                    **filters) -> Tuple[List[Dict], Optional[int]]:
+        """按 ID 顺序取 ID 大于 after_id 的一页（可带 filter() 的条件）
+
+        返回 (记录列表, 下一页的 after_id)，没有下一页时为 None。
+        """
+        self._refresh()
+        if filters:
+            ids = self.facets.filter(**filters)
+            start = bisect_right(ids, after_id)
+            page_ids, more = ids[start:start + limit], start + limit < len(ids)
+        else:
+            start = bisect_right(self.ids, after_id)
+            page_ids = self.ids[start:start + limit].tolist()
+            extra = self.added_ids[bisect_right(self.added_ids, after_id):]
+            page_ids += extra[:limit - len(page_ids)]
+            more = len(self.ids) - start + len(extra) > limit
+        page = self._get_many(page_ids)
+        return page, (page_ids[-1] if more and page_ids else None)
+
+    def filter(self, tag: Optional[str] = None, video: Optional[str] = None,
+               unanswered: bool = False, since: Optional[datetime] = None,
+               until: Optional[datetime] = None) -> List[Dict]:
+        """组合筛选：标签 AND 视频 AND 未回答 AND 创建时间在 [since, until) 内，按 ID 排序"""
+        self._refresh()
+        return self._get_many(self.facets.filter(tag, video, unanswered, since, until))
+
+    def list_unanswered(self) -> List[Dict]:
+        """未回答（未确认）的记录"""
+        return self.filter(unanswered=True)
+
+    def search_by_tag(self, tag: str) -> List[Dict]:
+        return self.filter(tag=tag)
+
+    def tag_counts(self) -> Dict[str, int]:
+        """每个标签的记录数，按数量从多到少排列"""
+        self._refresh()
+        return self.facets.tag_counts()
+
+    def search(self, keyword: str) -> List[Dict]:
+        """在描述、回答、关键点、标签和视频名中查找关键词，按相关度排序"""
+        return self.search_page(keyword, 0, None)[0]
+
+    def search_page(self, keyword: str, cursor: int = 0,
+                    limit: Optional[int] = 20) -> Tuple[List[Dict], Optional[int]]:
+        """搜索结果的一页，cursor 是候选列表中的位置；返回 (记录列表, 下一页的 cursor)
+
+        候选列表按关键词缓存，翻页时不重新查询；只解析本页用到的候选记录。
+        """
+        self._refresh()
+        if self._last_search[0] != keyword:
+            self._last_search = (keyword, [i for i, _ in self.index.search(keyword)])
+        candidates = self._last_search[1]
+        with open(self.paths['snapshot'], 'rb') if len(self.ids) else _NoFile() as f:
+            return page_matches(candidates, cursor, limit, lambda i: self._get(i, f),
+                                lambda e: matches(e, keyword))
+
+    def related(self, entry_id: int, k: int = 10) -> List[Tuple[Dict, float]]:
+        """内容最相似的 k 条记录及余弦相似度，从高到低"""
+        self._refresh()
+        scores = self.vectors.related(entry_id, k)
+        entries = {e['id']: e for e in self._get_many(i for i, _ in scores)}
+        return [(entries[i], score) for i, score in scores if i in entries]
+
+    def close(self):
+        pass
+
+
+class _NoFile:
+    """快照不存在时代替打开的文件（所有记录都在日志中，不会读它）"""
+
+    def __enter__(self):
+        return None
+
+    def __exit__(self, *exc):
+        return False
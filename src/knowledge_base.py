@@ -1,40 +1,483 @@
 import json
 import os
+import glob
+import threading
+from array import array
+from bisect import bisect_right
 from datetime import datetime
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+import numpy as np
+from dotenv import load_dotenv
+
+from facet_index import FacetIndex
+from text_index import TextIndex, matches
+from vector_index import VectorIndex
+
+# 默认的知识库路径：追加日志格式（沿用原 JSON 文件名推导）和 SQLite 格式
+DB_PATH = "output/qa_database.json"
+SQLITE_PATH = "output/qa_database.sqlite"
+# 存储格式版本
+STORE_VERSION = 1
+# 追加日志超过这么多条记录时在后台压缩成快照
+COMPACT_RECORDS = 1000
+OFFSETS_VERSION = 1
+
+
+def write_offsets(path: str, generation: int, snapshot_size: int, ids: array, offsets: array):
+    """快照的偏移索引：首行 JSON 元数据，之后是每行记录的条目 ID 和字节偏移"""
+    header = {'version': OFFSETS_VERSION, 'generation': generation,
+              'snapshot_size': snapshot_size, 'entries': len(ids)}
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(json.dumps(header).encode('utf-8') + b"\n")
+        ids.tofile(f)
+        offsets.tofile(f)
+    os.replace(tmp_path, path)
+
+
+def read_offsets(path: str, header_only: bool = False):
+    """读取偏移索引，返回 (元数据, 条目 ID 数组, 偏移数组)，不存在或版本不符时返回 None
+
+    只读取首行元数据，两个数组用 np.memmap 映射（header_only 时为空数组），打开时间与
+    记录数无关。写入进程总是写临时文件后替换，已映射的旧文件内容不会变。
+    """
+    if not os.path.exists(path):
+        return None
+    with open(path, 'rb') as f:
+        try:
+            header = json.loads(f.readline())
+        except ValueError:
+            return None
+        start = f.tell()
+    if header.get('version') != OFFSETS_VERSION:
+        return None
+    n = 0 if header_only else header['entries']
+    if n == 0:
+        return header, np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.int64)
+    ids = np.memmap(path, dtype=np.int32, mode='r', offset=start, shape=(n,))
+    offsets = np.memmap(path, dtype=np.int64, mode='r', offset=start + ids.nbytes, shape=(n,))
+    return header, ids, offsets
+
+
+def open_index(cls, path: str, generation: int, all_entries: Callable[[], Iterable[Dict]],
+               changed: Callable[[], Iterable[Dict]], save: bool = True, loader=None):
+    """读取索引文件并补建日志中的记录（changed）；文件缺失或比快照旧时用全部记录重建
+
+    索引文件的 generation 不小于快照的 generation 时，内容覆盖了快照中的全部记录。
+    """
+    index = (loader or cls.load)(path)
+    if index is not None and index.generation >= generation:
+        for entry in changed():
+            index.add(entry)
+        return index
+    index = cls()
+    index.generation = generation
+    added = 0
+    for entry in all_entries():
+        index.add(entry)
+        added += 1
+    if save and added:
+        index.save(path)
+    return index
+
+
+def store_paths(db_path: str) -> Dict[str, str]:
+    """追加日志格式知识库的各个文件（db_path 是原来的 JSON 文件路径）"""
+    base = os.path.splitext(db_path)[0]
+    return {
+        'snapshot': base + ".snapshot.jsonl",
+        'journal': base + ".journal.jsonl",
+        'offsets': base + ".offsets",
+        'index': base + ".index",
+        'facets': base + ".facets",
+        'vectors': base + ".vectors",
+    }
+
+
+def rotated_journals(journal_path: str) -> List[str]:
+    """压缩时改名的旧日志，按序号排序"""
+    return sorted(glob.glob(glob.escape(os.path.splitext(journal_path)[0]) + ".*.jsonl"))
+
 
 class SimpleKnowledgeBase:
-    def __init__(self, db_path: str = "output/qa_database.json"):
+    """问答知识库，存储为 快照 + 追加日志
+
+    db_path 是原来的 JSON 文件路径，实际数据保存在同目录下：
+      qa_database.snapshot.jsonl  快照，首行是元数据，之后每行一条记录
+      qa_database.offsets         快照中每条记录的字节偏移（只读打开时内存映射，见 kb_reader）
+      qa_database.journal.jsonl   追加日志，每行一个操作（add / update）
+      qa_database.index           关键词倒排索引（见 text_index.TextIndex）
+      qa_database.facets          标签 / 视频 / 回答状态索引（见 facet_index.FacetIndex）
+      qa_database.vectors.*       相似度向量（见 vector_index.VectorIndex）
+    每次 add / update 只在日志末尾追加一行并 fsync，耗时与记录总数无关，写到一半崩溃
+    最多丢失最后一行。日志超过 COMPACT_RECORDS 条时在后台线程把全部记录写成新快照
+    （写临时文件后原子替换），再删除已并入快照的日志。
+
+    条目 ID 单调递增、不会复用（记录在快照元数据中），不依赖记录条数。
+    各索引随 add / update 在内存中增量更新，压缩时和快照一起写盘；打开时读取索引文件，
+    只为日志中的记录补建索引，索引文件缺失或比快照旧时才全部重建。
+    第一次打开时如果只有原来的 JSON 文件，会一次性迁移，原文件改名为 .json.bak。
+    """
+
+    def __init__(self, db_path: str = DB_PATH, fsync: bool = True,
+                 compact_records: int = COMPACT_RECORDS):
         self.db_path = db_path
-        os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
-        self.data = self._load()
-    
+        paths = store_paths(db_path)
+        self.snapshot_path = paths['snapshot']
+        self.journal_path = paths['journal']
+        self.offsets_path = paths['offsets']
+        self.index_path = paths['index']
+        self.facets_path = paths['facets']
+        self.vectors_path = paths['vectors']
+        self.location = f"{self.snapshot_path}（快照）和 {self.journal_path}（追加日志）"
+        self.fsync = fsync
+        self.compact_records = compact_records
+        os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+
+        self.lock = threading.Lock()
+        self.compactor: Optional[threading.Thread] = None
+        self.journal = None
+        self.data: List[Dict] = []
+        self.by_id: Dict[int, Dict] = {}
+        self.next_id = 1
+        self.generation = 0  # 每次压缩加一，索引文件据此判断是否过期
+        self.journal_records = 0
+        self.journal_ids = set()  # 日志中涉及的条目 ID，打开时补建这些记录的索引
+
+        if not self.exists() and os.path.exists(self.db_path):
+            self._migrate()
+        self._load()
+        self.index = self._open_index(TextIndex, self.index_path)
+        self.facets = self._open_index(FacetIndex, self.facets_path)
+        self.vectors = self._open_index(VectorIndex, self.vectors_path)
+
+    def _open_index(self, cls, path: str):
+        return open_index(cls, path, self.generation, lambda: self.data,
+                          lambda: (self.by_id[i] for i in sorted(self.journal_ids)
+                                   if i in self.by_id))
+
+    def exists(self) -> bool:
+        return (os.path.exists(self.snapshot_path) or os.path.exists(self.journal_path)
+                or bool(self._rotated_journals()))
+
     def _load(self):
-        if os.path.exists(self.db_path):
-            with open(self.db_path, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        return []
-    
+        """读取快照，再按顺序重放压缩中断留下的旧日志和当前日志"""
+        if os.path.exists(self.snapshot_path):
+            ids, offsets = array('i'), array('q')
+            with open(self.snapshot_path, 'rb') as f:
+                header = json.loads(f.readline())
+                self.next_id = header.get('next_id', 1)
+                self.generation = header.get('generation', 0)
+                pos = f.tell()
+                for line in f:
+                    entry = json.loads(line)
+                    self._apply({'op': 'add', 'entry': entry})
+                    ids.append(entry['id'])
+                    offsets.append(pos)
+                    pos += len(line)
+            # 旧版本写的快照没有偏移索引，顺便补上
+            saved = read_offsets(self.offsets_path, header_only=True)
+            if saved is None or saved[0]['generation'] != self.generation \
+                    or saved[0]['snapshot_size'] != pos:
+                write_offsets(self.offsets_path, self.generation, pos, ids, offsets)
+        for path in self._rotated_journals() + [self.journal_path]:
+            self.journal_records += self._replay(path)
+
+    def _replay(self, path: str) -> int:
+        if not os.path.exists(path):
+            return 0
+        count = 0
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                if not line.endswith("\n"):
+                    # 写到一半崩溃留下的残缺行（只可能是最后一行），下次写入前会截掉
+                    break
+                record = json.loads(line)
+                self._apply(record)
+                self.journal_ids.add(record['entry']['id'] if record['op'] == 'add'
+                                     else record['id'])
+                count += 1
+        return count
+
+    def _apply(self, record: Dict):
+        """执行一个操作；重复执行结果相同，快照和日志有重叠时不会产生重复记录"""
+        if record['op'] == 'add':
+            entry = record['entry']
+            old = self.by_id.get(entry['id'])
+            if old is not None:
+                old.clear()
+                old.update(entry)
+            else:
+                self.data.append(entry)
+                self.by_id[entry['id']] = entry
+            self.next_id = max(self.next_id, entry['id'] + 1)
+        elif record['op'] == 'update':
+            entry = self.by_id.get(record['id'])
+            if entry is not None:
+                entry.update(record['fields'])
+
     def add(self, video_file: str, content: dict, qa: dict):
-        entry = {
-            'id': len(self.data) + 1,
-            'video_file': video_file,
-            'timestamp': content['timestamp'],
-            'screenshot': content.get('roi_path', ''),
-            'ai_description': qa['ai_description'],
-            'question': qa['question'],
-            'your_answer': qa['ai_answer'],
-            'tags': qa['tags'],
-            'key_point': qa['key_point'],
-            'confidence': qa['confidence'],
-            'created_at': datetime.now().isoformat(),
-        }
-        self.data.append(entry)
-        self._save()
+        with self.lock:
+            entry = {
+                'id': self.next_id,
+                'video_file': video_file,
+                'timestamp': content['timestamp'],
+                'screenshot': content.get('roi_path', ''),
+                'ai_description': qa['ai_description'],
+                'question': qa['question'],
+                'your_answer': qa['ai_answer'],
+                'tags': qa['tags'],
+                'key_point': qa['key_point'],
+                'confidence': qa['confidence'],
+                'created_at': datetime.now().isoformat(),
+            }
+            record = {'op': 'add', 'entry': entry}
+            self._append(record)
+            self._apply(record)
+            for index in (self.index, self.facets, self.vectors):
+                index.add(entry)
+        self._maybe_compact()
         return entry['id']
-    
-    def _save(self):
-        with open(self.db_path, 'w', encoding='utf-8') as f:
-            json.dump(self.data, f, ensure_ascii=False, indent=2)
-    
+
+    def _append(self, record: Dict):
+        """追加一行到日志并落盘（调用者持有锁）"""
+        if self.journal is None:
+            self._repair_journal()
+            self.journal = open(self.journal_path, 'a', encoding='utf-8')
+        self.journal.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self.journal.flush()
+        if self.fsync:
+            os.fsync(self.journal.fileno())
+        self.journal_records += 1
+
+    def _repair_journal(self):
+        """截掉上次写到一半崩溃留下的残缺行，否则新追加的记录会接在它后面"""
+        if not os.path.exists(self.journal_path):
+            return
+        with open(self.journal_path, 'rb+') as f:
+            data = f.read()
+            if data and not data.endswith(b"\n"):
+                f.truncate(data.rfind(b"\n") + 1)
+
     def get_all(self):
-        return self.data
\ No newline at end of file
+        return self.data
+
+    def iter_all(self) -> Iterable[Dict]:
+        """按 ID 顺序逐条返回全部记录"""
+        return iter(self.data)
+
+    def get(self, entry_id: int):
+        return self.by_id.get(entry_id)
+
+    def find(self, video_file: str, screenshot: str, timestamp: str):
+        """按视频、截图和时间段查找记录，没有时返回 None"""
+        for entry in reversed(self.data):
+            if (entry['video_file'] == video_file and entry['screenshot'] == screenshot
+                    and entry['timestamp'] == timestamp):
+                return entry
+        return None
+
+    def update(self, entry_id: int, **fields):
+        """修改一条记录的字段（回答、标签、一句话总结等），找不到时返回 False"""
+        with self.lock:
+            if entry_id not in self.by_id:
+                return False
+            fields['updated_at'] = datetime.now().isoformat()
+            record = {'op': 'update', 'id': entry_id, 'fields': fields}
+            self._append(record)
+            self._apply(record)
+            for index in (self.index, self.facets, self.vectors):
+                index.add(self.by_id[entry_id])
+        self._maybe_compact()
+        return True
+
+    def list_unanswered(self):
+        """未回答（未确认）的记录"""
+        return self.filter(unanswered=True)
+
+    def filter(self, tag: Optional[str] = None, video: Optional[str] = None,
+               unanswered: bool = False, since: Optional[datetime] = None,
+               until: Optional[datetime] = None) -> List[Dict]:
+        """组合筛选：标签 AND 视频 AND 未回答 AND 创建时间在 [since, until) 内，按 ID 排序"""
+        return [self.by_id[i] for i in self.facets.filter(tag, video, unanswered, since, until)]
+
+    def count(self, **filters) -> int:
+        """记录数，可带 filter() 的条件；不加条件或只有一个标签 / 视频 / 未回答条件时 O(1)"""
+        return self.facets.count(**filters) if filters else len(self.data)
+
+    def page(self, offset: int = 0, limit: int = 20) -> List[Dict]:
+        """按 ID 顺序取一页记录"""
+        return self.data[offset:offset + limit]
+
+    def filter_page(self, after_id: int = 0, limit: int = 20,
+                    **filters) -> Tuple[List[Dict], Optional[int]]:
+        """按 ID 顺序取 ID 大于 after_id 的一页（可带 filter() 的条件）
+
+        返回 (记录列表, 下一页的 after_id)，没有下一页时为 None。
+        """
+        if filters:
+            ids = self.facets.filter(**filters)
+            start = bisect_right(ids, after_id)
+            page = [self.by_id[i] for i in ids[start:start + limit]]
+            more = start + limit < len(ids)
+        else:
+            # data 按 ID 递增排列
+            lo, hi = 0, len(self.data)
+            while lo < hi:
+                mid = (lo + hi) // 2
+                if self.data[mid]['id'] <= after_id:
+                    lo = mid + 1
+                else:
+                    hi = mid
+            start = lo
+            page = self.data[start:start + limit]
+            more = start + limit < len(self.data)
+        return page, (page[-1]['id'] if more else None)
+
+    def search(self, keyword: str) -> List[Dict]:
+        """在描述、回答、关键点、标签和视频名中查找关键词（不区分大小写），按相关度排序
+
+        空格分隔的多个词都要出现（AND），OR 分隔可选的几组，见 text_index.parse_query。
+        候选记录来自倒排索引，再用原文确认关键词连续出现在同一个字段中。
+        """
+        return self.search_page(keyword, 0, None)[0]
+
+    def search_page(self, keyword: str, cursor: int = 0,
+                    limit: Optional[int] = 20) -> Tuple[List[Dict], Optional[int]]:
+        """搜索结果的一页，cursor 是候选列表中的位置；返回 (记录列表, 下一页的 cursor)"""
+        candidates = [entry_id for entry_id, _ in self.index.search(keyword)]
+        return page_matches(candidates, cursor, limit, self.by_id.get,
+                            lambda e: matches(e, keyword))
+
+    def related(self, entry_id: int, k: int = 10) -> List[Tuple[Dict, float]]:
+        """内容最相似的 k 条记录及余弦相似度，从高到低"""
+        return [(self.by_id[i], score) for i, score in self.vectors.related(entry_id, k)]
+
+    def search_by_tag(self, tag: str) -> List[Dict]:
+        return self.filter(tag=tag)
+
+    def tag_counts(self) -> Dict[str, int]:
+        """每个标签的记录数，按数量从多到少排列"""
+        return self.facets.tag_counts()
+
+    def compact(self, wait: bool = True):
+        """把全部记录写成新快照，删除已并入快照的日志
+
+        当前日志先改名为带序号的旧日志，之后的写入进入新日志；快照写完（原子替换）后
+        再删除旧日志。任何一步崩溃，下次加载时 快照 + 旧日志 + 新日志 仍是完整数据。
+        wait 为 False 时在后台线程中写快照。
+        """
+        with self.lock:
+            if self.compactor is not None and self.compactor.is_alive():
+                return
+            if self.journal is not None:
+                self.journal.close()
+                self.journal = None
+            rotated = self._rotated_journals()
+            if os.path.exists(self.journal_path):
+                self._repair_journal()
+                seq = int(rotated[-1].rsplit('.', 2)[-2]) + 1 if rotated else 1
+                path = f"{os.path.splitext(self.journal_path)[0]}.{seq:06d}.jsonl"
+                os.replace(self.journal_path, path)
+                rotated.append(path)
+            self.journal_records = 0
+            # 浅拷贝：之后的 update 会修改原记录
+            entries = [dict(e) for e in self.data]
+            self.generation += 1
+            index_states = [(self.index, self.index_path, self.index.freeze()),
+                            (self.facets, self.facets_path, self.facets.freeze()),
+                            (self.vectors, self.vectors_path, self.vectors.freeze())]
+            self.compactor = threading.Thread(
+                target=self._write_snapshot,
+                args=(entries, self.next_id, rotated, self.generation, index_states),
+                daemon=True)
+            self.compactor.start()
+        if wait:
+            self.compactor.join()
+
+    def close(self):
+        """等待后台压缩完成并关闭日志"""
+        if self.compactor is not None:
+            self.compactor.join()
+        with self.lock:
+            if self.journal is not None:
+                self.journal.close()
+                self.journal = None
+
+    def _maybe_compact(self):
+        if self.journal_records >= self.compact_records:
+            self.compact(wait=False)
+
+    def _write_snapshot(self, entries: List[Dict], next_id: int, rotated: List[str],
+                        generation: int = 0, index_states=()):
+        # 先写索引：在这之后崩溃时索引比快照新，打开时补建日志中的记录即可
+        for index, path, state in index_states:
+            index.save(path, state, generation)
+        tmp_path = self.snapshot_path + ".tmp"
+        ids, offsets = array('i'), array('q')
+        with open(tmp_path, 'wb') as f:
+            header = json.dumps({'version': STORE_VERSION, 'next_id': next_id,
+                                 'generation': generation}) + "\n"
+            pos = f.write(header.encode('utf-8'))
+            for entry in entries:
+                ids.append(entry['id'])
+                offsets.append(pos)
+                pos += f.write((json.dumps(entry, ensure_ascii=False) + "\n").encode('utf-8'))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.snapshot_path)
+        write_offsets(self.offsets_path, generation, pos, ids, offsets)
+        for path in rotated:
+            os.remove(path)
+
+    def _rotated_journals(self) -> List[str]:
+        return rotated_journals(self.journal_path)
+
+    def _migrate(self):
+        """从原来的 JSON 文件一次性迁移：按原 ID 写成快照，原文件改名为 .json.bak"""
+        with open(self.db_path, 'r', encoding='utf-8') as f:
+            entries = json.load(f)
+        next_id = max((e['id'] for e in entries), default=0) + 1
+        self._write_snapshot(entries, next_id, [])
+        os.replace(self.db_path, self.db_path + ".bak")
+        print(f"知识库已迁移为追加日志格式: {self.snapshot_path}"
+              f"（{len(entries)} 条，原文件保留为 {self.db_path}.bak）")
+
+
+def page_matches(candidates: List[int], cursor: int, limit: Optional[int],
+                 fetch: Callable[[int], Optional[Dict]],
+                 match: Callable[[Dict], bool]) -> Tuple[List[Dict], Optional[int]]:
+    """从 candidates[cursor:] 依次取出记录并确认，凑满 limit 条（None 表示不限）为止
+
+    返回 (记录列表, 下一页的 cursor)，候选已用完时为 None。
+    """
+    entries = []
+    pos = cursor
+    while pos < len(candidates) and (limit is None or len(entries) < limit):
+        entry = fetch(candidates[pos])
+        pos += 1
+        if entry is not None and match(entry):
+            entries.append(entry)
+    return entries, (pos if pos < len(candidates) else None)
+
+
+def open_knowledge_base(backend: Optional[str] = None, db_path: Optional[str] = None,
+                        readonly: bool = False):
+    """打开知识库，backend 为空时读取环境变量 KB_BACKEND
+
+    jsonl（默认）：SimpleKnowledgeBase，快照 + 追加日志；readonly 时为
+    ReadOnlyKnowledgeBase，按需读取记录，打开时间与记录数无关；
+    sqlite：SQLiteKnowledgeBase，带索引和全文检索，适合大量记录；readonly 时只读打开，
+    数据库不存在也不会创建。查询接口相同。
+    """
+    load_dotenv()
+    backend = backend or os.getenv("KB_BACKEND", "jsonl")
+    if backend == "sqlite":
+        from sqlite_store import SQLiteKnowledgeBase
+        return SQLiteKnowledgeBase(db_path or SQLITE_PATH, readonly=readonly)
+    if backend != "jsonl":
+        raise ValueError(f"不支持的知识库类型: {backend}")
+    if readonly:
+        from kb_reader import ReadOnlyKnowledgeBase
+        return ReadOnlyKnowledgeBase(db_path or DB_PATH)
+    return SimpleKnowledgeBase(db_path or DB_PATH)
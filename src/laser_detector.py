@@ -1,7 +1,30 @@
+import os
+import json
+import time
+import multiprocessing
 import cv2
 import numpy as np
-from typing import List, Tuple
-from dataclasses import dataclass
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterator, List, Optional, Tuple
+from dataclasses import dataclass, field
+from frame_source import open_frame_source
+from color_lut import ColorLUT, CLASS_RED, CLASS_GREEN
+from prefilter import BrightSpotPrefilter
+from frame_cache import StaticFrameCache
+from laser_tracker import LaserTracker
+from detection_cache import DetectionCache
+
+# 并行检测时每个分块的最少帧数，块太小时 seek 的开销会抵消并行收益
+MIN_CHUNK_FRAMES = 300
+
+# 检测时为一个片段最多保留的候选中间帧数（1080p 约 6MB/帧）
+MAX_KEPT_FRAMES = 16
+
+# 金字塔检测：候选区域在缩小图上向外扩展的像素数（至少 1，保证开运算不受切边影响）
+PYRAMID_PAD = 2
+# 候选图块总面积超过整帧这个比例时，退回全帧检测
+PYRAMID_FALLBACK_RATIO = 0.5
 
 @dataclass
 class LaserSegment:
@@ -11,9 +34,15 @@ class LaserSegment:
     center_frame: int
     positions: List[Tuple[int, int]]
     trajectory_box: Tuple[int, int, int, int]
+    # 跟踪模式下按轨迹 ID 分开的激光点，多支激光笔同时出现时可以区分
+    tracks: Dict[int, List[Tuple[int, int]]] = field(default_factory=dict)
+    # 检测时顺带保留的中间帧（keyframes=True 时），截图时不必再解码一次视频
+    keyframe: Optional[np.ndarray] = field(default=None, repr=False, compare=False)
 
 class LaserDetector:
-    def __init__(self, laser_color="both"):
+    def __init__(self, laser_color="both", pyramid_level=0, use_lut=False,
+                 lut_bits=8, lut_cache_dir="output/cache", prefilter=None,
+                 static_skip=False, tracking=False, prefetch=0):
         self.laser_color = laser_color
         
         # 红色激光 HSV
@@ -26,8 +55,105 @@ class LaserDetector:
         self.green_lower = (35, 100, 100)
         self.green_upper = (85, 255, 255)
         
+        # 激光点面积范围（全分辨率像素）
+        self.min_area = 5
+        self.max_area = 1000
+        
+        # 金字塔层级：0 为全分辨率检测，1 为 1/2，2 为 1/4
+        self.pyramid_level = pyramid_level
+        
+        self.kernel = np.ones((3, 3), np.uint8)
+        
+        # 预计算的 BGR → 激光类别查找表，替代逐帧 HSV 转换
+        self.use_lut = use_lut
+        self.lut_bits = lut_bits
+        self.lut_cache_dir = lut_cache_dir
+        self.lut = self._build_lut() if use_lut else None
+        
+        # 预筛选：True 使用默认的高亮高饱和筛选，也可以传入任意 FramePrefilter
+        if prefilter is True:
+            prefilter = self.default_prefilter()
+        elif (isinstance(prefilter, BrightSpotPrefilter) and use_lut
+              and prefilter.lut_bits != lut_bits):
+            raise ValueError(f"预筛选的 lut_bits ({prefilter.lut_bits}) 与查找表 ({lut_bits}) "
+                             f"不一致，可能误拒查找表会接受的帧")
+        self.prefilter = prefilter
+        
+        # 静态画面跳过：画面未变化时复用上次结果，只在变化的分块内重新检测
+        self.static_skip = static_skip
+        
+        # 跟踪模式：只在上一个激光点的预测位置附近检测，并给每个点分配轨迹 ID
+        self.tracking = tracking
+        
+        # 预读队列深度：大于 0 时解码在后台线程中进行，与检测重叠
+        self.prefetch = prefetch
+        
+    def __getstate__(self):
+        # 查找表最大 16MB，不随对象传给子进程，子进程从磁盘缓存重新加载
+        state = self.__dict__.copy()
+        state['lut'] = None
+        return state
+    
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if self.use_lut:
+            self.lut = self._build_lut()
+    
+    def _build_lut(self) -> ColorLUT:
+        lut = ColorLUT({
+            CLASS_RED: [(self.red_lower1, self.red_upper1),
+                        (self.red_lower2, self.red_upper2)],
+            CLASS_GREEN: [(self.green_lower, self.green_upper)],
+        }, bits=self.lut_bits, cache_dir=self.lut_cache_dir)
+        self._lut_classes = []
+        if self.laser_color in ["red", "both"]:
+            self._lut_classes.append(CLASS_RED)
+        if self.laser_color in ["green", "both"]:
+            self._lut_classes.append(CLASS_GREEN)
+        return lut
+    
+    def default_prefilter(self) -> BrightSpotPrefilter:
+        """按当前启用的 HSV 阈值生成不会误拒的预筛选器"""
+        lowers = []
+        if self.laser_color in ["red", "both"]:
+            lowers += [self.red_lower1, self.red_lower2]
+        if self.laser_color in ["green", "both"]:
+            lowers.append(self.green_lower)
+        return BrightSpotPrefilter(min_saturation=min(l[1] for l in lowers),
+                                   min_value=min(l[2] for l in lowers),
+                                   lut_bits=self.lut_bits if self.use_lut else 8)
+    
+    def detection_settings(self) -> Dict:
+        """影响逐帧检测结果的全部设置，用作检测缓存的键"""
+        settings = {
+            'laser_color': self.laser_color,
+            'red': [self.red_lower1, self.red_upper1, self.red_lower2, self.red_upper2],
+            'green': [self.green_lower, self.green_upper],
+            'area': [self.min_area, self.max_area],
+            'pyramid_level': self.pyramid_level,
+            'static_skip': self.static_skip,
+            'tracking': self.tracking,
+        }
+        if self.use_lut and self.lut_bits < 8:
+            settings['lut_bits'] = self.lut_bits
+        if self.prefilter is not None and not isinstance(self.prefilter, BrightSpotPrefilter):
+            # 默认预筛选不会误拒，自定义的预筛选可能改变结果
+            settings['prefilter'] = type(self.prefilter).__name__
+        return json.loads(json.dumps(settings))
+    
     def detect_frame(self, frame: np.ndarray) -> List[Tuple[int, int]]:
         """检测单帧中的激光点"""
+        if self.prefilter is not None and not self.prefilter(frame):
+            return []
+        if self.pyramid_level > 0:
+            return self._detect_pyramid(frame)
+        return self._detect_points(frame)
+    
+    def _color_mask(self, frame: np.ndarray) -> np.ndarray:
+        """按 HSV 阈值生成激光颜色掩码"""
+        if self.lut is not None:
+            return self.lut.mask(frame, self._lut_classes)
+        
         hsv = cv2.cvtColor(frame, cv2.COLOR_BGR2HSV)
         
         masks = []
@@ -43,87 +169,534 @@ class LaserDetector:
             masks.append(mask_green)
         
         if len(masks) == 2:
-            combined_mask = cv2.bitwise_or(masks[0], masks[1])
-        else:
-            combined_mask = masks[0]
-        
-        kernel = np.ones((3, 3), np.uint8)
-        combined_mask = cv2.morphologyEx(combined_mask, cv2.MORPH_OPEN, kernel)
+            return cv2.bitwise_or(masks[0], masks[1])
+        return masks[0]
+    
+    def _detect_points(self, frame: np.ndarray, offset: Tuple[int, int] = (0, 0),
+                       cut_edges: Tuple[bool, bool, bool, bool] = (False,) * 4
+                       ) -> List[Tuple[int, int]]:
+        """在整帧或局部图块上检测激光点，返回加上 offset 后的整帧坐标
+
+        cut_edges 标记图块的左/上/右/下边是否是从整帧中裁出来的切边，
+        碰到切边的轮廓可能不完整，直接丢弃（它会在覆盖它的其他图块里被完整检测）。
+        """
+        combined_mask = self._color_mask(frame)
+        combined_mask = cv2.morphologyEx(combined_mask, cv2.MORPH_OPEN, self.kernel)
         
         contours, _ = cv2.findContours(combined_mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
         
+        h, w = combined_mask.shape[:2]
+        ox, oy = offset
         points = []
         for cnt in contours:
             area = cv2.contourArea(cnt)
-            if 5 < area < 1000:
+            if self.min_area < area < self.max_area:
+                if any(cut_edges):
+                    x, y, bw, bh = cv2.boundingRect(cnt)
+                    left, top, right, bottom = cut_edges
+                    if ((left and x == 0) or (top and y == 0) or
+                            (right and x + bw == w) or (bottom and y + bh == h)):
+                        continue
                 M = cv2.moments(cnt)
                 if M["m00"] > 0:
                     cx = int(M["m10"] / M["m00"])
                     cy = int(M["m01"] / M["m00"])
-                    points.append((cx, cy))
+                    points.append((cx + ox, cy + oy))
+        
+        return points
+    
+    def _detect_pyramid(self, frame: np.ndarray) -> List[Tuple[int, int]]:
+        """金字塔检测：在缩小的帧上找候选区域，再回到全分辨率图块中确认和定位
+
+        缩小采用隔点取样而不是平均，避免小光斑的饱和度被背景稀释。开运算后
+        留下的光斑至少包含一个 3x3 的完整像素块，因此 1/2 取样一定会命中；
+        1/4 取样可能漏掉面积接近下限的最小光斑。比激光光斑上限还大的色块
+        （如整块红色标题）在候选阶段就被排除；与这样的色块相距不到 scale 个像素的
+        光斑在缩小后会和它连成一片，也一并排除。
+        """
+        scale = 2 ** self.pyramid_level
+        h, w = frame.shape[:2]
+        
+        # 宽高能被 scale 整除时（1080p/4K 都满足），最近邻缩放与 frame[::scale, ::scale]
+        # 取到的像素相同，但输出是连续内存，比切片再拷贝快得多
+        small = cv2.resize(frame, (w // scale, h // scale),
+                           interpolation=cv2.INTER_NEAREST)
+        mask = self._color_mask(small)
+        if not cv2.countNonZero(mask):
+            return []
+        
+        # 缩小后的候选不做开运算（小光斑会被腐蚀掉），面积阈值按层级缩放；
+        # 取样像素数比轮廓面积略大，上限留出余量
+        min_pixels = max(1, int(self.min_area / scale ** 2))
+        max_pixels = self.max_area / scale ** 2 * 1.5
+        n, _, stats, _ = cv2.connectedComponentsWithStats(mask)
+        
+        patch_mask = np.zeros_like(mask)
+        for x, y, bw, bh, pixels in stats[1:].tolist():
+            if min_pixels <= pixels <= max_pixels:
+                cv2.rectangle(patch_mask,
+                              (x - PYRAMID_PAD, y - PYRAMID_PAD),
+                              (x + bw - 1 + PYRAMID_PAD, y + bh - 1 + PYRAMID_PAD),
+                              255, -1)
+        
+        # 重叠的图块合并成一个
+        n, _, stats, _ = cv2.connectedComponentsWithStats(patch_mask)
+        if n <= 1:
+            return []
+        
+        patch_area = int(stats[1:, cv2.CC_STAT_AREA].sum()) * scale ** 2
+        # 候选区域太大时，直接做全帧检测更快
+        if patch_area > w * h * PYRAMID_FALLBACK_RATIO:
+            return self._detect_points(frame)
+        
+        points = []
+        for x, y, bw, bh, _ in stats[1:].tolist():
+            x1, y1 = x * scale, y * scale
+            x2, y2 = min(w, (x + bw) * scale), min(h, (y + bh) * scale)
+            found = self._detect_points(
+                frame[y1:y2, x1:x2], (x1, y1),
+                (x1 > 0, y1 > 0, x2 < w, y2 < h))
+            for p in found:
+                if p not in points:
+                    points.append(p)
         
         return points
     
     def extract_segments(self, video_path: str, sample_interval: int = 3,
                         min_laser_frames: int = 5, pre_context: float = 3.0,
-                        post_context: float = 5.0, merge_gap: float = 1.0):
-        """提取激光标记片段"""
+                        post_context: float = 5.0, merge_gap: float = 1.0,
+                        workers: int = 1, sample_fps: Optional[float] = None,
+                        adaptive: bool = False, coarse_interval: float = 1.5,
+                        cache_dir: Optional[str] = None, keyframes: bool = False):
+        """提取激光标记片段
+
+        workers > 1 时把视频按帧区间切块，多进程并行检测；None 表示使用全部 CPU 核心。
+        sample_fps 不为空时按时间采样（每秒 sample_fps 帧），忽略 sample_interval。
+        adaptive 为 True 时先每 coarse_interval 秒粗扫一帧，只在命中附近按正常采样密度细扫。
+        cache_dir 不为空时把逐帧检测结果缓存到该目录，只改聚类参数重跑时不再解码视频。
+        keyframes 为 True 时在检测过程中保留每个片段的中间帧（segment.keyframe），
+        只在单进程整段扫描时生效；命中缓存或并行检测时片段不带中间帧。
+        长片段的中间帧取法见 SegmentClusterer，与是否真的保留了帧无关。
+        """
+        segments = list(self.iter_segments(
+            video_path, sample_interval, min_laser_frames, pre_context,
+            post_context, merge_gap, workers, sample_fps, adaptive,
+            coarse_interval, cache_dir, keyframes))
+        print(f"提取了 {len(segments)} 个有效片段")
+        return segments
+    
+    def iter_segments(self, video_path: str, sample_interval: int = 3,
+                      min_laser_frames: int = 5, pre_context: float = 3.0,
+                      post_context: float = 5.0, merge_gap: float = 1.0,
+                      workers: int = 1, sample_fps: Optional[float] = None,
+                      adaptive: bool = False, coarse_interval: float = 1.5,
+                      cache_dir: Optional[str] = None,
+                      keyframes: bool = False) -> Iterator[LaserSegment]:
+        """边检测边产出片段，参数与 extract_segments 相同
+
+        扫描位置越过簇内最后一个激光帧 merge_gap 秒后，这个簇就不会再变化，
+        立即产出对应的片段，不必等整个视频扫完。单进程时逐帧推进；并行检测时
+        按分块顺序推进（一个分块及其之前的分块都完成后）；粗到细扫描和命中缓存时
+        要拿到全部激光帧后才开始产出。
+        """
+        cache, key, cached = self._load_cached(video_path, sample_interval, sample_fps,
+                                               adaptive, coarse_interval, merge_gap,
+                                               cache_dir, workers)
+        if cached is not None:
+            laser_frames, fps, total_frames = cached
+            print(f"使用检测缓存: {len(laser_frames)} 个激光帧")
+            source = ((f, None) for f in laser_frames)
+        else:
+            fps, total_frames = self._video_info(video_path)
+            stats = Counter()
+            source = self._iter_laser_frames(video_path, fps, total_frames,
+                                             sample_interval, sample_fps, workers,
+                                             adaptive, coarse_interval, merge_gap, stats)
+        
+        clusterer = SegmentClusterer(self, fps, total_frames, min_laser_frames,
+                                     pre_context, post_context, merge_gap, keyframes)
+        detected = []
+        for entry, frame in source:
+            if entry['points']:
+                detected.append(entry)
+            seg = clusterer.push(entry, frame)
+            if seg is not None:
+                yield seg
+        seg = clusterer.finish()
+        if seg is not None:
+            yield seg
+        
+        if cached is None:
+            self._print_stats(detected, stats)
+            if cache is not None:
+                cache.save(key, detected, fps, total_frames)
+    
+    def adaptive_recall_report(self, video_path: str, sample_interval: int = 3,
+                               min_laser_frames: int = 5, merge_gap: float = 1.0,
+                               workers: int = 1, sample_fps: Optional[float] = None,
+                               coarse_interval: float = 1.5) -> Dict:
+        """以全量密集扫描为基准，评估粗到细扫描的召回率和解码帧数"""
+        results = {}
+        for mode, adaptive in (("dense", False), ("adaptive", True)):
+            t0 = time.perf_counter()
+            laser_frames, fps, total_frames, stats = self._detect_laser_frames(
+                video_path, sample_interval, sample_fps, workers,
+                adaptive, coarse_interval, merge_gap)
+            elapsed = time.perf_counter() - t0
+            segments = self._cluster(laser_frames, fps, total_frames,
+                                     min_laser_frames, 0.0, 0.0, merge_gap)
+            results[mode] = (laser_frames, segments, stats['decoded'], elapsed)
+        
+        dense_frames, dense_segs, dense_decoded, dense_time = results["dense"]
+        fast_frames, fast_segs, fast_decoded, fast_time = results["adaptive"]
+        
+        fast_idx = {f['frame'] for f in fast_frames}
+        frame_hits = sum(1 for f in dense_frames if f['frame'] in fast_idx)
+        
+        # 片段召回：密集扫描的片段与某个自适应片段在时间上有重叠即算找回
+        seg_hits = sum(
+            1 for d in dense_segs
+            if any(f.start_time <= d.end_time and d.start_time <= f.end_time
+                   for f in fast_segs)
+        )
+        exact = sum(1 for d in dense_segs if d in fast_segs)
+        
+        report = {
+            'dense_decoded': dense_decoded,
+            'adaptive_decoded': fast_decoded,
+            'decode_reduction': dense_decoded / fast_decoded if fast_decoded else float('inf'),
+            'dense_seconds': dense_time,
+            'adaptive_seconds': fast_time,
+            'dense_laser_frames': len(dense_frames),
+            'frame_recall': frame_hits / len(dense_frames) if dense_frames else 1.0,
+            'dense_segments': len(dense_segs),
+            'adaptive_segments': len(fast_segs),
+            'segment_recall': seg_hits / len(dense_segs) if dense_segs else 1.0,
+            'identical_segments': exact,
+        }
+        
+        print(f"\n{'='*60}")
+        print("粗到细扫描召回报告（以密集扫描为基准）")
+        print(f"  解码帧数: {dense_decoded} -> {fast_decoded} "
+              f"（减少 {report['decode_reduction']:.1f} 倍）")
+        print(f"  耗时: {dense_time:.1f}s -> {fast_time:.1f}s")
+        print(f"  激光帧召回: {frame_hits}/{len(dense_frames)} "
+              f"({report['frame_recall']:.1%})")
+        print(f"  片段召回: {seg_hits}/{len(dense_segs)} "
+              f"({report['segment_recall']:.1%})，完全一致 {exact} 个")
+        print(f"{'='*60}")
+        return report
+    
+    def _detect_laser_frames(self, video_path: str, sample_interval: int,
+                             sample_fps: Optional[float], workers: int,
+                             adaptive: bool, coarse_interval: float,
+                             merge_gap: float, cache_dir: Optional[str] = None):
+        """逐帧检测，返回 (laser_frames, fps, total_frames, 扫描统计)"""
+        cache, key, cached = self._load_cached(video_path, sample_interval, sample_fps,
+                                               adaptive, coarse_interval, merge_gap,
+                                               cache_dir, workers)
+        if cached is not None:
+            laser_frames, fps, total_frames = cached
+            print(f"使用检测缓存: {len(laser_frames)} 个激光帧")
+            return laser_frames, fps, total_frames, Counter(cache_hits=1)
+        
+        fps, total_frames = self._video_info(video_path)
+        stats = Counter()
+        laser_frames = [entry for entry, _ in self._iter_laser_frames(
+            video_path, fps, total_frames, sample_interval, sample_fps, workers,
+            adaptive, coarse_interval, merge_gap, stats) if entry['points']]
+        
+        self._print_stats(laser_frames, stats)
+        if cache is not None:
+            cache.save(key, laser_frames, fps, total_frames)
+        return laser_frames, fps, total_frames, stats
+    
+    def _load_cached(self, video_path: str, sample_interval: int,
+                     sample_fps: Optional[float], adaptive: bool,
+                     coarse_interval: float, merge_gap: float,
+                     cache_dir: Optional[str], workers: Optional[int] = 1):
+        """返回 (cache, key, 缓存内容)；没有启用缓存或未命中时缓存内容为 None"""
+        if not cache_dir:
+            return None, None, None
+        
+        cache = DetectionCache(cache_dir)
+        sampling = {
+            'sample_interval': sample_interval,
+            'sample_fps': sample_fps,
+            'adaptive': adaptive,
+        }
+        if adaptive:
+            # 粗到细扫描的窗口扩展依赖 merge_gap
+            sampling.update(coarse_interval=coarse_interval, merge_gap=merge_gap)
+        if self.tracking:
+            # 轨迹 ID 按扫描区间编号，分块方式（由进程数决定）不同时 ID 不同
+            sampling['workers'] = max(1, workers or os.cpu_count() or 1)
+        key = cache.key(video_path, {'detector': self.detection_settings(),
+                                     'sampling': sampling})
+        return cache, key, cache.load(key)
+    
+    def _video_info(self, video_path: str) -> Tuple[float, int]:
         cap = cv2.VideoCapture(video_path)
         if not cap.isOpened():
             raise ValueError(f"无法打开视频: {video_path}")
         
         fps = cap.get(cv2.CAP_PROP_FPS)
         total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        cap.release()
         
         print(f"视频信息: {total_frames}帧, {fps:.1f}fps, 时长{total_frames/fps:.1f}秒")
+        return fps, total_frames
+    
+    def _iter_laser_frames(self, video_path: str, fps: float, total_frames: int,
+                           sample_interval: int, sample_fps: Optional[float],
+                           workers: int, adaptive: bool, coarse_interval: float,
+                           merge_gap: float, stats: Counter):
+        """按帧号顺序产出 (采样帧, 帧图像)，扫描统计累加到 stats
+
+        单进程整段扫描时产出每个采样帧（没有激光的 points 为空，帧图像只在本次迭代内
+        有效）；并行检测和粗到细扫描只产出激光帧，帧图像为 None。
+        """
+        if workers is None:
+            workers = os.cpu_count() or 1
+        if total_frames <= 0:
+            # 帧数未知时无法分块
+            workers = 1
         
-        laser_frames = []
-        frame_idx = 0
+        if adaptive:
+            laser_frames, adaptive_stats = self._scan_adaptive(
+                video_path, fps, total_frames, sample_interval, sample_fps,
+                workers, coarse_interval, merge_gap)
+            stats += adaptive_stats
+            for f in laser_frames:
+                yield f, None
+            return
         
-        while True:
-            ret, frame = cap.read()
-            if not ret:
-                break
-            
-            if frame_idx % sample_interval == 0:
-                points = self.detect_frame(frame)
-                if points:
-                    laser_frames.append({
-                        'frame': frame_idx,
-                        'time': frame_idx / fps,
-                        'points': points
-                    })
-            
-            frame_idx += 1
+        if workers > 1:
+            ranges = self._chunk_ranges(total_frames, sample_interval, workers)
+        else:
+            ranges = [(0, None)]
+        yield from self._iter_ranges(video_path, ranges, sample_interval,
+                                     sample_fps, workers, stats)
+    
+    def _print_stats(self, laser_frames: List[Dict], stats: Counter):
+        print(f"检测到 {len(laser_frames)} 个激光帧（解码 {stats['decoded']} 帧）")
+        if stats['prefilter_checked']:
+            print(f"预筛选跳过 {stats['prefilter_rejected']}/{stats['prefilter_checked']} 帧")
+        if stats['static_frames']:
+            print(f"静态画面复用 {stats['static_hits']}/{stats['static_frames']} 帧，"
+                  f"实际检测分块 {stats['tiles_scanned']}/{stats['tiles_total']} "
+                  f"({stats['tiles_scanned'] / stats['tiles_total']:.1%})")
+        if stats['track_full_scans']:
+            print(f"跟踪模式: 窗口检测 {stats['track_window_scans']} 帧，"
+                  f"全帧检测 {stats['track_full_scans']} 帧")
+    
+    def _cluster(self, laser_frames, fps, total_frames, min_laser_frames,
+                 pre_context, post_context, merge_gap):
+        """按时间间隔把激光帧聚成片段"""
+        clusterer = SegmentClusterer(self, fps, total_frames, min_laser_frames,
+                                     pre_context, post_context, merge_gap)
+        segments = []
+        for f in laser_frames:
+            seg = clusterer.push(f)
+            if seg is not None:
+                segments.append(seg)
+        seg = clusterer.finish()
+        if seg is not None:
+            segments.append(seg)
+        return segments
+    
+    def _scan_range(self, video_path: str, sample_interval: int,
+                    sample_fps: Optional[float] = None, start_frame: int = 0,
+                    end_frame: Optional[int] = None):
+        """扫描 [start_frame, end_frame) 区间，返回 (检测到激光的采样帧, 扫描统计)
+
+        end_frame 为 None 时一直读到视频结尾。采样帧的判定基于全局帧号，
+        所以分块扫描与整段扫描得到的采样帧完全一致。
+        """
+        stats = Counter()
+        laser_frames = [entry for entry, _ in self._iter_range(
+            video_path, sample_interval, sample_fps, start_frame, end_frame, stats)
+            if entry['points']]
+        return laser_frames, stats
+    
+    def _iter_range(self, video_path: str, sample_interval: int,
+                    sample_fps: Optional[float], start_frame: int,
+                    end_frame: Optional[int], stats: Counter):
+        """逐个产出 [start_frame, end_frame) 区间内的 (采样帧, 帧图像)
+
+        没有激光的采样帧 points 为空。扫描结束后把统计累加到 stats。
+        跟踪模式的轨迹 ID 从 stats['track_ids'] + 1 开始编号，结束后 stats['track_ids']
+        是已用过的最大 ID，同一个 stats 上连续扫描的多个区间 ID 不重复。
+        """
+        sampler = open_frame_source(video_path, self.prefetch,
+                                    sample_interval=sample_interval,
+                                    sample_fps=sample_fps,
+                                    start_frame=start_frame, end_frame=end_frame)
+        fps = sampler.fps
         
-        cap.release()
-        print(f"检测到 {len(laser_frames)} 个激光帧")
+        prefilter = self.prefilter
+        if prefilter is not None:
+            checked, rejected = prefilter.checked, prefilter.rejected
         
-        if not laser_frames:
-            return []
+        # 跟踪模式优先于静态画面跳过
+        tracker = (LaserTracker(self, first_id=stats['track_ids'] + 1)
+                   if self.tracking else None)
+        cache = StaticFrameCache(self) if self.static_skip and not tracker else None
+        detect = cache.detect if cache is not None else self.detect_frame
         
-        # 聚类
-        segments = []
-        current_group = [laser_frames[0]]
+        frames = iter(sampler)
+        try:
+            for frame_idx, frame in frames:
+                track_ids = None
+                if tracker is not None:
+                    tracked = tracker.update(frame, frame_idx)
+                    points = [p for _, p in tracked]
+                    track_ids = [t for t, _ in tracked]
+                else:
+                    points = detect(frame)
+                entry = {
+                    'frame': frame_idx,
+                    'time': frame_idx / fps,
+                    'points': points
+                }
+                if track_ids is not None:
+                    entry['tracks'] = track_ids
+                yield entry, frame
+        finally:
+            # 消费者提前停止时也要释放解码器和预读线程
+            frames.close()
+        
+        stats['decoded'] += sampler.decoded
+        if prefilter is not None:
+            stats['prefilter_checked'] += prefilter.checked - checked
+            stats['prefilter_rejected'] += prefilter.rejected - rejected
+        if cache is not None:
+            stats['static_frames'] += cache.frames
+            stats['static_hits'] += cache.hits
+            stats['tiles_scanned'] += cache.tiles_scanned
+            stats['tiles_total'] += cache.tiles_total
+        if tracker is not None:
+            stats['track_ids'] = tracker.next_id - 1
+            stats['track_full_scans'] += tracker.full_scans
+            stats['track_window_scans'] += tracker.window_scans
+    
+    def _scan_ranges(self, video_path: str, ranges, sample_interval: int,
+                     sample_fps: Optional[float], workers: int,
+                     stats: Optional[Counter] = None):
+        """扫描多个帧区间（workers > 1 时多进程），按帧号顺序合并结果
+
+        传入 stats 时统计累加到其中（轨迹 ID 也接着其中已用过的编号），并原样返回。
+        """
+        if stats is None:
+            stats = Counter()
+        laser_frames = [entry for entry, _ in self._iter_ranges(
+            video_path, ranges, sample_interval, sample_fps, workers, stats)
+            if entry['points']]
+        laser_frames.sort(key=lambda f: f['frame'])
+        return laser_frames, stats
+    
+    def _iter_ranges(self, video_path: str, ranges, sample_interval: int,
+                     sample_fps: Optional[float], workers: int, stats: Counter):
+        """按区间顺序产出 (采样帧, 帧图像)
+
+        单进程时逐帧产出；多进程时每个区间完成（且之前的区间都已产出）后产出其中的
+        激光帧，帧图像为 None。
+        """
+        if workers > 1 and len(ranges) > 1:
+            print(f"并行检测: {workers} 个进程, {len(ranges)} 个分块")
+            tasks = [(self, video_path, sample_interval, sample_fps, start, end)
+                     for start, end in ranges]
+            # 调用者可能有其他线程（流水线的截图、模型请求、预读线程），fork 会复制
+            # 其他线程持有的锁而死锁，用 spawn 启动子进程
+            with ProcessPoolExecutor(max_workers=workers,
+                                     mp_context=multiprocessing.get_context("spawn")) as pool:
+                # map 按提交顺序返回，前面的区间完成就可以产出，不必等全部完成
+                for chunk, chunk_stats in pool.map(_scan_chunk, tasks):
+                    # 各区间的轨迹 ID 在子进程中从 1 开始编号，合并时接着已用过的 ID
+                    # 顺延（与单进程逐个区间扫描的编号方式相同）；跨区间边界的同一支
+                    # 激光笔会得到两个 ID
+                    offset = stats['track_ids']
+                    for f in chunk:
+                        if 'tracks' in f:
+                            f['tracks'] = [t + offset for t in f['tracks']]
+                    stats += chunk_stats
+                    for f in chunk:
+                        yield f, None
+        else:
+            for start, end in ranges:
+                yield from self._iter_range(video_path, sample_interval, sample_fps,
+                                            start, end, stats)
+    
+    def _chunk_ranges(self, total_frames: int, sample_interval: int, workers: int):
+        """把视频切成对齐到采样间隔的帧区间"""
+        # 块数多于进程数，让快慢不均的块之间可以负载均衡
+        step = max(MIN_CHUNK_FRAMES, -(-total_frames // (workers * 4)))
+        step = -(-step // sample_interval) * sample_interval
+        
+        starts = list(range(0, total_frames, step))
+        ranges = []
+        for i, start in enumerate(starts):
+            # 最后一块读到视频结尾，帧数元数据不准时也不会漏帧
+            end = starts[i + 1] if i + 1 < len(starts) else None
+            ranges.append((start, end))
+        return ranges
+    
+    def _scan_adaptive(self, video_path: str, fps: float, total_frames: int,
+                       sample_interval: int, sample_fps: Optional[float],
+                       workers: int, coarse_interval: float, merge_gap: float):
+        """粗到细扫描
+
+        第一阶段每 coarse_interval 秒取一帧；第二阶段在每个命中帧前后各一个粗扫
+        步长的窗口内按正常采样密度细扫。如果细扫结果在窗口边界 merge_gap 之内仍有
+        激光，就继续向外扩展窗口，保证跨窗口的片段能完整聚类。
+        细扫用的是全局采样网格，所以得到的激光帧是全量扫描结果的子集。
+        """
+        step = max(1, int(round(coarse_interval * fps)))
+        
+        # 第一阶段：稀疏扫描
+        coarse_hits, stats = self._scan_ranges(
+            video_path, [(0, None)], step, None, 1)
+        print(f"粗扫: 每 {step} 帧取一帧，命中 {len(coarse_hits)} 帧")
         
-        for i in range(1, len(laser_frames)):
-            gap = laser_frames[i]['time'] - laser_frames[i-1]['time']
-            if gap <= merge_gap:
-                current_group.append(laser_frames[i])
+        end_limit = total_frames if total_frames > 0 else None
+        pending = _merge_ranges([
+            (max(0, f['frame'] - step), _clip(f['frame'] + step, end_limit))
+            for f in coarse_hits
+        ])
+        
+        # 第二阶段：在命中窗口内细扫，必要时向外扩展
+        covered = []
+        laser_frames = []
+        gap_frames = merge_gap * fps
+        while pending:
+            if workers > 1:
+                tasks = []
+                for start, end in pending:
+                    tasks.extend(
+                        (s, min(s + MIN_CHUNK_FRAMES, end))
+                        for s in range(start, end, MIN_CHUNK_FRAMES))
             else:
-                if len(current_group) >= min_laser_frames:
-                    seg = self._create_segment(current_group, fps, total_frames, 
-                                              pre_context, post_context)
-                    segments.append(seg)
-                current_group = [laser_frames[i]]
-        
-        if len(current_group) >= min_laser_frames:
-            seg = self._create_segment(current_group, fps, total_frames,
-                                      pre_context, post_context)
-            segments.append(seg)
+                tasks = pending
+            # 共用 stats：每一轮细扫的轨迹 ID 接着前一轮编号
+            found, _ = self._scan_ranges(video_path, tasks, sample_interval,
+                                         sample_fps, workers, stats)
+            laser_frames.extend(found)
+            covered = _merge_ranges(covered + pending)
+            
+            hits = sorted(f['frame'] for f in laser_frames)
+            extra = []
+            for start, end in covered:
+                inside = [h for h in hits if start <= h < end]
+                if not inside:
+                    continue
+                if start > 0 and inside[0] - start <= gap_frames:
+                    extra.append((max(0, start - step), start))
+                if (end_limit is None or end < end_limit) and end - inside[-1] <= gap_frames:
+                    extra.append((end, _clip(end + step, end_limit)))
+            pending = _subtract_ranges(_merge_ranges(extra), covered)
         
-        print(f"提取了 {len(segments)} 个有效片段")
-        return segments
+        laser_frames.sort(key=lambda f: f['frame'])
+        return laser_frames, stats
     
     def _create_segment(self, group, fps, total_frames, pre_ctx, post_ctx):
         """创建片段"""
@@ -131,8 +704,11 @@ class LaserDetector:
         end_time = min(total_frames/fps, group[-1]['time'] + post_ctx)
         
         all_positions = []
+        tracks = {}
         for f in group:
             all_positions.extend(f['points'])
+            for track_id, p in zip(f.get('tracks', []), f['points']):
+                tracks.setdefault(track_id, []).append(p)
         
         # 计算边界框
         xs = [p[0] for p in all_positions]
@@ -151,5 +727,131 @@ class LaserDetector:
             laser_duration=group[-1]['time'] - group[0]['time'],
             center_frame=group[len(group)//2]['frame'],
             positions=all_positions,
-            trajectory_box=trajectory_box
-        )
\ No newline at end of file
+            trajectory_box=trajectory_box,
+            tracks=tracks
+        )
+
+
+
+class SegmentClusterer:
+    """增量聚类：逐个接收采样帧，簇结束时返回对应的片段
+
+    与一次性聚类的规则相同：相邻激光帧间隔不超过 merge_gap 的归为一簇，
+    激光帧数不少于 min_laser_frames 的簇才成为片段。没有激光的采样帧
+    （points 为空）只用来推进时间，越过簇末尾 merge_gap 秒后簇就结束了。
+
+    keyframes 为 True 时顺带保留每个片段的中间帧。簇结束前不知道正中是哪一帧，
+    所以只保留簇内均匀分布的样本：序号（簇内第几个激光帧）是 stride 倍数的帧，
+    样本超过 max_frames 个时 stride 翻倍、丢掉一半，内存有上限。簇结束时取样本中
+    离正中最近的一帧作为中间帧（center_frame 也改为这一帧，截图与片段信息一致），
+    激光帧不超过 max_frames 个时就是正中那一帧。stride 只取决于簇的长度，帧源不提供
+    帧图像（并行检测、缓存）时按同样的规则选中间帧，截图时再从视频中读取。
+    """
+
+    def __init__(self, detector, fps: float, total_frames: int,
+                 min_laser_frames: int, pre_context: float, post_context: float,
+                 merge_gap: float, keyframes: bool = False,
+                 max_frames: int = MAX_KEPT_FRAMES):
+        self.detector = detector
+        self.fps = fps
+        self.total_frames = total_frames
+        self.min_laser_frames = min_laser_frames
+        self.pre_context = pre_context
+        self.post_context = post_context
+        self.merge_gap = merge_gap
+        self.keyframes = keyframes
+        self.max_frames = max_frames
+        
+        self._group: List[Dict] = []
+        self._frames: Dict[int, np.ndarray] = {}  # 簇内序号 → 帧图像
+    
+    def push(self, entry: Dict, frame: Optional[np.ndarray] = None) -> Optional[LaserSegment]:
+        """加入一个采样帧，返回因此结束的片段（没有时返回 None）"""
+        seg = None
+        if self._group and entry['time'] - self._group[-1]['time'] > self.merge_gap:
+            seg = self.finish()
+        if not entry['points']:
+            return seg
+        
+        self._group.append(entry)
+        if self.keyframes and frame is not None:
+            stride = self._stride(len(self._group))
+            pos = len(self._group) - 1
+            if pos % stride == 0:
+                # 帧缓冲可能被帧源复用，必须拷贝
+                self._frames[pos] = frame.copy()
+            for kept in [i for i in self._frames if i % stride]:
+                del self._frames[kept]
+        return seg
+    
+    def finish(self) -> Optional[LaserSegment]:
+        """结束当前簇，返回对应的片段（激光帧太少时返回 None）"""
+        group, frames = self._group, self._frames
+        self._group = []
+        self._frames = {}
+        
+        if len(group) < self.min_laser_frames:
+            return None
+        seg = self.detector._create_segment(group, self.fps, self.total_frames,
+                                            self.pre_context, self.post_context)
+        if self.keyframes:
+            pos = self._center(len(group))
+            seg.center_frame = group[pos]['frame']
+            seg.keyframe = frames.get(pos)
+        return seg
+    
+    def _stride(self, n: int) -> int:
+        """n 个激光帧时样本的间隔：最小的 2 的幂，使样本数不超过 max_frames"""
+        stride = 1
+        while -(-n // stride) > self.max_frames:
+            stride *= 2
+        return stride
+    
+    def _center(self, n: int) -> int:
+        """样本中离正中（n // 2）最近的序号，距离相同时取前一个"""
+        stride = self._stride(n)
+        below = n // 2 // stride * stride
+        above = below + stride
+        if above < n and above - n // 2 < n // 2 - below:
+            return above
+        return below
+
+
+def _scan_chunk(args):
+    """进程池入口：每个进程用自己的 VideoCapture 扫描一个帧区间"""
+    detector, video_path, sample_interval, sample_fps, start, end = args
+    return detector._scan_range(video_path, sample_interval, sample_fps, start, end)
+
+
+def _clip(value: int, limit: Optional[int]) -> int:
+    return value if limit is None else min(value, limit)
+
+
+def _merge_ranges(ranges):
+    """合并重叠或相邻的 [start, end) 区间"""
+    merged = []
+    for start, end in sorted(ranges):
+        if start >= end:
+            continue
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def _subtract_ranges(ranges, covered):
+    """从 ranges 中去掉已经被 covered 覆盖的部分"""
+    result = []
+    for start, end in ranges:
+        for c_start, c_end in covered:
+            if c_end <= start or c_start >= end:
+                continue
+            if c_start > start:
+                result.append((start, c_start))
+            start = max(start, c_end)
+            if start >= end:
+                break
+        if start < end:
+            result.append((start, end))
+    return result
@@ -0,0 +1,144 @@
+import numpy as np
+from dataclasses import dataclass
+from typing import List, Tuple
+
+# 预测位置周围的搜索半径（像素）
+TRACK_RADIUS = 100
+# 每隔多少个采样帧强制做一次全帧检测，用于发现新出现的激光点
+FULL_SCAN_EVERY = 15
+# 连续丢失多少帧后删除轨迹
+MAX_MISSES = 2
+
+
+@dataclass
+class Track:
+    track_id: int
+    position: Tuple[float, float]
+    velocity: Tuple[float, float] = (0.0, 0.0)
+    last_frame: int = 0
+    misses: int = 0
+
+    def predict(self, frame_idx: int) -> Tuple[float, float]:
+        """匀速模型预测 frame_idx 时的位置"""
+        dt = frame_idx - self.last_frame
+        return (self.position[0] + self.velocity[0] * dt,
+                self.position[1] + self.velocity[1] * dt)
+
+
+class LaserTracker:
+    """跟踪窗口检测
+
+    根据已有轨迹的位置和速度预测下一帧的位置，只在预测点周围的窗口内检测；
+    没有轨迹、有轨迹丢失或距上次全帧检测已满 full_scan_every 帧时做全帧检测。
+    窗口模式下不会发现窗口外新出现的激光点，要等到下一次全帧检测。
+
+    检测到的点用最近邻贪心匹配到轨迹上，每个点带一个轨迹 ID，
+    多支激光笔同时出现时可以区分。每个扫描区间使用一个独立的实例，first_id 接着
+    之前区间用过的 ID 编号，同一个视频中的轨迹 ID 不重复。
+    """
+
+    def __init__(self, detector, radius: int = TRACK_RADIUS,
+                 full_scan_every: int = FULL_SCAN_EVERY,
+                 max_misses: int = MAX_MISSES, first_id: int = 1):
+        self.detector = detector
+        self.radius = radius
+        self.full_scan_every = full_scan_every
+        self.max_misses = max_misses
+
+        self.tracks: List[Track] = []
+        self.next_id = first_id
+        self.since_full_scan = 0
+        self.lost = False
+
+        # 统计
+        self.full_scans = 0
+        self.window_scans = 0
+
+    def update(self, frame: np.ndarray, frame_idx: int) -> List[Tuple[int, Tuple[int, int]]]:
+        """检测并更新轨迹，返回 [(轨迹ID, 点)]"""
+        h, w = frame.shape[:2]
+        predictions = [t.predict(frame_idx) for t in self.tracks]
+
+        full_scan = (not self.tracks or self.lost or
+                     self.since_full_scan >= self.full_scan_every)
+        if full_scan:
+            points = self.detector.detect_frame(frame)
+            self.full_scans += 1
+            self.since_full_scan = 0
+        else:
+            points = self._detect_windows(frame, predictions, w, h)
+            self.window_scans += 1
+            self.since_full_scan += 1
+
+        matches = self._associate(predictions, points)
+
+        result = []
+        matched_points = set()
+        self.lost = False
+        for track, pred in zip(self.tracks, predictions):
+            idx = matches.get(track.track_id)
+            if idx is None:
+                track.misses += 1
+                self.lost = True
+                continue
+            p = points[idx]
+            matched_points.add(idx)
+            dt = max(1, frame_idx - track.last_frame)
+            track.velocity = ((p[0] - track.position[0]) / dt,
+                              (p[1] - track.position[1]) / dt)
+            track.position = p
+            track.last_frame = frame_idx
+            track.misses = 0
+            result.append((track.track_id, p))
+
+        self.tracks = [t for t in self.tracks if t.misses <= self.max_misses]
+
+        for idx, p in enumerate(points):
+            if idx in matched_points:
+                continue
+            track = Track(self.next_id, p, last_frame=frame_idx)
+            self.next_id += 1
+            self.tracks.append(track)
+            result.append((track.track_id, p))
+
+        return result
+
+    def _detect_windows(self, frame, predictions, w, h):
+        """只在每条轨迹的预测位置附近检测"""
+        prefilter = self.detector.prefilter
+        if prefilter is not None and not prefilter(frame):
+            return []
+
+        points = []
+        r = self.radius
+        for px, py in predictions:
+            x1, y1 = max(0, int(px) - r), max(0, int(py) - r)
+            x2, y2 = min(w, int(px) + r), min(h, int(py) + r)
+            if x1 >= x2 or y1 >= y2:
+                continue
+            found = self.detector._detect_points(
+                frame[y1:y2, x1:x2], (x1, y1),
+                (x1 > 0, y1 > 0, x2 < w, y2 < h))
+            for p in found:
+                if p not in points:
+                    points.append(p)
+        return points
+
+    def _associate(self, predictions, points):
+        """最近邻贪心匹配，返回 {轨迹ID: 点下标}"""
+        pairs = []
+        for track, (px, py) in zip(self.tracks, predictions):
+            for idx, (x, y) in enumerate(points):
+                d = ((x - px) ** 2 + (y - py) ** 2) ** 0.5
+                if d <= self.radius:
+                    pairs.append((d, track.track_id, idx))
+        pairs.sort()
+
+        matches = {}
+        used = set()
+        for _, track_id, idx in pairs:
+            if track_id in matches or idx in used:
+                continue
+            matches[track_id] = idx
+            used.add(idx)
+        return matches
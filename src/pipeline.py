@@ -0,0 +1,257 @@
+import time
+import queue
+import threading
+from collections import deque
+from concurrent.futures import wait
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+# 阶段之间队列的默认容量（片段数）
+QUEUE_SIZE = 4
+# 阻塞的队列操作每隔这么多秒检查一次是否需要停止
+POLL_INTERVAL = 0.1
+
+# 批量请求时，一批凑不满最多等待这么多秒
+BATCH_LINGER = 2.0
+
+_DONE = object()
+_QUEUED = object()
+
+
+@dataclass
+class PipelineItem:
+    """流水线中流动的一个片段"""
+    index: int
+    segment: object
+    content: Optional[Dict] = None
+    qa: Optional[Dict] = None
+    error: Optional[str] = None
+
+
+class _Failure:
+    """某个阶段抛出的异常，沿队列传给消费者重新抛出"""
+
+    def __init__(self, exc: BaseException):
+        self.exc = exc
+
+
+class SegmentPipeline:
+    """分阶段流水线：检测 → 截图 → 视觉模型 → 知识库
+
+    检测、截图、视觉模型各占一个线程，阶段之间用有界队列连接：检测到第一个片段后
+    马上开始截图和调用模型，总耗时接近最慢的阶段而不是各阶段之和。队列满时上游阶段
+    等待，内存占用不会随视频长度增长。视觉模型阶段同时发出至多
+    qa_gen.max_in_flight 个请求（限流和重试由 QAGenerator 的请求引擎负责），
+    qa_gen.batch_size > 1 时把相邻片段凑成一批（最多等 BATCH_LINGER 秒），
+    结果仍按片段顺序交给下游。
+
+    run() 按片段顺序产出已完成视觉分析的 PipelineItem，由调用者写入知识库
+    （通常在主线程中，可以同时与用户交互）。截图或模型调用失败时 error 不为空，
+    截图失败的片段 content 为 None。
+    """
+
+    def __init__(self, detector, analyzer, qa_gen, queue_size: int = QUEUE_SIZE):
+        self.detector = detector
+        self.analyzer = analyzer
+        self.qa_gen = qa_gen
+        self.queue_size = queue_size
+
+        # 统计：各阶段实际工作的秒数、首个结果的延迟、总耗时
+        self.busy = {'detect': 0.0, 'analyze': 0.0, 'vlm': 0.0}
+        self.first_result: Optional[float] = None
+        self.elapsed = 0.0
+
+    def run(self, video_path: str, output_dir: str = "output",
+            segments: Optional[List] = None, skip: Iterable[int] = (),
+            restored: Optional[Dict[int, Tuple[Dict, Dict]]] = None,
+            on_detected: Optional[Callable[[List], None]] = None,
+            **detect_kwargs) -> Iterator[PipelineItem]:
+        """处理一个视频，detect_kwargs 传给 LaserDetector.iter_segments
+
+        从断点恢复时：segments 是之前检测出的片段列表（不再检测）；skip 中的序号
+        （从 1 开始）已处理完，不再产出；restored 的序号 → (截图信息, 模型结果) 直接产出，
+        不再截图和调用模型。on_detected 在检测完成后以完整的片段列表调用（在检测线程中）。
+        """
+        resume = (segments, set(skip), restored or {}, on_detected)
+        stop = threading.Event()
+        detected = queue.Queue(self.queue_size)
+        contents = queue.Queue(self.queue_size)
+        results = queue.Queue(self.queue_size)
+
+        def analyze(item):
+            item.content = self.analyzer.analyze(video_path, item.segment, output_dir)
+            # 截图已写入磁盘，不再需要保留中间帧
+            item.segment.keyframe = None
+
+        threads = [
+            threading.Thread(target=self._detect_stage, daemon=True,
+                             args=(video_path, detect_kwargs, resume, detected, stop)),
+            threading.Thread(target=self._stage, daemon=True,
+                             args=('analyze', analyze, detected, contents, stop)),
+            threading.Thread(target=self._vlm_stage, daemon=True,
+                             args=(contents, results, stop)),
+        ]
+
+        start = time.perf_counter()
+        for t in threads:
+            t.start()
+        try:
+            while True:
+                item = results.get()
+                if item is _DONE:
+                    break
+                if isinstance(item, _Failure):
+                    raise item.exc
+                if self.first_result is None:
+                    self.first_result = time.perf_counter() - start
+                yield item
+        finally:
+            stop.set()
+            # 检测线程要等当前这次扫描告一段落（产出下一个片段或扫完）才能退出；
+            # 不等它退出的话解码器会在解释器退出时被强行终止
+            for t in threads:
+                t.join()
+            self.elapsed = time.perf_counter() - start
+
+    def report(self):
+        if self.first_result is not None:
+            print(f"首个结果: {self.first_result:.1f}s")
+        busy = "，".join(f"{name} {sec:.1f}s" for name, sec in self.busy.items())
+        print(f"总耗时: {self.elapsed:.1f}s（各阶段工作时间: {busy}）")
+
+    def _detect_stage(self, video_path, detect_kwargs, resume, outbox, stop):
+        known, skip, restored, on_detected = resume
+        if known is not None:
+            segments = iter(known)
+        else:
+            segments = self.detector.iter_segments(video_path, **detect_kwargs)
+        found = []
+        index = 0
+        try:
+            while not stop.is_set():
+                t0 = time.perf_counter()
+                seg = next(segments, None)
+                self.busy['detect'] += time.perf_counter() - t0
+                if seg is None:
+                    if known is None and on_detected is not None:
+                        on_detected(found)
+                    break
+                found.append(seg)
+                index += 1
+                if index in skip:
+                    continue
+                item = PipelineItem(index, seg)
+                if index in restored:
+                    item.content, item.qa = restored[index]
+                if not _put(outbox, item, stop):
+                    break
+            _put(outbox, _DONE, stop)
+        except Exception as e:
+            _put(outbox, _Failure(e), stop)
+        finally:
+            if known is None:
+                segments.close()
+
+    def _stage(self, name, fn, inbox, outbox, stop):
+        while True:
+            item = _get(inbox, stop)
+            if item is None:
+                return
+            if (item is not _DONE and not isinstance(item, _Failure) and item.error is None
+                    and item.content is None):
+                t0 = time.perf_counter()
+                try:
+                    fn(item)
+                except Exception as e:
+                    item.error = str(e)
+                self.busy[name] += time.perf_counter() - t0
+            if not _put(outbox, item, stop):
+                return
+            if item is _DONE or isinstance(item, _Failure):
+                return
+
+    def _vlm_stage(self, inbox, outbox, stop):
+        """视觉模型阶段：并发请求（可批量），按进入顺序输出"""
+        batch_size = getattr(self.qa_gen, 'batch_size', 1)
+        limit = getattr(self.qa_gen, 'max_in_flight', 1) * batch_size
+        pending = deque()  # [item, Future / None（直接透传）/ _QUEUED（等待凑批）]
+        batch = []
+        batch_since = 0.0
+        finished = False
+        busy_since = None
+
+        while not stop.is_set():
+            # 队首已完成的先交给下游
+            while pending and (pending[0][1] is None or
+                               (pending[0][1] is not _QUEUED and pending[0][1].done())):
+                item, future = pending.popleft()
+                if future is not None:
+                    try:
+                        item.qa = future.result()
+                    except Exception as e:
+                        item.error = str(e)
+                if item is not _DONE and not isinstance(item, _Failure) and item.content:
+                    # 图片已编码上传，不再需要内存中的截图
+                    item.content.pop('roi_image', None)
+                if not _put(outbox, item, stop):
+                    return
+            if busy_since is not None and not any(f for _, f in pending):
+                self.busy['vlm'] += time.perf_counter() - busy_since
+                busy_since = None
+
+            # 凑满一批、上游已结束、等待超过 BATCH_LINGER 秒或积压已满时发出请求
+            if batch and (len(batch) >= batch_size or finished or len(pending) >= limit or
+                          time.perf_counter() - batch_since >= BATCH_LINGER):
+                if busy_since is None:
+                    busy_since = time.perf_counter()
+                futures = self.qa_gen.submit_images([
+                    (e[0].content['roi_path'], e[0].content['timestamp'],
+                     e[0].content['laser_duration'], e[0].content.get('roi_image'))
+                    for e in batch])
+                for entry, future in zip(batch, futures):
+                    entry[1] = future
+                batch = []
+                continue
+
+            if finished and not pending:
+                return
+            if finished or len(pending) >= limit:
+                wait([pending[0][1]], timeout=POLL_INTERVAL)
+                continue
+
+            try:
+                item = inbox.get(timeout=POLL_INTERVAL)
+            except queue.Empty:
+                continue
+            if item is _DONE or isinstance(item, _Failure):
+                pending.append([item, None])
+                finished = True
+            elif item.error is not None or item.qa is not None:
+                # 出错或从断点恢复的片段直接透传
+                pending.append([item, None])
+            else:
+                entry = [item, _QUEUED]
+                pending.append(entry)
+                if not batch:
+                    batch_since = time.perf_counter()
+                batch.append(entry)
+
+def _put(q: queue.Queue, item, stop: threading.Event) -> bool:
+    """放入队列，队列满时等待；需要停止时返回 False"""
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=POLL_INTERVAL)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def _get(q: queue.Queue, stop: threading.Event):
+    """从队列取出，需要停止时返回 None"""
+    while not stop.is_set():
+        try:
+            return q.get(timeout=POLL_INTERVAL)
+        except queue.Empty:
+            continue
+    return None
@@ -0,0 +1,75 @@
+import cv2
+import numpy as np
+
+
+class FramePrefilter:
+    """帧预筛选器基类
+
+    在完整检测之前调用，返回 False 表示这一帧一定没有激光点，可以直接跳过。
+    子类实现 accepts()；checked / rejected 记录检查过和被拒绝的帧数。
+    """
+
+    def __init__(self):
+        self.checked = 0
+        self.rejected = 0
+
+    def __call__(self, frame: np.ndarray) -> bool:
+        self.checked += 1
+        if self.accepts(frame):
+            return True
+        self.rejected += 1
+        return False
+
+    def accepts(self, frame: np.ndarray) -> bool:
+        raise NotImplementedError
+
+
+class BrightSpotPrefilter(FramePrefilter):
+    """高亮高饱和像素预筛选
+
+    HSV 中 V = max(B, G, R)，S = 255 * (max - min) / max，即通道最大值与
+    最小值之差。检测阈值要求 S >= min_saturation 且 V >= min_value，这是不看
+    色相的必要条件；这里直接用 OpenCV 的 HSV 转换判断，与检测时的取整完全一致。
+
+    检测时掩码要先做 3x3 开运算，能留下来的光斑一定包含一个完整的 3x3 候选
+    像素块（贴着画面边缘时是被截断的块，但一定包含最后一行/列）。每隔 3 行 3 列
+    取样并额外检查最后一行和最后一列，必然能取到这个块中的像素，因此不会误拒。
+
+    检测使用量化查找表（ColorLUT bits<8）时，表按量化格中心的颜色分类，格中其他
+    颜色可能略低于阈值也被接受。lut_bits 设为相同的位数时，取样像素先换成所在格的
+    中心颜色再判断，与查找表的判断条件一致，仍然不会误拒。
+    """
+
+    def __init__(self, min_saturation: int, min_value: int, stride: int = 3,
+                 lut_bits: int = 8):
+        super().__init__()
+        if stride > 3:
+            raise ValueError("stride 超过 3 时可能漏掉 3x3 光斑")
+        if not 1 <= lut_bits <= 8:
+            raise ValueError(f"lut_bits 必须在 1~8 之间: {lut_bits}")
+        self.min_saturation = min_saturation
+        self.min_value = min_value
+        self.stride = stride
+        self.lut_bits = lut_bits
+
+    def accepts(self, frame: np.ndarray) -> bool:
+        s = self.stride
+        h, w = frame.shape[:2]
+        if h % s == 0 and w % s == 0:
+            # 宽高整除时最近邻缩放恰好取到每隔 s 行 s 列的像素，比切片拷贝快
+            sub = cv2.resize(frame, (w // s, h // s), interpolation=cv2.INTER_NEAREST)
+        else:
+            sub = np.ascontiguousarray(frame[::s, ::s])
+        return (self._has_candidate(sub) or
+                self._has_candidate(np.ascontiguousarray(frame[-1:])) or
+                self._has_candidate(np.ascontiguousarray(frame[:, -1:])))
+
+    def _has_candidate(self, pixels: np.ndarray) -> bool:
+        shift = 8 - self.lut_bits
+        if shift:
+            # 与 ColorLUT._representatives 相同：保留高位，低位取格子中心
+            pixels = (pixels & (0xFF << shift & 0xFF)) | (1 << (shift - 1))
+        hsv = cv2.cvtColor(pixels, cv2.COLOR_BGR2HSV)
+        mask = cv2.inRange(hsv, (0, self.min_saturation, self.min_value),
+                           (255, 255, 255))
+        return cv2.countNonZero(mask) > 0
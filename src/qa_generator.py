@@ -1,15 +1,59 @@
 import os
 import json
-import base64
-from typing import Dict
+import cv2
+import numpy as np
+from concurrent.futures import Future
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
 from dotenv import load_dotenv
+from vlm_engine import RequestEngine, MAX_IN_FLIGHT, MAX_RETRIES, default_retryable
+from vlm_cache import ResponseCache, HASH_THRESHOLD, phash
+from image_encoder import ImageEncoder, EncodedImage, build_montage
 
 load_dotenv()
 
+# 回复的最大 token 数
+MAX_TOKENS = 1024
+# 单次请求超时（秒），避免卡住的连接一直占用并发名额
+REQUEST_TIMEOUT = 120
+# TPM 限流用的提示词 token 预估值（图片的 token 数由 ImageEncoder 估算）
+PROMPT_TOKEN_ESTIMATE = 300
+# 提示词版本，修改提示词后递增，旧的缓存回复不再复用
+PROMPT_VERSION = 1
+# 批量请求时回复 token 上限（按标记数累加，不超过这个值）
+MAX_BATCH_TOKENS = 4096
+
+
+def _env_number(name: str, value, default, cast):
+    """参数优先，其次环境变量，最后默认值"""
+    if value is not None:
+        return value
+    raw = os.getenv(name)
+    return cast(raw) if raw else default
+
+
 class QAGenerator:
-    def __init__(self):
-        api_key = os.getenv("OPENAI_API_KEY")
-        base_url = os.getenv("OPENAI_BASE_URL", "https://api.openai.com/v1")
+    def __init__(self, api_key: Optional[str] = None, base_url: Optional[str] = None,
+                 max_in_flight: Optional[int] = None, qps: Optional[float] = None,
+                 tpm: Optional[float] = None, max_retries: Optional[int] = None,
+                 cache_dir: Optional[str] = "output/cache",
+                 cache_threshold: Optional[int] = None,
+                 max_pixels: Optional[int] = None, max_bytes: Optional[int] = None,
+                 batch_size: Optional[int] = None, batch_mode: Optional[str] = None):
+        """未传入的参数从环境变量（.env）读取
+
+        max_in_flight / qps / tpm / max_retries 对应 VLM_MAX_IN_FLIGHT / VLM_QPS /
+        VLM_TPM / VLM_MAX_RETRIES，按服务商的配额设置。
+        cache_dir 不为空时缓存模型回复，相似截图（感知哈希的汉明距离不超过
+        cache_threshold，对应 VLM_CACHE_THRESHOLD）直接复用，不再请求接口。
+        max_pixels / max_bytes（VLM_MAX_PIXELS / VLM_MAX_BYTES）覆盖服务商默认的
+        图片像素和字节预算。
+        batch_size（VLM_BATCH_SIZE）大于 1 时 submit_images 把多个标记合并成一个请求：
+        batch_mode（VLM_BATCH_MODE）为 "images" 时一条消息带多张图片，为 "montage" 时
+        拼成一张带编号的网格图；默认智谱用 montage（GLM-4V 一次只接受一张图），其他用 images。
+        """
+        api_key = api_key or os.getenv("OPENAI_API_KEY")
+        base_url = base_url or os.getenv("OPENAI_BASE_URL", "https://api.openai.com/v1")
         
         if not api_key or api_key == "sk-your-api-key-here":
             raise ValueError("请在 .env 文件中设置 API Key")
@@ -18,26 +62,157 @@ class QAGenerator:
         openai.api_key = api_key
         openai.api_base = base_url
         self.client = openai
+        self.api_key = api_key
+        self.base_url = base_url
+        
+        self.engine = RequestEngine(
+            max_in_flight=_env_number("VLM_MAX_IN_FLIGHT", max_in_flight, MAX_IN_FLIGHT, int),
+            qps=_env_number("VLM_QPS", qps, None, float),
+            tpm=_env_number("VLM_TPM", tpm, None, float),
+            max_retries=_env_number("VLM_MAX_RETRIES", max_retries, MAX_RETRIES, int),
+            is_retryable=self._is_retryable,
+        )
+        self.max_in_flight = self.engine.max_in_flight
+        
+        self.cache = None
+        if cache_dir:
+            self.cache = ResponseCache(cache_dir, _env_number(
+                "VLM_CACHE_THRESHOLD", cache_threshold, HASH_THRESHOLD, int))
         
         # 检测是哪家API
         if "zhipu" in base_url or "bigmodel" in base_url:
             self.api_type = "zhipu"
+            # 智谱 GLM-4V 格式
+            self.model = "glm-4v"
             print("使用智谱 GLM-4V 视觉模型")
         elif "deepseek" in base_url:
             self.api_type = "deepseek"
+            self.model = None
             print("使用 DeepSeek（文本模式，不支持视觉）")
         else:
             self.api_type = "openai"
+            # OpenAI GPT-4V 格式
+            self.model = "gpt-4-vision-preview"
             print(f"使用 OpenAI 兼容 API: {base_url}")
+        
+        self.batch_size = max(1, _env_number("VLM_BATCH_SIZE", batch_size, 1, int))
+        self.batch_mode = (batch_mode or os.getenv("VLM_BATCH_MODE")
+                           or ("montage" if self.api_type == "zhipu" else "images"))
+        if self.batch_mode not in ("images", "montage"):
+            raise ValueError(f"不支持的批量模式: {self.batch_mode}")
+        # 统计：批量请求数、回复无法解析而退回单张请求的批次数
+        # （在请求引擎的多个线程中更新，用 engine.lock 保护）
+        self.batches = 0
+        self.batch_fallbacks = 0
+        
+        self.encoder = ImageEncoder(
+            self.api_type,
+            max_pixels=_env_number("VLM_MAX_PIXELS", max_pixels, None, int),
+            max_bytes=_env_number("VLM_MAX_BYTES", max_bytes, None, int))
     
-    def analyze_image(self, image_path: str, timestamp: str, laser_duration: float) -> Dict:
+    def analyze_image(self, image_path: str, timestamp: str, laser_duration: float,
+                      image: Optional[np.ndarray] = None) -> Dict:
         """
         调用视觉模型分析图片
+        
+        image 为原分辨率的截图区域（ContentAnalyzer 返回的 roi_image）时直接在内存中
+        按预算编码，不再读取 image_path。
+        """
+        try:
+            request = self._prepare(image_path, image)
+        except Exception as e:
+            return self._fallback(e, image_path, timestamp, laser_duration)
+        cached = self._from_cache(request, timestamp)
+        if cached is not None:
+            return cached
+        return self.engine.call(self._request, image_path, timestamp, laser_duration,
+                                request, tokens=self._estimate_tokens(request),
+                                fallback=self._fallback)
+    
+    def submit_image(self, image_path: str, timestamp: str, laser_duration: float,
+                     image: Optional[np.ndarray] = None) -> Future:
+        """在后台线程池中分析图片，返回 Future（结果同 analyze_image）"""
+        try:
+            request = self._prepare(image_path, image)
+        except Exception as e:
+            return _resolved(self._fallback(e, image_path, timestamp, laser_duration))
+        cached = self._from_cache(request, timestamp)
+        if cached is not None:
+            return _resolved(cached)
+        return self.engine.submit(self._request, image_path, timestamp, laser_duration,
+                                  request, tokens=self._estimate_tokens(request),
+                                  fallback=self._fallback)
+    
+    def submit_images(self, images: List[tuple]) -> List[Future]:
+        """提交多张图片，images 的元素为 (image_path, timestamp, laser_duration[, image])
+
+        batch_size > 1 时未命中缓存的图片每 batch_size 张合并成一个请求，
+        回复按标记拆回与 analyze_image 相同格式的结果；批量回复无法解析时退回逐张请求。
+        返回的 Future 与 images 一一对应。
         """
-        # 读取图片转base64
-        with open(image_path, "rb") as f:
-            image_base64 = base64.b64encode(f.read()).decode('utf-8')
+        if self.batch_size <= 1 or self.model is None:
+            return [self.submit_image(*image) for image in images]
         
+        futures: List[Optional[Future]] = [None] * len(images)
+        jobs = []
+        for i, image in enumerate(images):
+            image_path, timestamp, laser_duration = image[:3]
+            roi = image[3] if len(image) > 3 else None
+            try:
+                request = self._prepare(image_path, roi)
+            except Exception as e:
+                futures[i] = _resolved(self._fallback(e, image_path, timestamp, laser_duration))
+                continue
+            cached = self._from_cache(request, timestamp)
+            if cached is not None:
+                futures[i] = _resolved(cached)
+                continue
+            jobs.append((i, (image_path, timestamp, laser_duration, request)))
+        
+        for start in range(0, len(jobs), self.batch_size):
+            group = jobs[start:start + self.batch_size]
+            if len(group) == 1:
+                i, job = group[0]
+                futures[i] = self.engine.submit(self._request, *job,
+                                                tokens=self._estimate_tokens(job[3]),
+                                                fallback=self._fallback)
+                continue
+            group_jobs = [job for _, job in group]
+            group_future = self.engine.submit(
+                self._request_group, group_jobs,
+                tokens=self._estimate_group_tokens(group_jobs),
+                fallback=self._group_fallback)
+            for k, (i, _) in enumerate(group):
+                futures[i] = _child(group_future, k)
+        return futures
+    
+    def analyze_batch(self, images: List[tuple]) -> List[Dict]:
+        """并发分析多张图片，images 为 [(image_path, timestamp, laser_duration)]，结果顺序与输入一致"""
+        return [f.result() for f in self.submit_images(images)]
+    
+    def _prepare(self, image_path: str, image: Optional[np.ndarray]) -> "_ImageRequest":
+        """编码图片并计算缓存用的感知哈希"""
+        if image is None:
+            with open(image_path, "rb") as f:
+                data = f.read()
+            image = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+            if image is None:
+                raise ValueError(f"无法读取截图: {image_path}")
+        encoded = self.encoder.encode(image)
+        image_hash = phash(image) if self.cache is not None else None
+        return _ImageRequest(encoded, image_hash, image.shape[:2], image)
+    
+    def _estimate_tokens(self, request: "_ImageRequest") -> int:
+        """预估一次请求的 token 用量（提示词 + 图片 + 回复上限），用于 TPM 限流"""
+        return PROMPT_TOKEN_ESTIMATE + request.encoded.tokens + MAX_TOKENS
+    
+    def _estimate_group_tokens(self, jobs) -> int:
+        images = sum(job[3].encoded.tokens for job in jobs)
+        return PROMPT_TOKEN_ESTIMATE * 2 + images + min(MAX_BATCH_TOKENS, MAX_TOKENS * len(jobs))
+    
+    def _request(self, image_path: str, timestamp: str, laser_duration: float,
+                 request: "_ImageRequest") -> Dict:
+        """发送一次请求，失败时抛出异常（由请求引擎决定是否重试）"""
         prompt = f"""这是一张学习/工作场景的截图，用户用激光笔做了标记。
 
 标记信息：
@@ -51,63 +226,144 @@ class QAGenerator:
 
 用中文详细描述，让用户一看就能回忆起来当时的情境。"""
 
-        try:
-            if self.api_type == "zhipu":
-                # 智谱 GLM-4V 格式
-                response = self.client.ChatCompletion.create(
-                    model="glm-4v",
-                    messages=[
-                        {
-                            "role": "user",
-                            "content": [
-                                {"type": "text", "text": prompt},
-                                {
-                                    "type": "image_url",
-                                    "image_url": {"url": f"data:image/jpeg;base64,{image_base64}"}
-                                }
-                            ]
-                        }
-                    ],
-                    max_tokens=1024
-                )
-            elif self.api_type == "openai":
-                # OpenAI GPT-4V 格式
-                response = self.client.ChatCompletion.create(
-                    model="gpt-4-vision-preview",
-                    messages=[
+        if self.model is None:
+            # DeepSeek 或其他不支持视觉的，返回提示
+            raise Exception("该API不支持视觉模型")
+        
+        response = self.client.ChatCompletion.create(
+            model=self.model,
+            messages=[
+                {
+                    "role": "user",
+                    "content": [
+                        {"type": "text", "text": prompt},
                         {
-                            "role": "user",
-                            "content": [
-                                {"type": "text", "text": prompt},
-                                {
-                                    "type": "image_url",
-                                    "image_url": {"url": f"data:image/jpeg;base64,{image_base64}"}
-                                }
-                            ]
+                            "type": "image_url",
+                            "image_url": {"url": request.encoded.data_url()}
                         }
-                    ],
-                    max_tokens=1024
-                )
-            else:
-                # DeepSeek 或其他不支持视觉的，返回提示
-                raise Exception("该API不支持视觉模型")
-            
-            description = response.choices[0].message.content
-            
-            return {
-                "ai_description": description,
-                "question": f"【{timestamp}】看到上面的描述，你想起来当时为什么标记这里了吗？",
-                "ai_answer": "【待你回答】",
-                "confidence": "待确认",
-                "tags": ["待分类"],
-                "key_point": "【待你总结】"
-            }
-            
-        except Exception as e:
-            print(f"视觉API调用失败: {e}")
-            # 备用：返回基础信息，让用户手动查看
-            return {
-                "ai_description": f"""【API不支持视觉或调用失败】
+                    ]
+                }
+            ],
+            max_tokens=MAX_TOKENS,
+            api_key=self.api_key,
+            api_base=self.base_url,
+            request_timeout=REQUEST_TIMEOUT
+        )
+        
+        usage = response.get("usage")
+        if usage and "total_tokens" in usage:
+            self.engine.record_usage(self._estimate_tokens(request), usage["total_tokens"])
+        
+        description = response.choices[0].message.content
+        
+        if self.cache is not None:
+            self.cache.put(request.image_hash, request.shape, self._cache_scope(), description)
+        
+        return self._qa(description, timestamp)
+    
+    def _request_group(self, jobs) -> List[Dict]:
+        """一个请求分析多个标记，回复为按编号的 JSON 数组，失败时抛出异常"""
+        if self.model is None:
+            raise Exception("该API不支持视觉模型")
+        
+        n = len(jobs)
+        marks = "\n".join(
+            f"- 标记 #{k}：时间 {timestamp}，标记时长 {laser_duration:.1f}秒"
+            for k, (_, timestamp, laser_duration, _) in enumerate(jobs, 1))
+        if self.batch_mode == "montage":
+            layout = f"这是一张拼图，包含 {n} 张学习/工作场景的截图，每张上方的黄色栏标有编号 #1 到 #{n}"
+            montage = build_montage([job[3].image for job in jobs],
+                                    [f"#{k}" for k in range(1, n + 1)],
+                                    self.encoder.max_pixels)
+            images = [self.encoder.encode(montage)]
+        else:
+            layout = f"下面依次是 {n} 张学习/工作场景的截图，编号 #1 到 #{n}"
+            images = [job[3].encoded for job in jobs]
+        
+        prompt = f"""{layout}，用户在每张截图上用激光笔做了标记。
+
+标记信息（时间越长越重要）：
+{marks}
+
+请对每个标记分别详细描述：
+1. 画面内容：看到了什么？（文字、图表、代码、界面等，尽可能详细转录文字）
+2. 激光标记位置：标记了哪个区域？什么内容？
+3. 推测：用户为什么可能标记这里？
+
+用中文详细描述，让用户一看就能回忆起来当时的情境。
+只输出一个 JSON 数组，每个标记一个元素，格式为 {{"mark": 编号, "description": "描述"}}，不要输出其他内容。"""
+        
+        content = [{"type": "text", "text": prompt}]
+        for k, encoded in enumerate(images, 1):
+            if len(images) > 1:
+                content.append({"type": "text", "text": f"#{k}"})
+            content.append({"type": "image_url", "image_url": {"url": encoded.data_url()}})
+        
+        response = self.client.ChatCompletion.create(
+            model=self.model,
+            messages=[{"role": "user", "content": content}],
+            max_tokens=min(MAX_BATCH_TOKENS, MAX_TOKENS * n),
+            api_key=self.api_key,
+            api_base=self.base_url,
+            request_timeout=REQUEST_TIMEOUT
+        )
+        with self.engine.lock:
+            self.batches += 1
+        
+        usage = response.get("usage")
+        if usage and "total_tokens" in usage:
+            self.engine.record_usage(self._estimate_group_tokens(jobs), usage["total_tokens"])
+        
+        descriptions = _parse_marks(response.choices[0].message.content, n)
+        
+        results = []
+        for (_, timestamp, _, request), description in zip(jobs, descriptions):
+            if self.cache is not None:
+                self.cache.put(request.image_hash, request.shape, self._cache_scope(), description)
+            results.append(self._qa(description, timestamp))
+        return results
+    
+    def _group_fallback(self, error: Exception, jobs) -> List[Future]:
+        """批量请求失败或回复无法解析时逐张请求
+
+        在请求引擎的线程中调用：逐张请求提交回线程池，返回它们的 Future，
+        不占着当前线程等待（_child 会接着等这些 Future）。
+        """
+        print(f"批量分析失败，改为逐张请求: {error}")
+        with self.engine.lock:
+            self.batch_fallbacks += 1
+        return [self.engine.submit(self._request, *job, tokens=self._estimate_tokens(job[3]),
+                                   fallback=self._fallback)
+                for job in jobs]
+    
+    def _qa(self, description: str, timestamp: str) -> Dict:
+        return {
+            "ai_description": description,
+            "question": f"【{timestamp}】看到上面的描述，你想起来当时为什么标记这里了吗？",
+            "ai_answer": "【待你回答】",
+            "confidence": "待确认",
+            "tags": ["待分类"],
+            "key_point": "【待你总结】"
+        }
+    
+    def _cache_scope(self) -> str:
+        return f"{self.model}|v{PROMPT_VERSION}"
+    
+    def _from_cache(self, request: "_ImageRequest", timestamp: str) -> Optional[Dict]:
+        """相似截图已有回复时直接返回结果"""
+        if self.cache is None or self.model is None:
+            return None
+        description = self.cache.get(request.image_hash, request.shape, self._cache_scope())
+        if description is None:
+            return None
+        return self._qa(description, timestamp)
+    
+    def _fallback(self, error: Exception, image_path: str, timestamp: str,
+                  laser_duration: float, request=None) -> Dict:
+        print(f"视觉API调用失败: {error}")
+        # 备用：返回基础信息，让用户手动查看
+        return {
+            "ai_description": f"""【API不支持视觉或调用失败】
 时间：{timestamp}
 标记时长：{laser_duration:.1f}秒
 截图已保存：{image_path}
@@ -115,12 +371,85 @@ class QAGenerator:
 请手动查看上方截图，然后告诉我：
 1. 你看到了什么内容？
 2. 激光标记了哪个位置？""",
-                "question": f"【{timestamp}】看到截图后，你想起来当时为什么标记这里了吗？",
-                "ai_answer": "【待你回答】",
-                "confidence": "低",
-                "tags": ["API失败"],
-                "key_point": "【待补充】"
-            }
+            "question": f"【{timestamp}】看到截图后，你想起来当时为什么标记这里了吗？",
+            "ai_answer": "【待你回答】",
+            "confidence": "低",
+            "tags": ["API失败"],
+            "key_point": "【待补充】"
+        }
+    
+    def _is_retryable(self, error: Exception) -> bool:
+        """限流（429）、服务端错误（5xx）、超时和连接错误可以重试"""
+        errors = self.client.error
+        if isinstance(error, (errors.RateLimitError, errors.ServiceUnavailableError,
+                              errors.TryAgain, errors.Timeout, errors.APIConnectionError)):
+            return True
+        return default_retryable(error)
     
     def reset_memory(self):
-        pass
\ No newline at end of file
+        pass
+
+
+@dataclass
+class _ImageRequest:
+    """编码好的图片及其缓存键"""
+    encoded: EncodedImage
+    image_hash: Optional[int]
+    shape: Tuple[int, int]
+    # 原始截图，拼图时使用
+    image: Optional[np.ndarray] = None
+
+
+def _resolved(value) -> Future:
+    future = Future()
+    future.set_result(value)
+    return future
+
+
+def _child(group_future: Future, index: int) -> Future:
+    """批量请求结果中第 index 个元素的 Future
+
+    元素本身是 Future 时（退回逐张请求）等它完成后再给出结果。
+    """
+    future = Future()
+    
+    def done(f):
+        try:
+            value = f.result()[index]
+        except Exception as e:
+            future.set_exception(e)
+            return
+        if isinstance(value, Future):
+            value.add_done_callback(lambda v: _copy_result(v, future))
+        else:
+            future.set_result(value)
+    
+    group_future.add_done_callback(done)
+    return future
+
+
+def _copy_result(source: Future, target: Future):
+    try:
+        target.set_result(source.result())
+    except Exception as e:
+        target.set_exception(e)
+
+
+def _parse_marks(text: str, count: int) -> List[str]:
+    """从批量回复中解析每个标记的描述，格式不对时抛出 ValueError"""
+    start, end = text.find("["), text.rfind("]")
+    if start < 0 or end <= start:
+        raise ValueError("批量回复中没有 JSON 数组")
+    items = json.loads(text[start:end + 1])
+    
+    descriptions = {}
+    for item in items:
+        if isinstance(item, dict) and isinstance(item.get("description"), str):
+            try:
+                descriptions[int(item.get("mark"))] = item["description"].strip()
+            except (TypeError, ValueError):
+                continue
+    missing = [k for k in range(1, count + 1) if not descriptions.get(k)]
+    if missing:
+        raise ValueError(f"批量回复缺少标记 {missing}")
+    return [descriptions[k] for k in range(1, count + 1)]
@@ -1,91 +1,58 @@
-import json
 import os
-from typing import List, Dict
-from datetime import datetime
+from typing import Dict, Optional
+from datetime import datetime, timedelta
+from knowledge_base import open_knowledge_base
 
 
 class QueryTool:
-    def __init__(self, db_path: str = "output/qa_database.json"):
-        self.db_path = db_path
-        self.data = self._load()
+    """查询知识库
+
+    列表和搜索结果按页显示：每个方法显示一页并返回下一页的游标（没有更多时为 None），
+    把游标传回同一个方法即显示下一页。只读打开知识库，记录在显示时才读取。
+    """
     
-    def _load(self) -> List[Dict]:
-        """加载知识库"""
-        if not os.path.exists(self.db_path):
-            print(f"知识库不存在: {self.db_path}")
-            return []
-        
-        with open(self.db_path, 'r', encoding='utf-8') as f:
-            return json.load(f)
+    def __init__(self, db_path: Optional[str] = None, backend: Optional[str] = None):
+        """backend 为 jsonl / sqlite，为空时按环境变量 KB_BACKEND 选择（默认 jsonl）"""
+        self.kb = open_knowledge_base(backend, db_path, readonly=True)
+        if not self.kb.exists():
+            print(f"知识库不存在: {self.kb.db_path}")
     
-    def list_all(self, limit: int = 20):
+    def list_all(self, limit: int = 20, after_id: Optional[int] = None) -> Optional[int]:
         """列出所有标记"""
-        if not self.data:
-            print("知识库为空")
-            return
-        
-        print(f"\n{'='*70}")
-        print(f"共有 {len(self.data)} 条记录（显示前 {min(limit, len(self.data))} 条）")
-        print(f"{'='*70}")
-        
-        for entry in self.data[:limit]:
-            self._print_entry(entry)
+        return self._show_page(after_id, limit, "知识库为空", "共有 {total} 条记录")
     
-    def search(self, keyword: str):
-        """关键词搜索"""
-        if not self.data:
+    def search(self, keyword: str, limit: int = 20, cursor: Optional[int] = None) -> Optional[int]:
+        """关键词搜索，按相关度排序"""
+        if cursor is None and not self.kb.count():
             print("知识库为空")
-            return
+            return None
         
-        results = []
-        keyword_lower = keyword.lower()
-        
-        for entry in self.data:
-            # 搜索多个字段
-            searchable_text = (
-                entry.get('ai_description', '') +
-                entry.get('your_answer', '') +
-                entry.get('key_point', '') +
-                ' '.join(entry.get('tags', [])) +
-                entry.get('video_file', '')
-            ).lower()
-            
-            if keyword_lower in searchable_text:
-                results.append(entry)
+        results, next_cursor = self.kb.search_page(keyword, cursor or 0, limit)
         
-        if not results:
-            print(f"\n未找到包含 '{keyword}' 的记录")
-            return
-        
-        print(f"\n{'='*70}")
-        print(f"找到 {len(results)} 条包含 '{keyword}' 的记录")
-        print(f"{'='*70}")
+        if cursor is None:
+            if not results:
+                print(f"\n未找到包含 '{keyword}' 的记录")
+                return None
+            print(f"\n{'='*70}")
+            print(f"包含 '{keyword}' 的记录（按相关度排序，每页 {limit} 条）")
+            print(f"{'='*70}")
         
         for entry in results:
             self._print_entry(entry)
+        return next_cursor
     
-    def search_by_tag(self, tag: str):
+    def search_by_tag(self, tag: str, limit: int = 20,
+                      after_id: Optional[int] = None) -> Optional[int]:
         """按标签搜索"""
-        if not self.data:
+        if after_id is None and not self.kb.count():
             print("知识库为空")
-            return
-        
-        results = [e for e in self.data if tag in e.get('tags', [])]
-        
-        if not results:
-            print(f"\n未找到标签为 '{tag}' 的记录")
-            return
-        
-        print(f"\n{'='*70}")
-        print(f"找到 {len(results)} 条标签为 '{tag}' 的记录")
-        print(f"{'='*70}")
-        
-        for entry in results:
-            self._print_entry(entry)
+            return None
+        return self._show_page(after_id, limit, f"\n未找到标签为 '{tag}' 的记录",
+                               f"找到 {{total}} 条标签为 '{tag}' 的记录", tag=tag)
     
     def get_by_id(self, entry_id: int):
         """按 ID 查看详情"""
-        entry = next((e for e in self.data if e['id'] == entry_id), None)
+        entry = self.kb.get(entry_id)
         
         if not entry:
             print(f"未找到 ID 为 {entry_id} 的记录")
@@ -93,44 +60,81 @@ class QueryTool:
         
         self._print_entry(entry, detailed=True)
     
-    def list_tags(self):
-        """列出所有标签"""
-        all_tags = set()
-        for entry in self.data:
-            all_tags.update(entry.get('tags', []))
+    def related(self, entry_id: int, k: int = 10):
+        """查找与指定标记内容相似的标记"""
+        if not self.kb.get(entry_id):
+            print(f"未找到 ID 为 {entry_id} 的记录")
+            return
         
-        if not all_tags:
-            print("暂无标签")
+        results = self.kb.related(entry_id, k)
+        
+        if not results:
+            print(f"\n没有与 [{entry_id}] 相似的记录")
             return
         
         print(f"\n{'='*70}")
-        print(f"共有 {len(all_tags)} 个标签：")
+        print(f"与 [{entry_id}] 最相似的 {len(results)} 条记录")
         print(f"{'='*70}")
         
-        # 统计每个标签的数量
-        tag_counts = {}
-        for tag in all_tags:
-            count = sum(1 for e in self.data if tag in e.get('tags', []))
-            tag_counts[tag] = count
-        
-        # 按数量排序
-        for tag, count in sorted(tag_counts.items(), key=lambda x: x[1], reverse=True):
-            print(f"  {tag}: {count} 条记录")
+        for entry, score in results:
+            print(f"\n   相似度: {score:.2f}")
+            self._print_entry(entry)
     
-    def list_unanswered(self):
-        """列出未回答的标记"""
-        unanswered = [e for e in self.data if e.get('confidence') != '已确认']
+    def list_tags(self):
+        """列出所有标签"""
+        # 每个标签的数量，已按数量排序
+        tag_counts = self.kb.tag_counts()
         
-        if not unanswered:
-            print("所有标记都已回答")
+        if not tag_counts:
+            print("暂无标签")
             return
         
         print(f"\n{'='*70}")
-        print(f"有 {len(unanswered)} 条未回答的标记")
+        print(f"共有 {len(tag_counts)} 个标签：")
         print(f"{'='*70}")
         
-        for entry in unanswered:
+        for tag, count in tag_counts.items():
+            print(f"  {tag}: {count} 条记录")
+    
+    def list_unanswered(self, limit: int = 20, after_id: Optional[int] = None) -> Optional[int]:
+        """列出未回答的标记"""
+        return self._show_page(after_id, limit, "所有标记都已回答",
+                               "有 {total} 条未回答的标记", unanswered=True)
+    
+    def filter_entries(self, tag: Optional[str] = None, video: Optional[str] = None,
+                       unanswered: bool = False, start_date: Optional[str] = None,
+                       end_date: Optional[str] = None, limit: int = 20,
+                       after_id: Optional[int] = None) -> Optional[int]:
+        """组合筛选：标签、视频、未回答、创建日期范围（YYYY-MM-DD，含首尾两天）"""
+        try:
+            since = datetime.fromisoformat(start_date) if start_date else None
+            until = datetime.fromisoformat(end_date) + timedelta(days=1) if end_date else None
+        except ValueError:
+            print("日期格式应为 YYYY-MM-DD")
+            return None
+        
+        filters = {'tag': tag, 'video': video, 'unanswered': unanswered,
+                   'since': since, 'until': until}
+        filters = {k: v for k, v in filters.items() if v}
+        return self._show_page(after_id, limit, "\n没有符合条件的记录",
+                               "找到 {total} 条符合条件的记录", **filters)
+    
+    def _show_page(self, after_id: Optional[int], limit: int, empty: str, header: str,
+                   **filters) -> Optional[int]:
+        """显示 ID 大于 after_id 的一页，第一页前显示总数；返回下一页的游标"""
+        if after_id is None:
+            total = self.kb.count(**filters)
+            if not total:
+                print(empty)
+                return None
+            print(f"\n{'='*70}")
+            print(header.format(total=total) + f"（每页 {limit} 条）")
+            print(f"{'='*70}")
+        
+        entries, next_after_id = self.kb.filter_page(after_id or 0, limit, **filters)
+        for entry in entries:
             self._print_entry(entry)
+        return next_after_id
     
     def _print_entry(self, entry: Dict, detailed: bool = False):
         """打印单条记录"""
@@ -172,18 +176,19 @@ class QueryTool:
     
     def export_to_markdown(self, output_path: str = "output/knowledge_base.md"):
         """导出为 Markdown 文件"""
-        if not self.data:
+        total = self.kb.count()
+        if not total:
             print("知识库为空，无法导出")
             return
         
         lines = [
             "# 激光标记知识库\n",
             f"生成时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n",
-            f"总记录数: {len(self.data)}\n\n",
+            f"总记录数: {total}\n\n",
             "---\n\n"
         ]
         
-        for entry in self.data:
+        for entry in self.kb.iter_all():
             lines.append(f"## [{entry['id']}] {entry['timestamp']}\n\n")
             lines.append(f"**视频**: {entry.get('video_file', '未知')}\n\n")
             lines.append(f"**AI描述**:\n{entry.get('ai_description', '无')}\n\n")
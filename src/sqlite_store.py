@@ -0,0 +1,381 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+from pathlib import Path
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from kb_reader import LegacyFormatError, ReadOnlyKnowledgeBase
+from knowledge_base import DB_PATH, SQLITE_PATH
+from text_index import INDEX_FIELDS, parse_query
+from vector_index import VectorIndex
+
+# 有独立列的字段（按记录中的顺序），其他字段存在 extra（JSON）里
+COLUMNS = ('id', 'video_file', 'timestamp', 'screenshot', 'ai_description', 'question',
+           'your_answer', 'tags', 'key_point', 'confidence', 'created_at', 'updated_at')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    video_file TEXT NOT NULL,
+    timestamp TEXT NOT NULL,
+    screenshot TEXT,
+    ai_description TEXT,
+    question TEXT,
+    your_answer TEXT,
+    tags TEXT,
+    key_point TEXT,
+    confidence TEXT,
+    created_at TEXT,
+    updated_at TEXT,
+    extra TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_entries_video ON entries(video_file);
+CREATE INDEX IF NOT EXISTS idx_entries_confidence ON entries(confidence);
+CREATE INDEX IF NOT EXISTS idx_entries_created ON entries(created_at);
+
+CREATE TABLE IF NOT EXISTS entry_tags (
+    tag TEXT NOT NULL,
+    entry_id INTEGER NOT NULL,
+    PRIMARY KEY (tag, entry_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_entry_tags_entry ON entry_tags(entry_id);
+
+-- 外部内容全文索引：trigram 分词支持中文子串匹配（关键词至少 3 个字符）
+CREATE VIRTUAL TABLE IF NOT EXISTS entries_fts USING fts5(
+    ai_description, your_answer, key_point, tags, video_file,
+    content='entries', content_rowid='id', tokenize='trigram'
+);
+CREATE TRIGGER IF NOT EXISTS entries_ai AFTER INSERT ON entries BEGIN
+    INSERT INTO entries_fts(rowid, ai_description, your_answer, key_point, tags, video_file)
+    VALUES (new.id, new.ai_description, new.your_answer, new.key_point, new.tags, new.video_file);
+END;
+CREATE TRIGGER IF NOT EXISTS entries_ad AFTER DELETE ON entries BEGIN
+    INSERT INTO entries_fts(entries_fts, rowid, ai_description, your_answer, key_point, tags, video_file)
+    VALUES ('delete', old.id, old.ai_description, old.your_answer, old.key_point, old.tags, old.video_file);
+END;
+CREATE TRIGGER IF NOT EXISTS entries_au AFTER UPDATE ON entries BEGIN
+    INSERT INTO entries_fts(entries_fts, rowid, ai_description, your_answer, key_point, tags, video_file)
+    VALUES ('delete', old.id, old.ai_description, old.your_answer, old.key_point, old.tags, old.video_file);
+    INSERT INTO entries_fts(rowid, ai_description, your_answer, key_point, tags, video_file)
+    VALUES (new.id, new.ai_description, new.your_answer, new.key_point, new.tags, new.video_file);
+END;
+"""
+
+# trigram 分词能用全文索引的最短关键词
+MIN_FTS_CHARS = 3
+
+
+class SQLiteKnowledgeBase:
+    """SQLite 存储的知识库，接口与 SimpleKnowledgeBase 相同
+
+    每条记录一行，video_file / confidence / created_at 有索引，标签拆到 entry_tags 表，
+    描述、回答、关键点、标签和视频名建 FTS5 全文索引。查询都在数据库里完成，
+    打开时不加载全部记录。条目 ID 用 AUTOINCREMENT，删除后也不会复用。
+    相似度向量（VectorIndex）在第一次 related() 时才打开，并补上之后新增和修改的记录。
+    readonly 时以只读方式打开，不创建文件也不写向量索引；数据库不存在时相当于空库。
+    """
+
+    def __init__(self, db_path: str = SQLITE_PATH, readonly: bool = False):
+        self.db_path = db_path
+        self.location = db_path
+        self.readonly = readonly
+        self._existed = os.path.exists(db_path)
+        self.lock = threading.Lock()
+        if readonly:
+            if self._existed:
+                uri = Path(os.path.abspath(db_path)).as_uri() + "?mode=ro"
+                self.conn = sqlite3.connect(uri, uri=True, check_same_thread=False)
+            else:
+                # 不存在时用空的内存数据库，查询都返回空结果
+                self.conn = sqlite3.connect(":memory:", check_same_thread=False)
+                self.conn.executescript(SCHEMA)
+        else:
+            os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+            self.conn = sqlite3.connect(db_path, check_same_thread=False)
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.executescript(SCHEMA)
+        self.conn.row_factory = sqlite3.Row
+        self.vectors_path = os.path.splitext(db_path)[0] + ".vectors"
+        self.vectors: Optional[VectorIndex] = None
+
+    def exists(self) -> bool:
+        return self._existed or self.count() > 0
+
+    def add(self, video_file: str, content: dict, qa: dict):
+        entry = {
+            'video_file': video_file,
+            'timestamp': content['timestamp'],
+            'screenshot': content.get('roi_path', ''),
+            'ai_description': qa['ai_description'],
+            'question': qa['question'],
+            'your_answer': qa['ai_answer'],
+            'tags': qa['tags'],
+            'key_point': qa['key_point'],
+            'confidence': qa['confidence'],
+            'created_at': datetime.now().isoformat(),
+        }
+        with self.lock, self.conn:
+            return self._insert(entry)
+
+    def import_entries(self, entries: Iterable[Dict]) -> int:
+        """按原 ID 批量导入（一个事务），返回导入条数"""
+        count = 0
+        with self.lock, self.conn:
+            for entry in entries:
+                self._insert(entry)
+                count += 1
+        return count
+
+    def _insert(self, entry: Dict) -> int:
+        extra = {k: v for k, v in entry.items() if k not in COLUMNS}
+        values = [_column(k, entry.get(k)) for k in COLUMNS]
+        cur = self.conn.execute(
+            f"INSERT INTO entries ({', '.join(COLUMNS)}, extra) "
+            f"VALUES ({', '.join('?' * (len(COLUMNS) + 1))})",
+            values + [json.dumps(extra, ensure_ascii=False) if extra else None])
+        entry_id = cur.lastrowid
+        self._set_tags(entry_id, entry.get('tags') or [])
+        if self.vectors is not None:
+            self.vectors.add(dict(entry, id=entry_id))
+        return entry_id
+
+    def _set_tags(self, entry_id: int, tags: List[str]):
+        self.conn.execute("DELETE FROM entry_tags WHERE entry_id = ?", (entry_id,))
+        self.conn.executemany("INSERT OR IGNORE INTO entry_tags (tag, entry_id) VALUES (?, ?)",
+                              [(tag, entry_id) for tag in tags])
+
+    def get_all(self) -> List[Dict]:
+        return self._query("SELECT * FROM entries ORDER BY id")
+
+    def iter_all(self) -> Iterable[Dict]:
+        """按 ID 顺序逐条返回全部记录"""
+        for row in self.conn.execute("SELECT * FROM entries ORDER BY id"):
+            yield _entry(row)
+
+    def get(self, entry_id: int) -> Optional[Dict]:
+        rows = self._query("SELECT * FROM entries WHERE id = ?", (entry_id,))
+        return rows[0] if rows else None
+
+    def find(self, video_file: str, screenshot: str, timestamp: str) -> Optional[Dict]:
+        """按视频、截图和时间段查找记录，没有时返回 None"""
+        rows = self._query(
+            "SELECT * FROM entries WHERE video_file = ? AND screenshot = ? AND timestamp = ? "
+            "ORDER BY id DESC LIMIT 1", (video_file, screenshot, timestamp))
+        return rows[0] if rows else None
+
+    def update(self, entry_id: int, **fields) -> bool:
+        """修改一条记录的字段（回答、标签、一句话总结等），找不到时返回 False"""
+        fields['updated_at'] = datetime.now().isoformat()
+        with self.lock, self.conn:
+            row = self.conn.execute("SELECT extra FROM entries WHERE id = ?",
+                                    (entry_id,)).fetchone()
+            if row is None:
+                return False
+            extra = json.loads(row['extra']) if row['extra'] else {}
+            extra.update({k: v for k, v in fields.items() if k not in COLUMNS})
+            columns = [k for k in fields if k in COLUMNS and k != 'id']
+            assignments = ", ".join(f"{k} = ?" for k in columns + ['extra'])
+            self.conn.execute(
+                f"UPDATE entries SET {assignments} WHERE id = ?",
+                [_column(k, fields[k]) for k in columns]
+                + [json.dumps(extra, ensure_ascii=False) if extra else None, entry_id])
+            if 'tags' in fields:
+                self._set_tags(entry_id, fields['tags'] or [])
+            if self.vectors is not None:
+                self.vectors.add(self.get(entry_id))
+        return True
+
+    def list_unanswered(self) -> List[Dict]:
+        """未回答（未确认）的记录"""
+        return self.filter(unanswered=True)
+
+    def filter(self, tag: Optional[str] = None, video: Optional[str] = None,
+               unanswered: bool = False, since: Optional[datetime] = None,
+               until: Optional[datetime] = None) -> List[Dict]:
+        """组合筛选：标签 AND 视频 AND 未回答 AND 创建时间在 [since, until) 内，按 ID 排序"""
+        where, params = _filter_clause(tag, video, unanswered, since, until)
+        return self._query(f"SELECT * FROM entries {where} ORDER BY id", params)
+
+    def filter_page(self, after_id: int = 0, limit: int = 20,
+                    **filters) -> Tuple[List[Dict], Optional[int]]:
+        """按 ID 顺序取 ID 大于 after_id 的一页（可带 filter() 的条件）
+
+        返回 (记录列表, 下一页的 after_id)，没有下一页时为 None。
+        """
+        where, params = _filter_clause(**filters)
+        where = (where + " AND" if where else "WHERE") + " id > ?"
+        rows = self._query(f"SELECT * FROM entries {where} ORDER BY id LIMIT ?",
+                           params + [after_id, limit + 1])
+        return rows[:limit], (rows[limit - 1]['id'] if len(rows) > limit else None)
+
+    def count(self, **filters) -> int:
+        """记录数，可带 filter() 的条件"""
+        where, params = _filter_clause(**filters)
+        return self.conn.execute(f"SELECT COUNT(*) FROM entries {where}", params).fetchone()[0]
+
+    def page(self, offset: int = 0, limit: int = 20) -> List[Dict]:
+        """按 ID 顺序取一页记录"""
+        return self._query("SELECT * FROM entries ORDER BY id LIMIT ? OFFSET ?", (limit, offset))
+
+    def search(self, keyword: str) -> List[Dict]:
+        """在描述、回答、关键点、标签和视频名中查找关键词（不区分大小写）
+
+        查询语法与 SimpleKnowledgeBase.search 相同（空格为 AND，OR 分隔可选的几组）。
+        每个词都有 3 个字符以上时走全文索引并按 bm25 排序；有更短的词（如两个汉字）时
+        trigram 索引用不上，退回 LIKE 扫描，按 ID 排序。
+        """
+        sql, params = self._search_sql(keyword)
+        return self._query(sql, params) if sql else []
+
+    def search_page(self, keyword: str, cursor: int = 0,
+                    limit: int = 20) -> Tuple[List[Dict], Optional[int]]:
+        """搜索结果的一页，cursor 是结果中的位置；返回 (记录列表, 下一页的 cursor)"""
+        sql, params = self._search_sql(keyword)
+        if not sql:
+            return [], None
+        rows = self._query(sql + " LIMIT ? OFFSET ?", list(params) + [limit + 1, cursor])
+        return rows[:limit], (cursor + limit if len(rows) > limit else None)
+
+    def _search_sql(self, keyword: str):
+        groups = parse_query(keyword)
+        if not groups:
+            return None, ()
+        if all(len(word) >= MIN_FTS_CHARS for group in groups for word in group):
+            expr = " OR ".join(
+                "(" + " AND ".join('"' + word.replace('"', '""') + '"' for word in group) + ")"
+                for group in groups)
+            return ("SELECT entries.* FROM entries_fts JOIN entries ON entries.id = entries_fts.rowid "
+                    "WHERE entries_fts MATCH ? ORDER BY bm25(entries_fts), entries.id", (expr,))
+
+        params = []
+        group_clauses = []
+        for group in groups:
+            word_clauses = []
+            for word in group:
+                params.append('%' + word.replace('\\', '\\\\').replace('%', '\\%')
+                              .replace('_', '\\_') + '%')
+                word_clauses.append("(" + " OR ".join(
+                    f"{f} LIKE ?{len(params)} ESCAPE '\\'" for f in INDEX_FIELDS) + ")")
+            group_clauses.append("(" + " AND ".join(word_clauses) + ")")
+        return f"SELECT * FROM entries WHERE {' OR '.join(group_clauses)} ORDER BY id", params
+
+    def related(self, entry_id: int, k: int = 10) -> List[Tuple[Dict, float]]:
+        """内容最相似的 k 条记录及余弦相似度，从高到低"""
+        scores = self._open_vectors().related(entry_id, k)
+        rows = {e['id']: e for e in self._query(
+            f"SELECT * FROM entries WHERE id IN ({', '.join('?' * len(scores))})",
+            [i for i, _ in scores])}
+        return [(rows[i], score) for i, score in scores if i in rows]
+
+    def _open_vectors(self) -> VectorIndex:
+        """打开向量索引，补上保存之后新增（ID 更大）和修改过的记录，没有时全部建立"""
+        with self.lock:
+            if self.vectors is None:
+                vectors = VectorIndex.load(self.vectors_path, readonly=self.readonly)
+                sql = "SELECT id, ai_description, key_point FROM entries"
+                params = ()
+                if vectors is not None:
+                    sql += " WHERE id > ? OR updated_at >= ?"
+                    params = (max(vectors.ids, default=0), vectors.saved_at)
+                else:
+                    vectors = VectorIndex()
+                for row in self.conn.execute(sql + " ORDER BY id", params):
+                    vectors.add(dict(row))
+                if not self.readonly:
+                    vectors.save(self.vectors_path)
+                self.vectors = vectors
+        return self.vectors
+
+    def search_by_tag(self, tag: str) -> List[Dict]:
+        return self.filter(tag=tag)
+
+    def tag_counts(self) -> Dict[str, int]:
+        """每个标签的记录数，按数量从多到少排列"""
+        rows = self.conn.execute(
+            "SELECT tag, COUNT(*) FROM entry_tags GROUP BY tag ORDER BY COUNT(*) DESC, tag")
+        return {tag: n for tag, n in rows}
+
+    def close(self):
+        with self.lock:
+            if self.vectors is not None and not self.readonly:
+                self.vectors.save(self.vectors_path)
+            self.conn.close()
+
+    def _query(self, sql: str, params=()) -> List[Dict]:
+        return [_entry(row) for row in self.conn.execute(sql, params)]
+
+
+def _filter_clause(tag: Optional[str] = None, video: Optional[str] = None,
+                   unanswered: bool = False, since: Optional[datetime] = None,
+                   until: Optional[datetime] = None):
+    """filter() 的条件 → (WHERE 子句, 参数)；created_at 是 ISO 格式，可以直接按字符串比较"""
+    clauses, params = [], []
+    if tag is not None:
+        clauses.append("id IN (SELECT entry_id FROM entry_tags WHERE tag = ?)")
+        params.append(tag)
+    if video is not None:
+        clauses.append("video_file = ?")
+        params.append(video)
+    if unanswered:
+        clauses.append("confidence IS NOT '已确认'")
+    if since is not None:
+        clauses.append("created_at >= ?")
+        params.append(since.isoformat())
+    if until is not None:
+        clauses.append("created_at < ?")
+        params.append(until.isoformat())
+    return ("WHERE " + " AND ".join(clauses) if clauses else ""), params
+
+
+def _column(name: str, value):
+    if name == 'tags':
+        return json.dumps(value or [], ensure_ascii=False)
+    return value
+
+
+def _entry(row: sqlite3.Row) -> Dict:
+    """数据库行 → 与 SimpleKnowledgeBase 相同格式的记录"""
+    entry = {}
+    for name in COLUMNS:
+        value = row[name]
+        if name == 'tags':
+            value = json.loads(value) if value else []
+        elif name == 'updated_at' and value is None:
+            continue
+        entry[name] = value
+    if row['extra']:
+        entry.update(json.loads(row['extra']))
+    return entry
+
+
+def migrate_to_sqlite(db_path: str = DB_PATH, sqlite_path: str = SQLITE_PATH) -> int:
+    """把追加日志格式（或原 JSON 文件）的知识库导入 SQLite，保留原 ID，返回导入条数"""
+    # 只读打开：不建索引，也不启动后台压缩
+    try:
+        source = ReadOnlyKnowledgeBase(db_path)
+    except LegacyFormatError:
+        # 原 JSON 文件直接导入，不必先迁移成追加日志格式
+        source = None
+    else:
+        if not source.exists():
+            raise ValueError(f"知识库不存在: {db_path}")
+    target = SQLiteKnowledgeBase(sqlite_path)
+    try:
+        if target.count():
+            raise ValueError(f"目标数据库不为空: {sqlite_path}")
+        if source is None:
+            with open(db_path, 'r', encoding='utf-8') as f:
+                entries = json.load(f)
+        else:
+            entries = source.iter_all()
+        start = time.time()
+        count = target.import_entries(entries)
+        print(f"已导入 {count} 条记录到 {sqlite_path}，耗时 {time.time() - start:.1f}s")
+        return count
+    finally:
+        target.close()
+        if source is not None:
+            source.close()
@@ -0,0 +1,273 @@
+import os
+import re
+import json
+import math
+from array import array
+from collections import Counter
+from typing import Dict, List, Optional, Set, Tuple
+
+# 索引文件格式版本
+INDEX_VERSION = 1
+# 参与检索的字段
+INDEX_FIELDS = ('ai_description', 'your_answer', 'key_point', 'tags', 'video_file')
+# BM25 参数
+BM25_K1 = 1.2
+BM25_B = 0.75
+# 子串查找用的词片段最长字符数
+GRAM_LEN = 3
+
+# 连续的中日文字符，或由字母、数字、下划线组成的词
+_TOKEN_RE = re.compile(r'[぀-ヿ㐀-䶿一-鿿豈-﫿]+|[a-z0-9_]+')
+
+
+def _is_cjk(text: str) -> bool:
+    return not ('a' <= text[0] <= 'z' or '0' <= text[0] <= '9' or text[0] == '_')
+
+
+def tokenize(text: str) -> List[str]:
+    """中日文按相邻两字切分（单独一个字时保留单字），字母数字按词切分，统一小写"""
+    tokens = []
+    for run in _TOKEN_RE.findall(text.lower()):
+        if _is_cjk(run) and len(run) > 1:
+            tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+        else:
+            tokens.append(run)
+    return tokens
+
+
+def _grams(term: str):
+    """词里所有长度 1 到 GRAM_LEN 的子串"""
+    return {term[i:i + n] for n in range(1, GRAM_LEN + 1) for i in range(len(term) - n + 1)}
+
+
+def parse_query(query: str) -> List[List[str]]:
+    """把查询拆成 OR 连接的若干组，组内的词都要出现（AND）
+
+    词之间用空格分隔，默认是 AND；OR（或 |）分隔不同的组，AND 可以省略。
+    例如 "动态规划 OR 递归 python" → [['动态规划'], ['递归', 'python']]
+    """
+    groups, group = [], []
+    for word in query.split():
+        if word.upper() == 'OR' or word == '|':
+            if group:
+                groups.append(group)
+            group = []
+        elif word.upper() != 'AND':
+            group.append(word)
+    if group:
+        groups.append(group)
+    return groups
+
+
+def entry_text(entry: Dict) -> str:
+    """参与检索的字段拼成的文本，字段之间换行分隔，关键词不会跨字段匹配"""
+    return "\n".join(' '.join(entry.get(f) or []) if f == 'tags' else entry.get(f) or ''
+                     for f in INDEX_FIELDS)
+
+
+def matches(entry: Dict, query: str) -> bool:
+    """用原文确认记录符合查询：某一组的每个词都连续出现在同一个字段中（不区分大小写）"""
+    text = entry_text(entry).lower()
+    return any(all(word.lower() in text for word in group) for group in parse_query(query))
+
+
+class TextIndex:
+    """倒排索引，纯 Python 实现，按 BM25 排序
+
+    每次建索引给文档分配一个内部编号（docno），倒排表是 词 → (docno 数组, 词频数组)，
+    都是只追加的 array，每条倒排 6 个字节。记录被修改时重新建索引并分配新编号，
+    旧编号标记为失效（doc_entry 中记为 -1），查询时跳过，保存时清理。
+
+    查询词按 tokenize 切分后要求所有片段都出现；单个汉字匹配包含它的所有双字片段，
+    英文词匹配包含它的所有词（与 matches() 的子串语义一致，"net" 能找到 "resnet"）。
+    结果是候选，片段不一定连续，需要用 matches() 确认。
+    子串查找不扫描整个词表：另有一个 词片段（1 到 3 个字符）→ 词 的索引，不超过 3 个字符的
+    查询词直接取出包含它的词，更长的从对应词最少的三字片段中逐个确认，第一次查询时才建立。
+    """
+
+    def __init__(self):
+        self.postings: Dict[str, Tuple[array, array]] = {}
+        self.doc_entry = array('i')  # docno → 条目 ID，失效为 -1
+        self.doc_len = array('i')    # docno → 片段数
+        self.current: Dict[int, int] = {}  # 条目 ID → 当前 docno
+        self.total_len = 0
+        self.generation = 0
+        self._terms_by_gram: Optional[Dict[str, Set[str]]] = None
+
+    def add(self, entry: Dict):
+        """建立（或重建）一条记录的索引"""
+        entry_id = entry['id']
+        old = self.current.get(entry_id)
+        if old is not None:
+            self.doc_entry[old] = -1
+            self.total_len -= self.doc_len[old]
+
+        counts = Counter(tokenize(entry_text(entry)))
+        docno = len(self.doc_entry)
+        self.doc_entry.append(entry_id)
+        self.doc_len.append(sum(counts.values()))
+        self.total_len += self.doc_len[docno]
+        self.current[entry_id] = docno
+        for term, tf in counts.items():
+            posting = self.postings.get(term)
+            if posting is None:
+                posting = self.postings[term] = (array('i'), array('H'))
+                if self._terms_by_gram is not None:
+                    self._add_grams(term)
+            posting[0].append(docno)
+            posting[1].append(min(tf, 65535))
+
+    def search(self, query: str) -> List[Tuple[int, float]]:
+        """返回候选 [(条目 ID, 得分)]，按得分从高到低排列"""
+        scores: Dict[int, float] = {}
+        for group in parse_query(query):
+            group_scores = None
+            for word in group:
+                word_scores = self._word_scores(word)
+                if group_scores is None:
+                    group_scores = word_scores
+                else:
+                    group_scores = {e: s + word_scores[e] for e, s in group_scores.items()
+                                    if e in word_scores}
+                if not group_scores:
+                    break
+            for entry_id, score in (group_scores or {}).items():
+                scores[entry_id] = scores.get(entry_id, 0.0) + score
+        return sorted(scores.items(), key=lambda x: (-x[1], x[0]))
+
+    def _word_scores(self, word: str) -> Dict[int, float]:
+        terms = list(dict.fromkeys(tokenize(word)))
+        if not terms:
+            # 只有标点等不切分的字符，所有记录都是候选，交给 matches() 确认
+            return {entry_id: 0.0 for entry_id in self.current}
+        n_docs = len(self.current)
+        avg_len = self.total_len / max(1, n_docs)
+        postings = sorted((self._lookup(t) for t in terms), key=len)
+
+        result = None
+        for posting in postings:
+            idf = math.log(1 + (n_docs - len(posting) + 0.5) / (len(posting) + 0.5))
+            term_scores = {}
+            for docno, tf in posting.items():
+                entry_id = self.doc_entry[docno]
+                if entry_id < 0 or (result is not None and entry_id not in result):
+                    continue
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * self.doc_len[docno] / avg_len)
+                term_scores[entry_id] = idf * tf * (BM25_K1 + 1) / (tf + norm)
+            if result is None:
+                result = term_scores
+            else:
+                result = {e: s + term_scores[e] for e, s in result.items() if e in term_scores}
+            if not result:
+                return {}
+        return result
+
+    def _lookup(self, term: str) -> Dict[int, int]:
+        """docno → 词频；单个汉字合并包含它的双字片段，英文词合并包含它的所有词"""
+        if not _is_cjk(term) or len(term) == 1:
+            # 中日文片段里没有字母数字，字母数字词里也没有汉字，包含它的词不会跨类
+            terms = self._terms_containing(term)
+        elif term in self.postings:
+            terms = [term]
+        else:
+            terms = []
+        merged: Dict[int, int] = {}
+        for t in terms:
+            docnos, tfs = self.postings[t]
+            for docno, tf in zip(docnos, tfs):
+                merged[docno] = merged.get(docno, 0) + tf
+        return merged
+
+    def _terms_containing(self, text: str) -> List[str]:
+        """词表中包含 text 的所有词"""
+        if self._terms_by_gram is None:
+            self._terms_by_gram = {}
+            for term in self.postings:
+                self._add_grams(term)
+        if len(text) <= GRAM_LEN:
+            return list(self._terms_by_gram.get(text, ()))
+        # 取最少的那个三字片段对应的词逐个确认
+        candidates = min((self._terms_by_gram.get(text[i:i + GRAM_LEN], ())
+                          for i in range(len(text) - GRAM_LEN + 1)), key=len)
+        return [t for t in candidates if text in t]
+
+    def _add_grams(self, term: str):
+        for gram in _grams(term):
+            self._terms_by_gram.setdefault(gram, set()).add(term)
+
+    def freeze(self):
+        """当前状态的快照（只记录每个倒排表的长度），供 save() 在后台线程中写入"""
+        return (self.doc_entry[:], self.doc_len[:],
+                {t: len(p[0]) for t, p in self.postings.items()})
+
+    def save(self, path: str, frozen=None, generation: Optional[int] = None):
+        """写入索引文件（写临时文件后原子替换），失效的倒排在这时清理
+
+        文件格式：首行 JSON 元数据，之后依次是 docno → 条目 ID、docno → 长度、
+        词表（UTF-8，换行分隔）、每个词的倒排数、全部 docno、全部词频。
+        """
+        doc_entry, doc_len, lengths = frozen or self.freeze()
+        has_stale = any(e < 0 for e in doc_entry)
+        terms, counts = [], array('i')
+        all_docnos, all_tfs = array('i'), array('H')
+        for term, n in lengths.items():
+            docnos, tfs = self.postings[term]
+            docnos, tfs = docnos[:n], tfs[:n]
+            if has_stale:
+                keep = [i for i, d in enumerate(docnos) if doc_entry[d] >= 0]
+                if len(keep) < n:
+                    docnos = array('i', (docnos[i] for i in keep))
+                    tfs = array('H', (tfs[i] for i in keep))
+            if not docnos:
+                continue
+            terms.append(term)
+            counts.append(len(docnos))
+            all_docnos.extend(docnos)
+            all_tfs.extend(tfs)
+
+        vocab = "\n".join(terms).encode('utf-8')
+        header = {'version': INDEX_VERSION, 'docs': len(doc_entry), 'terms': len(terms),
+                  'postings': len(all_docnos), 'vocab_bytes': len(vocab),
+                  'generation': self.generation if generation is None else generation}
+        tmp_path = path + ".tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(json.dumps(header).encode('utf-8') + b"\n")
+            for data in (doc_entry, doc_len):
+                data.tofile(f)
+            f.write(vocab)
+            for data in (counts, all_docnos, all_tfs):
+                data.tofile(f)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> Optional["TextIndex"]:
+        """读取索引文件，不存在或版本不符时返回 None"""
+        if not os.path.exists(path):
+            return None
+        index = cls()
+        with open(path, 'rb') as f:
+            try:
+                header = json.loads(f.readline())
+            except ValueError:
+                return None
+            if header.get('version') != INDEX_VERSION:
+                return None
+            index.doc_entry.fromfile(f, header['docs'])
+            index.doc_len.fromfile(f, header['docs'])
+            terms = f.read(header['vocab_bytes']).decode('utf-8').split("\n")
+            counts = array('i')
+            counts.fromfile(f, header['terms'])
+            docnos, tfs = array('i'), array('H')
+            docnos.fromfile(f, header['postings'])
+            tfs.fromfile(f, header['postings'])
+
+        offset = 0
+        for term, n in zip(terms, counts):
+            index.postings[term] = (docnos[offset:offset + n], tfs[offset:offset + n])
+            offset += n
+        for docno, entry_id in enumerate(index.doc_entry):
+            if entry_id >= 0:
+                index.current[entry_id] = docno
+                index.total_len += index.doc_len[docno]
+        index.generation = header['generation']
+        return index
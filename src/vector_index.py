@@ -0,0 +1,232 @@
+import os
+import json
+import zlib
+import threading
+from array import array
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+# 索引文件格式版本
+VECTOR_VERSION = 1
+# 向量维数（字符 n-gram 哈希到这么多个桶）
+VECTOR_DIM = 1024
+NGRAM_SIZES = (2, 3)
+# 未填写的关键点，不参与相似度
+PLACEHOLDERS = ('【待你总结】', '【待补充】')
+# 记录数比上次计算 IDF 时翻倍后重新计算 IDF 并重新加权
+REWEIGHT_GROWTH = 2
+# 分块处理整个矩阵时每块的行数
+CHUNK_ROWS = 8192
+
+
+def vector_text(entry: Dict) -> str:
+    """参与相似度计算的文本：AI 描述 + 关键点"""
+    key_point = entry.get('key_point') or ''
+    if key_point in PLACEHOLDERS:
+        key_point = ''
+    return ' '.join(f"{entry.get('ai_description') or ''} {key_point}".lower().split())
+
+
+def term_frequencies(text: str, dim: int = VECTOR_DIM) -> np.ndarray:
+    """字符 n-gram 按 crc32 哈希分桶，返回次线性词频 1 + log(tf)（float32）"""
+    buckets = [zlib.crc32(text[i:i + n].encode('utf-8')) % dim
+               for n in NGRAM_SIZES for i in range(len(text) - n + 1)]
+    counts = np.bincount(np.array(buckets, dtype=np.int64), minlength=dim).astype(np.float32)
+    nonzero = counts > 0
+    counts[nonzero] = 1 + np.log(counts[nonzero])
+    return counts
+
+
+def _normalize(rows: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(rows, axis=-1, keepdims=True)
+    return np.divide(rows, norms, out=np.zeros_like(rows), where=norms > 0)
+
+
+class VectorIndex:
+    """本地相似度索引：哈希字符 n-gram 的 TF-IDF 向量，余弦相似度
+
+    每条记录一行 float32 向量（已乘 IDF 并归一化），整个矩阵连续存放，保存后以
+    np.memmap 映射磁盘文件，不全部读入内存。查询相似记录是一次矩阵乘向量
+    再取前 k 个。新记录追加一行；记录被修改时原地重算该行。
+
+    IDF 不随每条记录变化：记录数比上次计算时翻倍后，按当前文档频率重新计算 IDF，
+    各行乘以 新 IDF / 旧 IDF 再归一化（归一化与缩放无关，不需要原始词频）。
+
+    文件：<path>.f32 是矩阵（行数为容量，按需翻倍扩展），<path>.meta 首行 JSON 元数据，
+    之后是行号 → 条目 ID、文档频率、IDF。映射后的修改直接写进 .f32，元数据只在保存时
+    更新，所以第一次修改前先创建 <path>.dirty，保存元数据后删除；打开时它还在
+    （上次没保存就崩溃了），文档频率按矩阵中的行重新统计，重放日志时才不会重复累加。
+    """
+
+    def __init__(self, dim: int = VECTOR_DIM):
+        self.dim = dim
+        self.matrix = np.zeros((0, dim), dtype=np.float32)
+        self.path: Optional[str] = None  # 保存前矩阵在内存中，保存后映射 <path>.f32
+        self.rows = 0
+        self.ids = array('i')
+        self.row_of: Dict[int, int] = {}
+        self.df = np.zeros(dim, dtype=np.int64)
+        self.idf = np.ones(dim, dtype=np.float32)
+        self.idf_docs = 0
+        self.generation = 0
+        self.saved_at: Optional[str] = None
+        self.dirty: Optional[str] = None  # 已创建的 .dirty 文件
+        self.lock = threading.RLock()
+
+    def add(self, entry: Dict):
+        """加入（或重算）一条记录的向量"""
+        tf = term_frequencies(vector_text(entry), self.dim)
+        with self.lock:
+            self._mark_dirty()
+            row = self.row_of.get(entry['id'])
+            if row is None:
+                self._reserve(self.rows + 1)
+                row = self.rows
+                self.rows += 1
+                self.ids.append(entry['id'])
+                self.row_of[entry['id']] = row
+            else:
+                self.df -= self.matrix[row] > 0
+            self.df += tf > 0
+            self.matrix[row] = _normalize(tf * self.idf)
+            if self.rows >= REWEIGHT_GROWTH * self.idf_docs:
+                self._reweight()
+
+    def related(self, entry_id: int, k: int = 10) -> List[Tuple[int, float]]:
+        """与一条记录最相似的 k 条，返回 [(条目 ID, 余弦相似度)]，不含自身和相似度为 0 的"""
+        with self.lock:
+            row = self.row_of.get(entry_id)
+            if row is None:
+                return []
+            scores = self.matrix[:self.rows] @ np.array(self.matrix[row])
+            scores[row] = -1
+            return self._top_k(scores, k)
+
+    def similar(self, text: str, k: int = 10) -> List[Tuple[int, float]]:
+        """与一段文本最相似的 k 条记录"""
+        query = _normalize(term_frequencies(' '.join(text.lower().split()), self.dim) * self.idf)
+        with self.lock:
+            return self._top_k(self.matrix[:self.rows] @ query, k)
+
+    def _top_k(self, scores: np.ndarray, k: int) -> List[Tuple[int, float]]:
+        if k < len(scores):
+            top = np.argpartition(-scores, k)[:k]
+        else:
+            top = np.arange(len(scores))
+        top = top[np.argsort(-scores[top], kind='stable')]
+        return [(self.ids[i], float(scores[i])) for i in top if scores[i] > 0]
+
+    def _reserve(self, rows: int):
+        """容量不足时翻倍扩展；已映射文件时先解除映射、扩展文件再重新映射"""
+        capacity = len(self.matrix)
+        if rows <= capacity:
+            return
+        capacity = max(1024, capacity * 2, rows)
+        if self.path is None:
+            matrix = np.zeros((capacity, self.dim), dtype=np.float32)
+            matrix[:self.rows] = self.matrix[:self.rows]
+            self.matrix = matrix
+            return
+        self.matrix.flush()
+        self.matrix = None
+        with open(self.path + ".f32", 'r+b') as f:
+            f.truncate(capacity * self.dim * 4)
+        self.matrix = np.memmap(self.path + ".f32", dtype=np.float32, mode='r+',
+                                shape=(capacity, self.dim))
+
+    def _mark_dirty(self):
+        if self.path is not None and self.dirty != self.path + ".dirty":
+            open(self.path + ".dirty", 'wb').close()
+            self.dirty = self.path + ".dirty"
+
+    def _count_df(self) -> np.ndarray:
+        df = np.zeros(self.dim, dtype=np.int64)
+        for start in range(0, self.rows, CHUNK_ROWS):
+            df += (self.matrix[start:min(start + CHUNK_ROWS, self.rows)] > 0).sum(axis=0)
+        return df
+
+    def _reweight(self):
+        """按当前文档频率重算 IDF，分块重新加权并归一化所有行"""
+        chunks = [slice(start, min(start + CHUNK_ROWS, self.rows))
+                  for start in range(0, self.rows, CHUNK_ROWS)]
+        df = self._count_df()
+        idf = (np.log((1 + self.rows) / (1 + df)) + 1).astype(np.float32)
+        factor = idf / self.idf
+        for chunk in chunks:
+            self.matrix[chunk] = _normalize(self.matrix[chunk] * factor)
+        self.df, self.idf, self.idf_docs = df, idf, self.rows
+        if self.path is not None:
+            # IDF 已经写进矩阵，元数据要同步，否则下次打开时加权不一致
+            self._write_meta(self.path)
+
+    def freeze(self):
+        # 保存时直接写当前状态：索引只会比快照新，打开时补建日志中的记录即可
+        return None
+
+    def save(self, path: str, frozen=None, generation: Optional[int] = None):
+        """矩阵落盘（第一次保存时写出文件并改为映射），再原子替换元数据文件"""
+        with self.lock:
+            if generation is not None:
+                self.generation = generation
+            if self.path != path:
+                capacity = max(len(self.matrix), 1024)
+                matrix = np.memmap(path + ".f32", dtype=np.float32, mode='w+',
+                                   shape=(capacity, self.dim))
+                matrix[:self.rows] = self.matrix[:self.rows]
+                self.matrix, self.path = matrix, path
+            self.matrix.flush()
+            self._write_meta(path)
+
+    def _write_meta(self, path: str):
+        self.saved_at = datetime.now().isoformat()
+        header = {'version': VECTOR_VERSION, 'dim': self.dim, 'rows': self.rows,
+                  'capacity': len(self.matrix), 'idf_docs': self.idf_docs,
+                  'generation': self.generation, 'saved_at': self.saved_at}
+        tmp_path = path + ".meta.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(json.dumps(header).encode('utf-8') + b"\n")
+            self.ids.tofile(f)
+            self.df.tofile(f)
+            self.idf.tofile(f)
+        os.replace(tmp_path, path + ".meta")
+        if self.dirty == path + ".dirty":
+            os.remove(self.dirty)
+            self.dirty = None
+
+    @classmethod
+    def load(cls, path: str, readonly: bool = False) -> Optional["VectorIndex"]:
+        """读取元数据并映射矩阵文件，不存在或版本不符时返回 None
+
+        readonly 为 True 时以写时复制方式映射：之后的 add 只改内存，不写回文件。
+        """
+        if not (os.path.exists(path + ".meta") and os.path.exists(path + ".f32")):
+            return None
+        with open(path + ".meta", 'rb') as f:
+            try:
+                header = json.loads(f.readline())
+            except ValueError:
+                return None
+            if header.get('version') != VECTOR_VERSION:
+                return None
+            index = cls(header['dim'])
+            index.ids.fromfile(f, header['rows'])
+            index.df = np.fromfile(f, dtype=np.int64, count=index.dim)
+            index.idf = np.fromfile(f, dtype=np.float32, count=index.dim)
+        capacity = os.path.getsize(path + ".f32") // (index.dim * 4)
+        if capacity < header['rows']:
+            return None
+        index.matrix = np.memmap(path + ".f32", dtype=np.float32, mode='c' if readonly else 'r+',
+                                 shape=(capacity, index.dim))
+        index.path = None if readonly else path
+        index.rows = header['rows']
+        index.row_of = {entry_id: row for row, entry_id in enumerate(index.ids)}
+        index.idf_docs = header['idf_docs']
+        index.generation = header['generation']
+        index.saved_at = header['saved_at']
+        if os.path.exists(path + ".dirty"):
+            # 上次修改过矩阵但没保存元数据，文档频率以矩阵为准
+            index.df = index._count_df()
+            index.dirty = None if readonly else path + ".dirty"
+        return index
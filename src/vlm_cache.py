@@ -0,0 +1,232 @@
+import os
+import json
+import threading
+import cv2
+import numpy as np
+from collections import OrderedDict
+from typing import Dict, List, Optional, Set, Tuple
+
+# 感知哈希边长：取 DCT 左上角 HASH_SIZE x HASH_SIZE 的低频系数，共 HASH_SIZE² 位
+HASH_SIZE = 16
+# 汉明距离不超过这个值视为同一画面（256 位哈希）。同一张截图重新编码、轻微缩放或
+# 调亮度后距离一般在 4 以内；但只改了一两个字的幻灯片距离可能只有 0~16，感知哈希
+# 无法可靠区分。阈值越大越容易把这样的截图当成同一张而复用别的回复，越小则命中越少
+HASH_THRESHOLD = 4
+# 宽高比相差超过这个比例时不复用（不同形状的截图内容一定不同）
+ASPECT_TOLERANCE = 0.1
+# 缓存容量：条目数和回复文本总字节数
+MAX_ENTRIES = 2000
+MAX_BYTES = 20 * 2 ** 20
+CACHE_FILE = "vlm_cache.jsonl"
+# 旧版本的缓存文件（整个 JSON 数组），加载时迁移
+LEGACY_CACHE_FILE = "vlm_cache.json"
+# 日志行数超过 条目数 * COMPACT_RATIO + COMPACT_SLACK 时重写
+COMPACT_RATIO = 2
+COMPACT_SLACK = 100
+
+
+def phash(image: np.ndarray, hash_size: int = HASH_SIZE) -> int:
+    """DCT 感知哈希
+
+    灰度图缩小到 (4 * hash_size)² 后做 DCT，取左上角的低频系数，
+    大于中位数（不含直流分量）的记为 1。压缩噪声、轻微缩放和亮度变化基本不影响结果。
+    """
+    if image.ndim == 3:
+        image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    size = hash_size * 4
+    small = cv2.resize(image, (size, size), interpolation=cv2.INTER_AREA)
+    low = cv2.dct(small.astype(np.float32))[:hash_size, :hash_size].flatten()
+    bits = low > np.median(low[1:])
+    return int.from_bytes(np.packbits(bits).tobytes(), 'big')
+
+
+def hamming(a: int, b: int) -> int:
+    return bin(a ^ b).count('1')
+
+
+class ResponseCache:
+    """视觉模型回复的持久化缓存，按截图的感知哈希查找
+
+    同一张幻灯片被反复标记、或者同一个视频调参后重新处理时，截图几乎相同，
+    直接复用之前的回复，不再调用付费接口。条目按 scope（模型名 + 提示词版本）隔离，
+    哈希的汉明距离不超过 threshold 且宽高比接近时命中。超过条目数或总字节数上限时
+    淘汰最久未使用的条目。线程安全。
+
+    查找用多段索引：哈希切成 threshold + 1 段，距离不超过 threshold 的两个哈希至少
+    有一段完全相同，所以只需比较与查询哈希某一段相同的条目，不必逐条计算距离。
+
+    文件是追加写的日志：每次写入追加一行条目，命中追加一行 {"use": 键} 记录使用顺序，
+    加载时按顺序重放（淘汰也随之重现）。行数比条目数多出较多时按当前内容重写。
+    多个进程共用缓存目录时，重写前其他进程追加的行可能丢失，只会少几条缓存。
+    """
+
+    def __init__(self, cache_dir: str = "output/cache", threshold: int = HASH_THRESHOLD,
+                 max_entries: int = MAX_ENTRIES, max_bytes: int = MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.path = os.path.join(cache_dir, CACHE_FILE)
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+
+        # 键为 "scope|哈希"，按最近使用排序（最久未使用的在前）
+        self.entries: "OrderedDict[str, Dict]" = OrderedDict()
+        self.bytes = 0
+        # 多段索引：(scope, 段号, 段的值) → 键集合
+        self.segments = _segments(HASH_SIZE * HASH_SIZE, threshold + 1)
+        self.index: Dict[Tuple[str, int, int], Set[str]] = {}
+        self.lines = 0  # 日志文件中的行数
+        self._log = None
+
+        # 统计
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._load()
+
+    def get(self, image_hash: int, shape: Tuple[int, int], scope: str) -> Optional[str]:
+        """查找相似截图的回复，没有时返回 None"""
+        aspect = shape[1] / max(1, shape[0])
+        with self.lock:
+            candidates = set()
+            for key in self._index_keys(scope, image_hash):
+                candidates |= self.index.get(key, set())
+            best = None
+            for key in candidates:
+                entry = self.entries[key]
+                if abs(entry['aspect'] - aspect) > ASPECT_TOLERANCE * aspect:
+                    continue
+                dist = hamming(image_hash, int(entry['hash'], 16))
+                if dist <= self.threshold and (best is None or (dist, key) < best):
+                    best = (dist, key)
+            if best is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            key = best[1]
+            self.entries.move_to_end(key)
+            self._append({'use': key})
+            return self.entries[key]['response']
+
+    def put(self, image_hash: int, shape: Tuple[int, int], scope: str, response: str):
+        entry = {
+            'scope': scope,
+            'hash': f"{image_hash:x}",
+            'aspect': shape[1] / max(1, shape[0]),
+            'response': response,
+        }
+        with self.lock:
+            self._insert(entry)
+            self._evict()
+            self._append(entry)
+
+    def report(self):
+        total = self.hits + self.misses
+        if total:
+            print(f"视觉模型缓存: 命中 {self.hits}/{total} ({self.hits / total:.0%})，"
+                  f"缓存 {len(self.entries)} 条，淘汰 {self.evictions} 条")
+
+    def close(self):
+        with self.lock:
+            if self._log is not None:
+                self._log.close()
+                self._log = None
+
+    def _index_keys(self, scope: str, image_hash: int):
+        return [(scope, i, (image_hash >> shift) & mask)
+                for i, (shift, mask) in enumerate(self.segments)]
+
+    def _insert(self, entry: Dict):
+        key = f"{entry['scope']}|{entry['hash']}"
+        if key in self.entries:
+            self._remove(key)
+        self.entries[key] = entry
+        self.bytes += _size(entry)
+        for index_key in self._index_keys(entry['scope'], int(entry['hash'], 16)):
+            self.index.setdefault(index_key, set()).add(key)
+
+    def _remove(self, key: str) -> Dict:
+        entry = self.entries.pop(key)
+        self.bytes -= _size(entry)
+        for index_key in self._index_keys(entry['scope'], int(entry['hash'], 16)):
+            keys = self.index[index_key]
+            keys.discard(key)
+            if not keys:
+                del self.index[index_key]
+        return entry
+
+    def _evict(self):
+        while self.entries and (len(self.entries) > self.max_entries
+                                or self.bytes > self.max_bytes):
+            self._remove(next(iter(self.entries)))
+            self.evictions += 1
+
+    def _load(self):
+        legacy = os.path.join(self.cache_dir, LEGACY_CACHE_FILE)
+        if os.path.exists(self.path):
+            with open(self.path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    self.lines += 1
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # 写到一半中断的最后一行
+                        continue
+                    if 'use' in record:
+                        if record['use'] in self.entries:
+                            self.entries.move_to_end(record['use'])
+                    else:
+                        self._insert(record)
+                        self._evict()
+        elif os.path.exists(legacy):
+            try:
+                with open(legacy, 'r', encoding='utf-8') as f:
+                    items = json.load(f)
+            except (OSError, ValueError):
+                items = []
+            for entry in items:
+                self._insert(entry)
+            self._evict()
+            self._compact()
+            os.remove(legacy)
+        self.evictions = 0
+        if self.lines > len(self.entries) * COMPACT_RATIO + COMPACT_SLACK:
+            self._compact()
+
+    def _append(self, record: Dict):
+        if self._log is None:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            self._log = open(self.path, 'a', encoding='utf-8')
+        self._log.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self._log.flush()
+        self.lines += 1
+        if self.lines > len(self.entries) * COMPACT_RATIO + COMPACT_SLACK:
+            self._compact()
+
+    def _compact(self):
+        """按当前内容重写日志（按最近使用顺序，重放后 LRU 顺序不变）"""
+        if self._log is not None:
+            self._log.close()
+            self._log = None
+        os.makedirs(self.cache_dir, exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            for entry in self.entries.values():
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        os.replace(tmp_path, self.path)
+        self.lines = len(self.entries)
+
+
+def _segments(bits: int, count: int) -> List[Tuple[int, int]]:
+    """把 bits 位的哈希尽量均匀地切成 count 段，返回每段的 (右移位数, 掩码)"""
+    count = max(1, min(count, bits))
+    segments, shift = [], 0
+    for i in range(count):
+        width = bits // count + (1 if i < bits % count else 0)
+        segments.append((shift, (1 << width) - 1))
+        shift += width
+    return segments
+
+
+def _size(entry: Dict) -> int:
+    return len(entry['response'].encode('utf-8'))
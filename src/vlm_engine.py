@@ -0,0 +1,170 @@
+import time
+import random
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, List, Optional
+
+# 默认同时进行的请求数
+MAX_IN_FLIGHT = 4
+# 默认重试次数（不含第一次请求）
+MAX_RETRIES = 4
+# 指数退避的初始等待和上限（秒）
+BACKOFF_BASE = 1.0
+BACKOFF_MAX = 30.0
+
+
+class TokenBucket:
+    """令牌桶限流
+
+    令牌以 rate 个/秒的速度补充，最多积累 capacity 个。acquire() 在令牌不足时阻塞，
+    可以预支（令牌数变为负数），后续请求要等欠账补上才能继续。线程安全。
+    """
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else rate
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, amount: float = 1.0):
+        """取出 amount 个令牌；超过桶容量的请求在桶满时放行并记为欠账"""
+        need = min(amount, self.capacity)
+        while True:
+            with self.lock:
+                self._refill()
+                if self.tokens >= need:
+                    self.tokens -= amount
+                    return
+                wait = (need - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def adjust(self, amount: float):
+        """按实际用量修正：amount > 0 退还多扣的令牌，< 0 补扣"""
+        with self.lock:
+            self._refill()
+            self.tokens = min(self.capacity, self.tokens + amount)
+
+
+class RequestEngine:
+    """并发、限流、自动重试的请求执行器
+
+    用线程池同时执行至多 max_in_flight 个请求；qps / tpm 不为空时用令牌桶把请求速率
+    和 token 用量控制在服务商的配额以内。请求抛出可重试的错误（429、5xx，
+    由 is_retryable 判断）时按指数退避加随机抖动重试，服务端给出 Retry-After 时
+    至少等待这么久。map() 的结果顺序与输入一致。
+    """
+
+    def __init__(self, max_in_flight: int = MAX_IN_FLIGHT, qps: Optional[float] = None,
+                 tpm: Optional[float] = None, max_retries: int = MAX_RETRIES,
+                 backoff_base: float = BACKOFF_BASE, backoff_max: float = BACKOFF_MAX,
+                 is_retryable: Optional[Callable[[Exception], bool]] = None):
+        self.max_in_flight = max(1, max_in_flight)
+        self.qps_bucket = TokenBucket(qps, max(1.0, qps)) if qps else None
+        # TPM 按秒补充，桶容量为一分钟的配额
+        self.tpm_bucket = TokenBucket(tpm / 60.0, tpm) if tpm else None
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.is_retryable = is_retryable or default_retryable
+
+        self.pool = ThreadPoolExecutor(max_workers=self.max_in_flight)
+        self.lock = threading.Lock()
+
+        # 统计：请求次数（含重试）、重试次数、最终失败次数
+        self.requests = 0
+        self.retries = 0
+        self.failures = 0
+
+    def call(self, fn: Callable, *args, tokens: float = 0,
+             fallback: Optional[Callable] = None, **kwargs):
+        """在当前线程中执行一次请求，限流并在失败时重试
+
+        tokens 是这次请求预估的 token 用量，用于 TPM 限流，拿到实际用量后可以用
+        record_usage() 修正。重试用尽或遇到不可重试的错误时，有 fallback 则返回 fallback(错误, *args, **kwargs)，否则抛出。
+        """
+        attempt = 0
+        while True:
+            if self.qps_bucket is not None:
+                self.qps_bucket.acquire()
+            if self.tpm_bucket is not None and tokens:
+                self.tpm_bucket.acquire(tokens)
+
+            with self.lock:
+                self.requests += 1
+            try:
+                result = fn(*args, **kwargs)
+            except Exception as e:
+                if attempt >= self.max_retries or not self.is_retryable(e):
+                    with self.lock:
+                        self.failures += 1
+                    if fallback is not None:
+                        return fallback(e, *args, **kwargs)
+                    raise
+                delay = self._backoff(attempt, e)
+                attempt += 1
+                with self.lock:
+                    self.retries += 1
+                time.sleep(delay)
+                continue
+            return result
+
+    def record_usage(self, estimated: float, used: float):
+        """用实际 token 用量修正 TPM 限流的预估"""
+        if self.tpm_bucket is not None:
+            self.tpm_bucket.adjust(estimated - used)
+
+    def submit(self, fn: Callable, *args, tokens: float = 0,
+               fallback: Optional[Callable] = None, **kwargs) -> Future:
+        """提交到线程池执行 call()，返回 Future"""
+        return self.pool.submit(self.call, fn, *args, tokens=tokens,
+                                fallback=fallback, **kwargs)
+
+    def map(self, fn: Callable, arg_list: List[tuple], tokens: float = 0,
+            fallback: Optional[Callable] = None) -> List:
+        """并发执行 fn(*args)，按输入顺序返回结果
+
+        没有 fallback 时，有请求最终失败就抛出它的异常。
+        """
+        futures = [self.submit(fn, *args, tokens=tokens, fallback=fallback)
+                   for args in arg_list]
+        return [f.result() for f in futures]
+
+    def shutdown(self):
+        self.pool.shutdown(wait=True)
+
+    def _backoff(self, attempt: int, error: Exception) -> float:
+        """指数退避 + 全抖动：在 [0, min(上限, 初始值 * 2^attempt)] 中随机取值"""
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+        retry_after = _retry_after(error)
+        if retry_after is not None:
+            delay = max(delay, min(retry_after, self.backoff_max))
+        return delay
+
+
+def default_retryable(error: Exception) -> bool:
+    """HTTP 429 和 5xx 可以重试"""
+    status = _status_code(error)
+    return status is not None and (status == 429 or status >= 500)
+
+
+def _status_code(error: Exception) -> Optional[int]:
+    for attr in ('http_status', 'status_code', 'status'):
+        status = getattr(error, attr, None)
+        if isinstance(status, int):
+            return status
+    return None
+
+
+def _retry_after(error: Exception) -> Optional[float]:
+    headers = getattr(error, 'headers', None) or {}
+    try:
+        value = headers.get('Retry-After') or headers.get('retry-after')
+        return float(value) if value is not None else None
+    except (AttributeError, TypeError, ValueError):
+        return None
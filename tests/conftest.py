@@ -0,0 +1,33 @@
+import sys
+from pathlib import Path
+
+import cv2
+import numpy as np
+import pytest
+
+sys.path.append(str(Path(__file__).parent.parent / "src"))
+
+
+@pytest.fixture
+def make_video(tmp_path):
+    """生成带红色激光点的测试视频
+
+    spans 是 [(开始秒, 结束秒, (x, y), (每秒 dx, 每秒 dy))]，时间段内画一个匀速移动的
+    红点；背景是灰色加一段文字，便于区分不同位置的截图。返回视频路径。
+    """
+    def make(spans, seconds: float, fps: int = 30, size=(320, 240), name="video.avi"):
+        path = str(tmp_path / name)
+        writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"MJPG"), fps, size)
+        for i in range(int(seconds * fps)):
+            t = i / fps
+            frame = np.full((size[1], size[0], 3), 60, np.uint8)
+            cv2.putText(frame, f"slide {int(t)}", (10, 30), cv2.FONT_HERSHEY_SIMPLEX,
+                        0.8, (200, 200, 200), 2)
+            for start, end, (x, y), (dx, dy) in spans:
+                if start <= t < end:
+                    center = (int(x + dx * (t - start)), int(y + dy * (t - start)))
+                    cv2.circle(frame, center, 4, (0, 0, 255), -1)
+            writer.write(frame)
+        writer.release()
+        return path
+    return make
@@ -0,0 +1,26 @@
+from laser_detector import LaserDetector
+
+# 三次指点，之间的空白远长于粗扫间隔
+SPANS = [(1.0, 3.0, (40, 60), (20, 0)), (8.0, 9.5, (120, 40), (0, 20)),
+         (15.0, 16.0, (80, 90), (-20, 0))]
+
+
+def test_adaptive_scan_finds_dense_segments(make_video):
+    video = make_video(SPANS, seconds=18, size=(160, 120))
+    detector = LaserDetector(laser_color="red")
+    dense = detector.extract_segments(video)
+    adaptive = detector.extract_segments(video, adaptive=True, coarse_interval=0.5)
+
+    assert len(dense) == len(SPANS)
+    assert adaptive == dense
+
+
+def test_recall_report(make_video):
+    video = make_video(SPANS, seconds=18, size=(160, 120))
+    report = LaserDetector(laser_color="red").adaptive_recall_report(
+        video, coarse_interval=0.5)
+
+    assert report['segment_recall'] == 1.0
+    assert report['frame_recall'] == 1.0
+    assert report['identical_segments'] == report['dense_segments'] == len(SPANS)
+    assert report['adaptive_decoded'] < report['dense_decoded']
@@ -0,0 +1,105 @@
+import os
+from concurrent.futures import Future
+
+from batch_runner import BatchRunner, BatchState, DONE, FAILED, STATE_FILE
+from checkpoint import VideoCheckpoint
+from knowledge_base import SimpleKnowledgeBase
+
+SPANS = [(0.5, 1.5, (40, 120), (50, 0)), (3.0, 4.0, (200, 60), (0, 40)),
+         (5.5, 6.5, (120, 180), (-40, 0))]
+
+
+class StubQAGenerator:
+    """不调用接口，按时间段直接返回结果"""
+
+    def __init__(self):
+        self.requests = 0
+
+    def submit_images(self, images):
+        futures = []
+        for image_path, timestamp, laser_duration, *_ in images:
+            self.requests += 1
+            future = Future()
+            future.set_result({
+                "ai_description": f"描述 {timestamp}",
+                "question": f"问题 {timestamp}",
+                "ai_answer": "【待你回答】",
+                "confidence": "中",
+                "tags": ["测试"],
+                "key_point": "要点",
+            })
+            futures.append(future)
+        return futures
+
+
+class Crash(Exception):
+    pass
+
+
+def test_resume_after_crash_between_add_and_mark(make_video, tmp_path, monkeypatch):
+    """写入知识库后、记录条目 ID 前中断，重新运行既不重复也不丢失记录"""
+    video = make_video(SPANS, seconds=7.5)
+    output_dir = str(tmp_path / "output")
+    db_path = str(tmp_path / "kb" / "qa_database.json")
+    runner_args = dict(laser_color="red", jobs=1, output_dir=output_dir,
+                       cache_dir=str(tmp_path / "cache"))
+
+    calls = []
+    mark_saved = VideoCheckpoint.mark_saved
+
+    def crash_on_second(self, index, entry_id):
+        calls.append(index)
+        if len(calls) == 2:
+            raise Crash()
+        mark_saved(self, index, entry_id)
+
+    kb = SimpleKnowledgeBase(db_path, fsync=False)
+    monkeypatch.setattr(VideoCheckpoint, "mark_saved", crash_on_second)
+    summary = BatchRunner(StubQAGenerator(), kb, **runner_args).run([video])
+    kb.close()
+    assert summary[FAILED] == 1
+    assert BatchState(str(tmp_path / "output" / STATE_FILE)).status(video) == FAILED
+    monkeypatch.setattr(VideoCheckpoint, "mark_saved", mark_saved)
+    # 第二条已经写入知识库，但断点里没有它的条目 ID
+    kb = SimpleKnowledgeBase(db_path, fsync=False)
+    assert len(kb.get_all()) == 2
+
+    qa_gen = StubQAGenerator()
+    summary = BatchRunner(qa_gen, kb, **runner_args).run([video])
+    entries = kb.get_all()
+    kb.close()
+
+    assert summary[DONE] == 1
+    # 三个片段都已在上次分析过，不再请求视觉模型
+    assert qa_gen.requests == 0
+    assert len(entries) == len(SPANS)
+    assert len({e['timestamp'] for e in entries}) == len(SPANS)
+    assert [e['id'] for e in entries] == [1, 2, 3]
+
+
+def test_save_failure_marks_video_failed_and_continues(make_video, tmp_path, monkeypatch):
+    """一个视频写入知识库时出错，标记为失败，其余视频照常完成"""
+    videos = [make_video(SPANS[:1], seconds=2, name=f"video{i}.avi") for i in range(3)]
+    db_path = str(tmp_path / "kb" / "qa_database.json")
+    output_dir = str(tmp_path / "output")
+
+    save_entry = VideoCheckpoint.save_entry
+
+    def fail_second_video(self, kb, index, name, content, qa):
+        if name == "video1.avi":
+            raise Crash("磁盘已满")
+        return save_entry(self, kb, index, name, content, qa)
+
+    kb = SimpleKnowledgeBase(db_path, fsync=False)
+    monkeypatch.setattr(VideoCheckpoint, "save_entry", fail_second_video)
+    summary = BatchRunner(StubQAGenerator(), kb, laser_color="red", jobs=1,
+                          output_dir=output_dir, cache_dir=str(tmp_path / "cache")).run(videos)
+    entries = kb.get_all()
+    kb.close()
+
+    assert summary[DONE] == 2
+    assert summary[FAILED] == 1
+    state = BatchState(str(tmp_path / "output" / STATE_FILE))
+    assert [state.status(v) for v in videos] == [DONE, FAILED, DONE]
+    assert state.videos[os.path.abspath(videos[1])]['error'] == "磁盘已满"
+    assert sorted(e['video_file'] for e in entries) == ["video0.avi", "video2.avi"]
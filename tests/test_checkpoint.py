@@ -0,0 +1,69 @@
+from checkpoint import VideoCheckpoint
+from laser_detector import LaserSegment
+
+SETTINGS = {'laser_color': "red"}
+
+
+def _segment(start):
+    return LaserSegment(start_time=start, end_time=start + 2.0, laser_duration=1.0,
+                        center_frame=int(start * 30) + 30, positions=[(10, 20), (12, 22)],
+                        trajectory_box=(10, 20, 12, 22), tracks={1: [(10, 20), (12, 22)]})
+
+
+def _content(index):
+    return {'timestamp': f"00:0{index}", 'roi_path': f"roi_{index}.jpg", 'laser_duration': 1.0}
+
+
+class StubKB:
+    def __init__(self):
+        self.entries = []
+
+    def add(self, video_file, content, qa):
+        self.entries.append((video_file, content['roi_path'], content['timestamp']))
+        return len(self.entries)
+
+    def find(self, video_file, screenshot, timestamp):
+        key = (video_file, screenshot, timestamp)
+        return {'id': self.entries.index(key) + 1} if key in self.entries else None
+
+
+def _open(video, tmp_path, settings=SETTINGS):
+    return VideoCheckpoint(video, settings, str(tmp_path / "checkpoints"), None)
+
+
+def test_resume_skips_saved_and_reuses_analyzed(make_video, tmp_path):
+    video = make_video([], seconds=0.5)
+    segments = [_segment(1.0), _segment(5.0), _segment(9.0)]
+    checkpoint = _open(video, tmp_path)
+    assert checkpoint.segments is None and not checkpoint.is_started()
+    checkpoint.set_segments(segments)
+    for index in (1, 2):
+        checkpoint.record(index, _content(index), {'ai_description': f"描述 {index}"})
+    kb = StubKB()
+    checkpoint.save_entry(kb, 1, "video.avi", _content(1), {})
+    # 第 2 条写入知识库后、记录条目 ID 前中断
+    kb.add("video.avi", _content(2), {})
+
+    resumed = _open(video, tmp_path)
+    assert resumed.segments == segments
+    assert resumed.saved() == {1: 1}
+    assert list(resumed.analyzed()) == [2]
+    assert resumed.analyzed()[2]['qa'] == {'ai_description': "描述 2"}
+    assert not resumed.is_complete()
+
+    # 已分析的片段在知识库里找到同一条记录，不重复写入；新片段正常写入
+    assert resumed.save_entry(kb, 2, "video.avi", _content(2), {}) == 2
+    resumed.record(3, _content(3), {'ai_description': "描述 3"})
+    assert resumed.save_entry(kb, 3, "video.avi", _content(3), {}) == 3
+    assert len(kb.entries) == 3
+    assert _open(video, tmp_path).is_complete()
+
+
+def test_changed_settings_discard_progress(make_video, tmp_path):
+    video = make_video([], seconds=0.5)
+    checkpoint = _open(video, tmp_path)
+    checkpoint.set_segments([_segment(1.0)])
+    checkpoint.record(1, _content(1), {})
+
+    assert _open(video, tmp_path, {'laser_color': "green"}).segments is None
+    assert _open(video, tmp_path).segments is not None
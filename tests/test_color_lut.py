@@ -0,0 +1,42 @@
+import cv2
+import numpy as np
+import pytest
+
+from color_lut import ColorLUT
+from laser_detector import LaserDetector
+
+
+def _hsv_boundary_frame():
+    """HSV 阈值附近的颜色：每个通道取边界值和两侧各一，转回 BGR"""
+    hues = [0, 9, 10, 11, 34, 35, 36, 85, 86, 159, 160, 161, 179]
+    levels = [99, 100, 101, 254, 255]
+    hsv = np.array([[h, s, v] for h in hues for s in levels for v in levels],
+                   np.uint8).reshape(1, -1, 3)
+    return cv2.cvtColor(hsv, cv2.COLOR_HSV2BGR)
+
+
+@pytest.mark.parametrize("color", ["both", "red", "green"])
+def test_8bit_lut_matches_in_range(tmp_path, color):
+    hsv_path = LaserDetector(color)
+    lut_path = LaserDetector(color, use_lut=True, lut_bits=8, lut_cache_dir=str(tmp_path))
+    rng = np.random.default_rng(0)
+    frames = [rng.integers(0, 256, (240, 320, 3), dtype=np.uint8), _hsv_boundary_frame()]
+    for frame in frames:
+        assert np.array_equal(lut_path._color_mask(frame), hsv_path._color_mask(frame))
+
+
+def test_lut_reloads_from_disk_cache(tmp_path, monkeypatch):
+    bands = {1: [((0, 100, 100), (10, 255, 255))]}
+    built = ColorLUT(bands, bits=6, cache_dir=str(tmp_path))
+    assert list(tmp_path.glob("laser_lut_*.npz"))
+
+    def fail(*args):
+        raise AssertionError("命中缓存时不应重新构建")
+    monkeypatch.setattr(ColorLUT, "_classify", fail)
+    loaded = ColorLUT(bands, bits=6, cache_dir=str(tmp_path))
+    assert np.array_equal(loaded.table, built.table)
+    assert loaded.mismatch == built.mismatch > 0
+
+    # 阈值不同是另一张表
+    with pytest.raises(AssertionError):
+        ColorLUT({1: [((0, 120, 100), (10, 255, 255))]}, bits=6, cache_dir=str(tmp_path))
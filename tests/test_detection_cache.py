@@ -0,0 +1,60 @@
+import os
+
+from detection_cache import DetectionCache
+from laser_detector import LaserDetector
+
+FRAMES = [
+    {'frame': 3, 'time': 0.1, 'points': [(10, 20), (30, 40)], 'tracks': [1, 2]},
+    {'frame': 6, 'time': 0.2, 'points': [], 'tracks': []},
+    {'frame': 9, 'time': 0.3, 'points': [(11, 21)], 'tracks': [1]},
+]
+
+
+def test_round_trip(make_video, tmp_path):
+    video = make_video([], seconds=1)
+    cache = DetectionCache(str(tmp_path / "cache"))
+    key = cache.key(video, {'sample_interval': 3})
+    assert cache.load(key) is None
+
+    cache.save(key, FRAMES, 30.0, 30)
+    assert cache.load(key) == (FRAMES, 30.0, 30)
+
+    untracked = [{k: v for k, v in f.items() if k != 'tracks'} for f in FRAMES]
+    other = cache.key(video, {'sample_interval': 5})
+    assert other != key
+    cache.save(other, untracked, 30.0, 30)
+    assert cache.load(other) == (untracked, 30.0, 30)
+
+
+def test_key_changes_when_video_changes(make_video, tmp_path):
+    video = make_video([], seconds=1)
+    cache = DetectionCache(str(tmp_path / "cache"))
+    key = cache.key(video, {'sample_interval': 3})
+    cache.save(key, FRAMES, 30.0, 30)
+    assert cache.key(video, {'sample_interval': 3}) == key
+
+    make_video([(0.2, 0.8, (40, 120), (50, 0))], seconds=1)
+    stat = os.stat(video)
+    os.utime(video, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+    changed = cache.key(video, {'sample_interval': 3})
+    assert changed != key
+    assert cache.load(changed) is None
+
+
+def test_tracking_cache_depends_on_workers(make_video, tmp_path):
+    video = make_video([(0.2, 1.2, (60, 120), (40, 0))], seconds=2)
+    detector = LaserDetector(laser_color="red", tracking=True)
+    cache_dir = str(tmp_path / "cache")
+    detector._detect_laser_frames(video, 3, None, 1, False, 1.5, 1.0, cache_dir)
+
+    # 跟踪模式下分块方式不同，轨迹 ID 可能不同，不能共用缓存
+    *_, stats = detector._detect_laser_frames(video, 3, None, 2, False, 1.5, 1.0, cache_dir)
+    assert not stats['cache_hits']
+    *_, stats = detector._detect_laser_frames(video, 3, None, 1, False, 1.5, 1.0, cache_dir)
+    assert stats['cache_hits']
+
+    # 不跟踪时结果与分块无关，共用缓存
+    plain = LaserDetector(laser_color="red")
+    plain._detect_laser_frames(video, 3, None, 1, False, 1.5, 1.0, cache_dir)
+    *_, stats = plain._detect_laser_frames(video, 3, None, 2, False, 1.5, 1.0, cache_dir)
+    assert stats['cache_hits']
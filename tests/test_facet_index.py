@@ -0,0 +1,58 @@
+import itertools
+import random
+from datetime import datetime, timedelta
+
+from facet_index import CONFIRMED, FacetIndex
+
+TAGS = ["算法", "重点", "网络", "数学"]
+VIDEOS = ["a.mp4", "b.mp4", "c.mp4"]
+START = datetime(2024, 1, 1)
+
+
+def _entries(rng, ids):
+    return [{'id': i, 'tags': rng.sample(TAGS, rng.randint(0, 2)),
+             'video_file': rng.choice(VIDEOS),
+             'confidence': rng.choice([CONFIRMED, "中", "低"]),
+             'created_at': (START + timedelta(days=rng.randint(0, 9))).isoformat()}
+            for i in ids]
+
+
+def _brute_force(entries, tag, video, unanswered, since, until):
+    return sorted(
+        e['id'] for e in entries.values()
+        if (tag is None or tag in e['tags'])
+        and (video is None or e['video_file'] == video)
+        and (not unanswered or e['confidence'] != CONFIRMED)
+        and (since is None or datetime.fromisoformat(e['created_at']) >= since)
+        and (until is None or datetime.fromisoformat(e['created_at']) < until))
+
+
+def _check_all_combinations(index, entries):
+    for tag, video, unanswered, since, until in itertools.product(
+            [None, "算法", "数学", "不存在"], [None, "a.mp4", "c.mp4"], [False, True],
+            [None, START + timedelta(days=3)], [None, START + timedelta(days=7)]):
+        expected = _brute_force(entries, tag, video, unanswered, since, until)
+        args = (tag, video, unanswered, since, until)
+        assert index.filter(*args) == expected, args
+        assert index.count(*args) == len(expected), args
+
+
+def test_combined_filters_match_brute_force(tmp_path):
+    rng = random.Random(0)
+    entries = {e['id']: e for e in _entries(rng, range(1, 61))}
+    index = FacetIndex()
+    for entry in entries.values():
+        index.add(entry)
+    _check_all_combinations(index, entries)
+
+    # 修改标签、视频和回答状态后，旧的倒排和状态位都要更新
+    for entry in _entries(rng, rng.sample(sorted(entries), 20)):
+        entries[entry['id']] = entry
+        index.add(entry)
+    _check_all_combinations(index, entries)
+
+    path = str(tmp_path / "qa.facets")
+    index.save(path)
+    loaded = FacetIndex.load(path)
+    _check_all_combinations(loaded, entries)
+    assert loaded.tag_counts() == index.tag_counts()
@@ -0,0 +1,43 @@
+import cv2
+import numpy as np
+
+from frame_cache import StaticFrameCache
+from laser_detector import LaserDetector
+
+
+def _slide():
+    frame = np.full((480, 640, 3), 60, np.uint8)
+    cv2.putText(frame, "slide", (20, 60), cv2.FONT_HERSHEY_SIMPLEX, 1.5, (200, 200, 200), 3)
+    return frame
+
+
+def test_unchanged_frame_reuses_result():
+    detector = LaserDetector(laser_color="red")
+    cache = StaticFrameCache(detector)
+    frame = _slide()
+    cv2.circle(frame, (300, 200), 5, (0, 0, 255), -1)
+
+    assert cache.detect(frame) == [(300, 200)]
+    assert cache.detect(frame.copy()) == [(300, 200)]
+    assert cache.hits == 1
+    assert cache.tiles_scanned == cache.tiles_total // 2
+
+
+def test_changed_tile_is_rescanned():
+    detector = LaserDetector(laser_color="red")
+    cache = StaticFrameCache(detector)
+    first = _slide()
+    cv2.circle(first, (100, 100), 5, (0, 0, 255), -1)
+    cv2.circle(first, (500, 400), 5, (0, 0, 255), -1)
+    assert sorted(cache.detect(first)) == [(100, 100), (500, 400)]
+    full_scan = cache.tiles_scanned
+
+    # 只有右下角的光斑移动：左上角的点沿用，右下角的分块重新检测
+    second = _slide()
+    cv2.circle(second, (100, 100), 5, (0, 0, 255), -1)
+    cv2.circle(second, (520, 410), 5, (0, 0, 255), -1)
+    points = cache.detect(second)
+
+    assert cache.hits == 0
+    assert sorted(points) == sorted(detector.detect_frame(second)) == [(100, 100), (520, 410)]
+    assert 0 < cache.tiles_scanned - full_scan < full_scan
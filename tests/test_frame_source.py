@@ -0,0 +1,63 @@
+import numpy as np
+
+from frame_source import FrameSampler, PrefetchFrameSource, open_frame_source
+
+
+def _frames(source):
+    return [(idx, frame.copy()) for idx, frame in source]
+
+
+def test_sampler_decodes_only_sampled_frames(make_video):
+    video = make_video([(0.5, 1.5, (40, 120), (50, 0))], seconds=3)
+    sampler = FrameSampler(video, sample_interval=4)
+    frames = _frames(sampler)
+
+    assert [idx for idx, _ in frames] == list(range(0, 90, 4))
+    assert sampler.decoded == len(frames)
+    # 其余的帧（包括最后一个采样帧之后的）只 grab，不完整解码
+    assert sampler.decoded + sampler.grabbed == 90
+
+
+def test_chunked_sampling_matches_whole_video(make_video):
+    video = make_video([(0.5, 1.5, (40, 120), (50, 0))], seconds=3)
+    whole = _frames(FrameSampler(video, sample_fps=7))
+    chunks = (_frames(FrameSampler(video, sample_fps=7, start_frame=0, end_frame=40))
+              + _frames(FrameSampler(video, sample_fps=7, start_frame=40)))
+
+    assert [idx for idx, _ in whole] == [int(k * 30 / 7 + 0.5) for k in range(len(whole))]
+    assert [idx for idx, _ in chunks] == [idx for idx, _ in whole]
+    assert all(np.array_equal(a, b) for (_, a), (_, b) in zip(chunks, whole))
+
+
+def test_seek_past_long_gaps(make_video):
+    video = make_video([], seconds=3)
+    sampler = FrameSampler(video, frames=[2, 80], seek_threshold=10)
+    assert [idx for idx, _ in sampler] == [2, 80]
+    assert sampler.seeks == 1
+    assert sampler.grabbed == 2
+
+
+def test_prefetch_keeps_order_and_reuses_buffers(make_video):
+    video = make_video([(0.5, 1.5, (40, 120), (50, 0))], seconds=3)
+    expected = _frames(FrameSampler(video, sample_interval=2))
+    source = PrefetchFrameSource(FrameSampler(video, sample_interval=2), depth=3)
+
+    buffers = {}  # 保留引用，id 不会被复用
+    frames = []
+    for idx, frame in source:
+        buffers[id(frame)] = frame
+        frames.append((idx, frame.copy()))
+
+    assert [idx for idx, _ in frames] == [idx for idx, _ in expected]
+    assert all(np.array_equal(a, b) for (_, a), (_, b) in zip(frames, expected))
+    # 只在 depth + 1 个预分配的缓冲区之间循环
+    assert len(buffers) <= 4
+
+
+def test_prefetch_stops_early(make_video):
+    video = make_video([], seconds=3)
+    source = open_frame_source(video, prefetch=2, sample_interval=1)
+    frames = iter(source)
+    assert next(frames)[0] == 0
+    frames.close()
+    assert source.sampler.cap is None
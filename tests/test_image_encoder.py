@@ -0,0 +1,26 @@
+import cv2
+import numpy as np
+
+from content_analyzer import ContentAnalyzer
+from image_encoder import ImageEncoder
+from laser_detector import LaserSegment
+
+
+def test_encode_stays_within_budget():
+    rng = np.random.default_rng(0)
+    roi = rng.integers(0, 256, size=(900, 1600, 3), dtype=np.uint8)  # 噪声很难压缩
+    encoder = ImageEncoder('openai')
+    encoded = encoder.encode(roi)
+    assert len(encoded.data) <= encoder.max_bytes
+    assert encoded.width * encoded.height <= encoder.max_pixels
+    assert encoder.images == 1 and encoder.bytes_out == len(encoded.data)
+    assert encoder.tokens_baseline == encoder.count_tokens(3200, 1800)
+
+
+def test_screenshot_saved_at_native_resolution(tmp_path):
+    frame = np.full((240, 320, 3), 80, np.uint8)
+    segment = LaserSegment(start_time=1.0, end_time=3.0, laser_duration=1.0, center_frame=45,
+                           positions=[(100, 100)], trajectory_box=(80, 80, 140, 120))
+    content = ContentAnalyzer().analyze_frame(frame, segment, str(tmp_path))
+    saved = cv2.imread(content['roi_path'])
+    assert saved.shape == content['roi_image'].shape
@@ -0,0 +1,56 @@
+import json
+import os
+
+import pytest
+
+from kb_reader import LegacyFormatError, ReadOnlyKnowledgeBase
+from knowledge_base import SimpleKnowledgeBase
+
+
+def _add(kb, i):
+    content = {'timestamp': f"00:{i:02d}", 'roi_path': f"roi_{i}.jpg"}
+    qa = {'ai_description': f"描述 {i} ResNet", 'question': f"问题 {i}",
+          'ai_answer': "【待你回答】", 'tags': ["测试"], 'key_point': "要点",
+          'confidence': "中"}
+    return kb.add("video.mp4", content, qa)
+
+
+def _listing(directory):
+    """目录中的文件名 → (修改时间, 大小)"""
+    return {name: (os.stat(os.path.join(directory, name)).st_mtime_ns,
+                   os.path.getsize(os.path.join(directory, name)))
+            for name in os.listdir(directory)}
+
+
+def test_open_does_not_change_directory(tmp_path):
+    db_path = str(tmp_path / "qa_database.json")
+    kb = SimpleKnowledgeBase(db_path, fsync=False)
+    for i in range(1, 6):
+        _add(kb, i)
+    kb.compact()
+    _add(kb, 6)
+    kb.update(2, your_answer="回答")
+    kb.close()
+    before = _listing(tmp_path)
+
+    reader = ReadOnlyKnowledgeBase(db_path)
+    assert reader.count() == 6
+    assert [e['id'] for e in reader.page(0, 4)] == [1, 2, 3, 4]
+    assert reader.get(2)['your_answer'] == "回答"
+    assert sorted(e['id'] for e in reader.search("ResNet")) == [1, 2, 3, 4, 5, 6]
+    page, after = reader.filter_page(0, 3)
+    assert [e['id'] for e in page] == [1, 2, 3] and after == 3
+    reader.close()
+
+    assert _listing(tmp_path) == before
+
+
+def test_legacy_json_is_not_migrated(tmp_path):
+    db_path = str(tmp_path / "qa_database.json")
+    with open(db_path, 'w', encoding='utf-8') as f:
+        json.dump([{'id': 1, 'ai_description': "旧格式"}], f, ensure_ascii=False)
+    before = _listing(tmp_path)
+
+    with pytest.raises(LegacyFormatError, match="完成迁移"):
+        ReadOnlyKnowledgeBase(db_path)
+    assert _listing(tmp_path) == before
@@ -0,0 +1,45 @@
+import cv2
+import numpy as np
+
+from laser_detector import LaserDetector
+
+
+def _read_frame(video, index):
+    cap = cv2.VideoCapture(video)
+    cap.set(cv2.CAP_PROP_POS_FRAMES, index)
+    ok, frame = cap.read()
+    cap.release()
+    assert ok
+    return frame
+
+
+def test_keyframe_kept_for_long_cluster(make_video):
+    # 4 秒的指点，按默认每 3 帧取一帧约 40 个激光帧，远多于 MAX_KEPT_FRAMES
+    video = make_video([(0.5, 4.5, (40, 120), (50, 0))], seconds=6)
+    detector = LaserDetector(laser_color="red")
+    segments = list(detector.iter_segments(video, keyframes=True))
+
+    assert len(segments) == 1
+    seg = segments[0]
+    assert seg.keyframe is not None
+    assert np.array_equal(seg.keyframe, _read_frame(video, seg.center_frame))
+    # 中间帧取在样本中离正中最近的一帧
+    middle = (0.5 + 4.5) / 2 * 30
+    assert abs(seg.center_frame - middle) <= 15
+
+
+def test_keyframe_center_matches_without_frames(make_video, tmp_path):
+    """命中检测缓存（帧源不提供帧）时中间帧的选取与逐帧检测一致"""
+    video = make_video([(0.5, 4.5, (40, 120), (50, 0)), (6.0, 6.8, (200, 60), (0, 0))],
+                       seconds=7.5)
+    detector = LaserDetector(laser_color="red")
+    cache_dir = str(tmp_path / "cache")
+    first = detector.extract_segments(video, cache_dir=cache_dir, keyframes=True)
+    cached = detector.extract_segments(video, cache_dir=cache_dir, keyframes=True)
+    exact = detector.extract_segments(video)
+
+    assert [s.center_frame for s in cached] == [s.center_frame for s in first]
+    assert all(s.keyframe is not None for s in first)
+    assert all(s.keyframe is None for s in cached)
+    # 短片段（激光帧不超过 MAX_KEPT_FRAMES）就是正中那一帧
+    assert first[1].center_frame == exact[1].center_frame
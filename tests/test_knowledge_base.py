@@ -0,0 +1,61 @@
+import os
+
+from knowledge_base import SimpleKnowledgeBase, rotated_journals
+
+
+def _add(kb, i):
+    content = {'timestamp': f"00:{i:02d}", 'roi_path': f"roi_{i}.jpg"}
+    qa = {'ai_description': f"描述 {i} ResNet", 'question': f"问题 {i}",
+          'ai_answer': "【待你回答】", 'tags': ["测试"], 'key_point': "要点",
+          'confidence': "中"}
+    return kb.add("video.mp4", content, qa)
+
+
+def test_torn_journal_line_is_dropped_and_repaired(tmp_path):
+    """写到一半崩溃留下的残缺行在重放时忽略，下次写入前截掉"""
+    db_path = str(tmp_path / "qa_database.json")
+    kb = SimpleKnowledgeBase(db_path, fsync=False)
+    for i in range(1, 4):
+        _add(kb, i)
+    kb.update(2, your_answer="回答")
+    kb.close()
+
+    with open(kb.journal_path, 'a', encoding='utf-8') as f:
+        f.write('{"op": "add", "entry": {"id": 4, "video_file"')
+
+    kb = SimpleKnowledgeBase(db_path, fsync=False)
+    assert [e['id'] for e in kb.get_all()] == [1, 2, 3]
+    assert kb.get(2)['your_answer'] == "回答"
+    assert _add(kb, 4) == 4
+    kb.close()
+
+    kb = SimpleKnowledgeBase(db_path, fsync=False)
+    assert [e['id'] for e in kb.get_all()] == [1, 2, 3, 4]
+    assert sorted(e['id'] for e in kb.search("ResNet")) == [1, 2, 3, 4]
+    kb.close()
+
+
+def test_journal_left_after_compaction_is_not_applied_twice(tmp_path):
+    """快照写完、旧日志删除前崩溃：旧日志和快照重叠，重放后不产生重复记录"""
+    db_path = str(tmp_path / "qa_database.json")
+    kb = SimpleKnowledgeBase(db_path, fsync=False)
+    for i in range(1, 4):
+        _add(kb, i)
+    kb.close()
+    with open(kb.journal_path, 'rb') as f:
+        journal = f.read()
+
+    kb = SimpleKnowledgeBase(db_path, fsync=False)
+    kb.compact()
+    _add(kb, 4)
+    kb.close()
+    # 模拟旧日志没来得及删除
+    with open(f"{os.path.splitext(kb.journal_path)[0]}.000001.jsonl", 'wb') as f:
+        f.write(journal)
+    assert rotated_journals(kb.journal_path)
+
+    kb = SimpleKnowledgeBase(db_path, fsync=False)
+    assert [e['id'] for e in kb.get_all()] == [1, 2, 3, 4]
+    assert _add(kb, 5) == 5
+    assert len(kb.search("ResNet")) == 5
+    kb.close()
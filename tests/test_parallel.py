@@ -0,0 +1,18 @@
+from laser_detector import LaserDetector, MIN_CHUNK_FRAMES
+
+# 30fps、每块至少 MIN_CHUNK_FRAMES 帧：第一次指点跨过第一个分块边界（10 秒处），
+# 第二次整个落在第二个分块中
+BOUNDARY = MIN_CHUNK_FRAMES / 30
+SPANS = [(BOUNDARY - 1.0, BOUNDARY + 1.0, (20, 60), (30, 0)),
+         (BOUNDARY + 5.0, BOUNDARY + 6.0, (100, 30), (0, 20))]
+
+
+def test_parallel_segments_match_serial_across_chunk_boundary(make_video):
+    video = make_video(SPANS, seconds=BOUNDARY + 8.0, size=(160, 120))
+    detector = LaserDetector(laser_color="red", prefilter=True)
+    serial = detector.extract_segments(video)
+    parallel = detector.extract_segments(video, workers=2)
+
+    assert len(serial) == 2
+    assert serial[0].start_time < BOUNDARY < serial[0].end_time
+    assert parallel == serial
@@ -0,0 +1,77 @@
+import time
+from types import SimpleNamespace
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from pipeline import SegmentPipeline
+
+
+class StubDetector:
+    def __init__(self, count, fail_after=None):
+        self.count = count
+        self.fail_after = fail_after
+
+    def iter_segments(self, video_path, **kwargs):
+        for i in range(1, self.count + 1):
+            if i == self.fail_after:
+                raise RuntimeError("解码失败")
+            yield SimpleNamespace(name=f"seg{i}", keyframe=None)
+
+
+class StubAnalyzer:
+    def __init__(self, fail=()):
+        self.fail = set(fail)
+
+    def analyze(self, video_path, segment, output_dir):
+        if segment.name in self.fail:
+            raise ValueError(f"截图失败 {segment.name}")
+        return {'roi_path': f"{segment.name}.jpg", 'timestamp': segment.name,
+                'laser_duration': 1.0}
+
+
+class StubQAGenerator:
+    """请求并发执行，越早提交的越晚返回"""
+
+    max_in_flight = 4
+    batch_size = 1
+
+    def __init__(self):
+        self.pool = ThreadPoolExecutor(4)
+        self.delay = 0.2
+
+    def submit_images(self, images):
+        futures = []
+        for path, timestamp, duration, _ in images:
+            self.delay = max(0.0, self.delay - 0.04)
+            futures.append(self.pool.submit(self._answer, timestamp, self.delay))
+        return futures
+
+    def _answer(self, timestamp, delay):
+        time.sleep(delay)
+        return {'ai_description': f"描述 {timestamp}"}
+
+
+def test_results_keep_segment_order():
+    qa_gen = StubQAGenerator()
+    pipeline = SegmentPipeline(StubDetector(6), StubAnalyzer(fail={"seg3"}), qa_gen)
+    items = list(pipeline.run("video.mp4"))
+    qa_gen.pool.shutdown()
+
+    assert [item.index for item in items] == [1, 2, 3, 4, 5, 6]
+    assert items[2].content is None and "截图失败" in items[2].error
+    for item in items[:2] + items[3:]:
+        assert item.error is None
+        assert item.qa == {'ai_description': f"描述 seg{item.index}"}
+
+
+def test_detection_error_is_raised_after_earlier_results():
+    qa_gen = StubQAGenerator()
+    pipeline = SegmentPipeline(StubDetector(6, fail_after=4), StubAnalyzer(), qa_gen)
+    results = pipeline.run("video.mp4")
+    done = []
+    with pytest.raises(RuntimeError, match="解码失败"):
+        for item in results:
+            done.append(item.index)
+    qa_gen.pool.shutdown()
+    assert done == [1, 2, 3]
@@ -0,0 +1,30 @@
+import numpy as np
+import pytest
+
+from laser_detector import LaserDetector
+from prefilter import BrightSpotPrefilter
+
+
+@pytest.mark.parametrize("bits", [8, 5, 4])
+def test_prefilter_never_rejects_lut_candidates(tmp_path, bits):
+    """阈值附近的颜色：查找表判为激光色的，预筛选都要放行"""
+    detector = LaserDetector(use_lut=True, lut_bits=bits, lut_cache_dir=str(tmp_path),
+                             prefilter=True)
+    rng = np.random.default_rng(bits)
+    colors = rng.integers(60, 140, size=(3000, 3), dtype=np.uint8)
+    colors[:, 2] = rng.integers(80, 256, size=3000)  # 偏红，多数落在阈值边界附近
+
+    accepted_by_lut = 0
+    for color in colors:
+        frame = np.empty((6, 6, 3), np.uint8)
+        frame[:] = color
+        if detector.lut.mask(frame, detector._lut_classes).any():
+            accepted_by_lut += 1
+            assert detector.prefilter(frame), color
+    assert accepted_by_lut > 0
+
+
+def test_mismatched_prefilter_bits_rejected(tmp_path):
+    with pytest.raises(ValueError):
+        LaserDetector(use_lut=True, lut_bits=4, lut_cache_dir=str(tmp_path),
+                      prefilter=BrightSpotPrefilter(100, 100))
@@ -0,0 +1,34 @@
+import cv2
+import numpy as np
+
+from laser_detector import LaserDetector
+
+
+def _frames(count, seed=0):
+    """1080p 帧：灰色噪声背景、几块大红色色块（比光斑上限大）和 0~3 个大小不一的激光点"""
+    rng = np.random.default_rng(seed)
+    background = rng.integers(40, 90, (1080, 1920, 3), dtype=np.uint8)
+    for _ in range(count):
+        frame = background.copy()
+        x, y = int(rng.integers(0, 1700)), int(rng.integers(0, 900))
+        cv2.rectangle(frame, (x, y), (x + 200, y + 150), (0, 0, 200), -1)
+        for _ in range(rng.integers(0, 4)):
+            center = (int(rng.integers(10, 1910)), int(rng.integers(10, 1070)))
+            # 紧贴色块的光斑在缩小后与色块连成一片，金字塔检测会一并排除（见 _detect_pyramid）
+            while x - 20 <= center[0] <= x + 220 and y - 20 <= center[1] <= y + 170:
+                center = (int(rng.integers(10, 1910)), int(rng.integers(10, 1070)))
+            color = (0, 0, 255) if rng.random() < 0.5 else (0, 255, 0)
+            cv2.circle(frame, center, int(rng.integers(3, 9)), color, -1)
+        yield frame
+
+
+def test_pyramid_matches_full_resolution():
+    full = LaserDetector()
+    pyramids = [LaserDetector(pyramid_level=level) for level in (1, 2)]
+    for frame in _frames(200):
+        expected = sorted(full.detect_frame(frame))
+        for pyramid in pyramids:
+            found = sorted(pyramid.detect_frame(frame))
+            assert len(found) == len(expected)
+            for (x1, y1), (x2, y2) in zip(found, expected):
+                assert abs(x1 - x2) <= 1 and abs(y1 - y2) <= 1
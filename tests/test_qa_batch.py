@@ -0,0 +1,87 @@
+import json
+import re
+import threading
+
+import numpy as np
+import pytest
+
+from qa_generator import QAGenerator, _parse_marks
+
+
+class _Message(dict):
+    def __getattr__(self, name):
+        return self[name]
+
+
+class _StubChatCompletion:
+    """批量请求倒序回复各标记的描述；包含 bad 中时间的批量请求回复无法解析的文本"""
+
+    def __init__(self, bad=()):
+        self.bad = set(bad)
+        self.lock = threading.Lock()
+        self.requests = []  # 每个请求的 (时间列表, 图片数)
+
+    def create(self, messages, **kwargs):
+        content = messages[0]['content']
+        prompt = content[0]['text']
+        images = sum(c['type'] == 'image_url' for c in content)
+        marks = re.findall(r"标记 #(\d+)：时间 (\S+)，", prompt)
+        single = re.findall(r"时间：(\S+)", prompt)
+        with self.lock:
+            self.requests.append(([t for _, t in marks] or single, images))
+        if not marks:
+            text = f"单张 {single[0]}"
+        elif any(t in self.bad for _, t in marks):
+            text = "抱歉，无法按格式回答"
+        else:
+            text = json.dumps([{"mark": int(k), "description": f"批量 {t}"}
+                               for k, t in reversed(marks)], ensure_ascii=False)
+        return _Message(usage=None, choices=[_Message(message=_Message(content=text))])
+
+
+def _qa_gen(monkeypatch, stub, **kwargs):
+    monkeypatch.delenv("VLM_BATCH_SIZE", raising=False)
+    monkeypatch.delenv("VLM_BATCH_MODE", raising=False)
+    qa_gen = QAGenerator(api_key="sk-test", base_url="https://api.openai.com/v1",
+                         cache_dir=None, max_retries=0, **kwargs)
+    qa_gen.client = type("Client", (), {"ChatCompletion": stub, "error": qa_gen.client.error})
+    return qa_gen
+
+
+def _images(count):
+    rng = np.random.default_rng(0)
+    return [(f"roi_{i}.jpg", f"00:0{i}", 1.0, rng.integers(0, 256, (40, 60, 3), np.uint8))
+            for i in range(count)]
+
+
+def test_unparsable_group_splits_into_single_requests(monkeypatch):
+    stub = _StubChatCompletion(bad={"00:02"})
+    qa_gen = _qa_gen(monkeypatch, stub, batch_size=2, max_in_flight=2)
+    results = qa_gen.analyze_batch(_images(5))
+    qa_gen.engine.shutdown()
+
+    assert [r["ai_description"] for r in results] == [
+        "批量 00:00", "批量 00:01", "单张 00:02", "单张 00:03", "单张 00:04"]
+    assert (qa_gen.batches, qa_gen.batch_fallbacks) == (2, 1)
+    # 两个批量请求；无法解析的一组拆成两个逐张请求；最后剩一张直接逐张请求
+    singles = sorted(times[0] for times, images in stub.requests if images == 1)
+    assert singles == ["00:02", "00:03", "00:04"]
+
+
+def test_montage_sends_one_image_per_group(monkeypatch):
+    stub = _StubChatCompletion()
+    qa_gen = _qa_gen(monkeypatch, stub, batch_size=3, batch_mode="montage")
+    results = qa_gen.analyze_batch(_images(3))
+    qa_gen.engine.shutdown()
+
+    assert [r["ai_description"] for r in results] == ["批量 00:00", "批量 00:01", "批量 00:02"]
+    assert stub.requests == [(["00:00", "00:01", "00:02"], 1)]
+
+
+def test_parse_marks_requires_every_mark():
+    text = '好的：[{"mark": 2, "description": "二"}, {"mark": 1, "description": "一"}]'
+    assert _parse_marks(text, 2) == ["一", "二"]
+    with pytest.raises(ValueError):
+        _parse_marks('[{"mark": 1, "description": "一"}]', 2)
+    with pytest.raises(ValueError):
+        _parse_marks("没有数组", 1)
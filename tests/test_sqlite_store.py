@@ -0,0 +1,94 @@
+import json
+import os
+import threading
+
+from knowledge_base import SimpleKnowledgeBase, open_knowledge_base, store_paths
+from sqlite_store import SQLiteKnowledgeBase, migrate_to_sqlite
+
+
+def _add(kb, i, description):
+    content = {'timestamp': f"00:{i:02d}", 'roi_path': f"roi_{i}.jpg"}
+    qa = {'ai_description': description, 'question': f"问题 {i}",
+          'ai_answer': "【待你回答】", 'tags': ["测试"], 'key_point': "要点",
+          'confidence': "中"}
+    return kb.add("video.mp4", content, qa)
+
+
+def test_migrate_reads_source_without_building_indexes(tmp_path):
+    db_path = str(tmp_path / "qa_database.json")
+    kb = SimpleKnowledgeBase(db_path, fsync=False)
+    for i in range(1, 6):
+        _add(kb, i, f"第 {i} 条")
+    kb.close()
+    paths = store_paths(db_path)
+    for name in ('index', 'facets'):
+        if os.path.exists(paths[name]):
+            os.remove(paths[name])
+    threads = threading.active_count()
+
+    sqlite_path = str(tmp_path / "qa_database.sqlite")
+    assert migrate_to_sqlite(db_path, sqlite_path) == 5
+
+    assert not os.path.exists(paths['index'])
+    assert not os.path.exists(paths['facets'])
+    assert threading.active_count() == threads
+    target = SQLiteKnowledgeBase(sqlite_path)
+    assert [e['id'] for e in target.get_all()] == [1, 2, 3, 4, 5]
+    target.close()
+
+
+def test_readonly_sqlite_does_not_create_database(tmp_path):
+    sqlite_path = str(tmp_path / "missing" / "qa_database.sqlite")
+    kb = open_knowledge_base("sqlite", sqlite_path, readonly=True)
+    assert not kb.exists()
+    assert kb.search("任意") == []
+    kb.close()
+    assert not os.path.exists(os.path.dirname(sqlite_path))
+
+
+def test_readonly_sqlite_reads_existing_database(tmp_path):
+    sqlite_path = str(tmp_path / "qa_database.sqlite")
+    kb = SQLiteKnowledgeBase(sqlite_path)
+    _add(kb, 1, "ResNet 残差结构")
+    kb.close()
+
+    kb = open_knowledge_base("sqlite", sqlite_path, readonly=True)
+    assert kb.exists()
+    assert [e['id'] for e in kb.search("ResNet")] == [1]
+    kb.close()
+
+
+def test_search_matches_jsonl_backend(tmp_path):
+    """两种存储对子串、中文和 OR 查询返回相同的记录"""
+    jsonl = SimpleKnowledgeBase(str(tmp_path / "qa_database.json"), fsync=False)
+    sqlite = SQLiteKnowledgeBase(str(tmp_path / "qa_database.sqlite"))
+    descriptions = ([f"ResNet{i} 残差结构" for i in range(20)]
+                    + ["Transformer 注意力机制", "net present value", "动态规划 dp_table"])
+    for i, description in enumerate(descriptions, 1):
+        _add(jsonl, i, description)
+        _add(sqlite, i, description)
+
+    for query in ("Net", "resnet1", "sNe", "残差", "残", "former OR 规划", "dp_", "net 残差"):
+        expected = sorted(e['id'] for e in sqlite.search(query))
+        assert sorted(e['id'] for e in jsonl.search(query)) == expected, query
+    assert len(jsonl.search("Net")) == 21
+    jsonl.close()
+    sqlite.close()
+
+
+def test_migrate_from_legacy_json_leaves_source_untouched(tmp_path):
+    db_path = str(tmp_path / "qa_database.json")
+    entries = [{'id': i, 'video_file': "video.mp4", 'timestamp': f"00:{i:02d}",
+                'screenshot': f"roi_{i}.jpg", 'ai_description': f"第 {i} 条",
+                'question': f"问题 {i}", 'your_answer': "", 'tags': ["测试"],
+                'key_point': "要点", 'confidence': "中", 'created_at': "2024-01-01T00:00:00"}
+               for i in (1, 2, 5)]
+    with open(db_path, 'w', encoding='utf-8') as f:
+        json.dump(entries, f, ensure_ascii=False)
+
+    sqlite_path = str(tmp_path / "qa_database.sqlite")
+    assert migrate_to_sqlite(db_path, sqlite_path) == 3
+    assert sorted(os.listdir(tmp_path)) == ["qa_database.json", "qa_database.sqlite"]
+    target = SQLiteKnowledgeBase(sqlite_path)
+    assert [e['id'] for e in target.get_all()] == [1, 2, 5]
+    target.close()
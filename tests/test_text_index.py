@@ -0,0 +1,55 @@
+from text_index import TextIndex, tokenize
+
+
+def _entry(i, text):
+    return {'id': i, 'ai_description': text}
+
+
+def _brute_force(index, term):
+    """逐个扫描词表的原实现"""
+    if len(term) == 1 or term.isascii():
+        return {t for t in index.postings if term in t and t.isascii() == term.isascii()}
+    return {term} if term in index.postings else set()
+
+
+def test_substring_lookup_matches_vocabulary_scan(tmp_path):
+    index = TextIndex()
+    descriptions = ([f"resnet{i} 残差结构 block_{i * 7}" for i in range(30)]
+                    + ["Transformer 注意力机制", "net present value", "动态规划 dp_table",
+                       "卷积 convnet 残留", "a b ab abc"])
+    for i, text in enumerate(descriptions, 1):
+        index.add(_entry(i, text))
+
+    queries = ["n", "ne", "net", "resn", "resnet1", "block_1", "_", "former", "ab", "abc",
+               "残", "差", "残差", "注意", "xyz", "规划x"]
+    for query in queries:
+        for term in tokenize(query):
+            assert set(index._lookup(term)) == {
+                d for t in _brute_force(index, term) for d in index.postings[t][0]}, term
+
+    # 第一次查询后新增的词也能查到
+    index.add(_entry(100, "densenet 残缺"))
+    assert ({index.doc_entry[d] for d in index._lookup("net")}
+            == set(range(1, 31)) | {32, 34, 100})
+    assert any(index.doc_entry[d] == 100 for d in index._lookup("缺"))
+
+    path = str(tmp_path / "qa.index")
+    index.save(path)
+    loaded = TextIndex.load(path)
+    for term in ("net", "resnet2", "残", "dp"):
+        assert loaded._lookup(term) == index._lookup(term), term
+
+
+def test_substring_hits_ranked_by_bm25():
+    index = TextIndex()
+    index.add(_entry(1, "resnet 残差结构"))
+    index.add(_entry(2, "resnet resnet 残差 残差"))
+    index.add(_entry(3, "resnet 这是一段很长的描述 用来拉低词频权重 还有更多的文字"))
+    index.add(_entry(4, "transformer"))
+
+    # 词频高的排前面，同样词频时短的排前面
+    assert [e for e, _ in index.search("net")] == [2, 1, 3]
+    assert [e for e, _ in index.search("残")] == [2, 1]
+    # 只出现在一条记录里的词权重更高
+    assert index.search("net OR former")[0][0] == 4
+    assert index.search("xyz") == []
@@ -0,0 +1,38 @@
+from laser_detector import LaserDetector
+
+# 两次指点之间隔 1 秒，轨迹早已丢失，第二次一定是新轨迹
+SPANS = [(0.2, 1.2, (60, 120), (40, 0)), (2.2, 3.2, (250, 120), (-40, 0))]
+
+
+def _ids_by_span(laser_frames):
+    first, second = set(), set()
+    for f in laser_frames:
+        (first if f['time'] < 2.0 else second).update(f['tracks'])
+    return first, second
+
+
+def test_track_ids_unique_across_serial_ranges(make_video):
+    video = make_video(SPANS, seconds=3.5)
+    detector = LaserDetector(laser_color="red", tracking=True)
+    laser_frames, _ = detector._scan_ranges(video, [(0, 54), (54, None)], 3, None, 1)
+    first, second = _ids_by_span(laser_frames)
+    assert first and second
+    assert not first & second
+
+
+def test_track_ids_unique_in_adaptive_scan(make_video):
+    video = make_video(SPANS, seconds=3.5)
+    detector = LaserDetector(laser_color="red", tracking=True)
+    laser_frames, _ = detector._scan_adaptive(video, 30.0, 105, 3, None, 1, 0.5, 0.3)
+    first, second = _ids_by_span(laser_frames)
+    assert first and second
+    assert not first & second
+
+
+def test_parallel_scan_matches_serial(make_video):
+    video = make_video(SPANS, seconds=3.5)
+    detector = LaserDetector(laser_color="red", tracking=True)
+    ranges = [(0, 54), (54, None)]
+    serial, _ = detector._scan_ranges(video, ranges, 3, None, 1)
+    parallel, _ = detector._scan_ranges(video, ranges, 3, None, 2)
+    assert parallel == serial
@@ -0,0 +1,38 @@
+import numpy as np
+
+from vector_index import VectorIndex
+
+
+def _entry(i, text):
+    return {'id': i, 'ai_description': text, 'key_point': "【待补充】"}
+
+
+def test_df_consistent_after_crash_before_meta_save(tmp_path):
+    """矩阵已改写、元数据没保存就崩溃，重放同样的修改后文档频率与重建的一致"""
+    path = str(tmp_path / "qa.vectors")
+    entries = [_entry(i, f"卷积网络 第 {i} 层 resnet block {i * 7}") for i in range(1, 11)]
+    index = VectorIndex()
+    for entry in entries:
+        index.add(entry)
+    index.save(path)
+
+    changes = [_entry(3, "注意力机制 transformer"), _entry(11, "动态规划 背包问题")]
+    index = VectorIndex.load(path)
+    for entry in changes:
+        index.add(entry)
+    # 崩溃：修改已写进 .f32，.meta 还是旧的
+    index.matrix.flush()
+    del index
+
+    index = VectorIndex.load(path)
+    for entry in changes:
+        index.add(entry)
+    index.save(path)
+
+    final = {e['id']: e for e in entries + changes}
+    expected = VectorIndex()
+    for entry_id in sorted(final):
+        expected.add(final[entry_id])
+    assert np.array_equal(index.df, expected.df)
+    assert np.array_equal(VectorIndex.load(path).df, expected.df)
+    assert not (tmp_path / "qa.vectors.dirty").exists()
@@ -0,0 +1,77 @@
+import json
+import os
+import random
+
+from vlm_cache import ResponseCache, hamming
+
+SCOPE = "model|v1"
+SHAPE = (300, 400)
+
+
+def _flip(value: int, bits, rng) -> int:
+    for bit in rng.sample(range(256), bits):
+        value ^= 1 << bit
+    return value
+
+
+def test_lookup_matches_brute_force(tmp_path):
+    rng = random.Random(1)
+    cache = ResponseCache(str(tmp_path), threshold=6)
+    stored = {}
+    for i in range(300):
+        h = rng.getrandbits(256)
+        cache.put(h, SHAPE, SCOPE, f"r{i}")
+        stored[h] = f"r{i}"
+    for _ in range(300):
+        base = rng.choice(list(stored))
+        query = _flip(base, rng.randrange(0, 12), rng)
+        dists = sorted((hamming(query, h), h) for h in stored)
+        expected = stored[dists[0][1]] if dists[0][0] <= 6 else None
+        assert cache.get(query, SHAPE, SCOPE) == expected
+
+
+def test_scope_and_aspect_are_respected(tmp_path):
+    cache = ResponseCache(str(tmp_path))
+    cache.put(12345, SHAPE, SCOPE, "a")
+    assert cache.get(12345, SHAPE, "other|v1") is None
+    assert cache.get(12345, (300, 900), SCOPE) is None
+    assert cache.get(12345, SHAPE, SCOPE) == "a"
+
+
+def test_reload_replays_log_and_lru_order(tmp_path):
+    rng = random.Random(2)
+    one, two, three = (rng.getrandbits(256) for _ in range(3))
+    cache = ResponseCache(str(tmp_path), max_entries=2)
+    cache.put(one, SHAPE, SCOPE, "one")
+    cache.put(two, SHAPE, SCOPE, "two")
+    assert cache.get(one, SHAPE, SCOPE) == "one"   # one 变成最近使用
+    cache.put(three, SHAPE, SCOPE, "three")        # 淘汰 two
+    cache.close()
+    with open(cache.path, 'a', encoding='utf-8') as f:
+        f.write('{"scope": "model|v1", "hash": "ff')  # 写到一半中断
+
+    reloaded = ResponseCache(str(tmp_path), max_entries=2)
+    assert reloaded.get(one, SHAPE, SCOPE) == "one"
+    assert reloaded.get(two, SHAPE, SCOPE) is None
+    assert reloaded.get(three, SHAPE, SCOPE) == "three"
+
+
+def test_log_is_compacted(tmp_path):
+    cache = ResponseCache(str(tmp_path))
+    for i in range(1000):
+        cache.put(7, SHAPE, SCOPE, f"r{i}")
+        cache.get(7, SHAPE, SCOPE)
+    cache.close()
+    with open(cache.path, encoding='utf-8') as f:
+        assert len(f.readlines()) < 200
+    assert ResponseCache(str(tmp_path)).get(7, SHAPE, SCOPE) == "r999"
+
+
+def test_legacy_json_cache_is_migrated(tmp_path):
+    legacy = [{'scope': SCOPE, 'hash': f"{5:x}", 'aspect': 4 / 3, 'response': "old"}]
+    with open(tmp_path / "vlm_cache.json", 'w', encoding='utf-8') as f:
+        json.dump(legacy, f)
+    cache = ResponseCache(str(tmp_path))
+    assert cache.get(5, SHAPE, SCOPE) == "old"
+    assert not os.path.exists(tmp_path / "vlm_cache.json")
+    assert ResponseCache(str(tmp_path)).get(5, SHAPE, SCOPE) == "old"
@@ -0,0 +1,118 @@
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from qa_generator import QAGenerator
+from vlm_engine import RequestEngine
+
+
+class HTTPError(Exception):
+    def __init__(self, status_code, headers=None):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+        self.headers = headers or {}
+
+
+def test_retries_retryable_errors_then_succeeds():
+    engine = RequestEngine(max_retries=3, backoff_base=0.001, backoff_max=0.01)
+    responses = [HTTPError(429), HTTPError(503), "ok"]
+
+    def request():
+        response = responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+    assert engine.call(request) == "ok"
+    assert (engine.requests, engine.retries, engine.failures) == (3, 2, 0)
+    engine.shutdown()
+
+
+def test_non_retryable_error_goes_to_fallback():
+    engine = RequestEngine(max_retries=3, backoff_base=0.001)
+    calls = []
+
+    def request(x):
+        calls.append(x)
+        raise HTTPError(400)
+
+    assert engine.call(request, 7, fallback=lambda e, x: ("fallback", x)) == ("fallback", 7)
+    assert calls == [7]
+    assert engine.failures == 1
+    with pytest.raises(HTTPError):
+        engine.call(request, 8)
+    engine.shutdown()
+
+
+def test_map_keeps_order_and_bounds_concurrency():
+    engine = RequestEngine(max_in_flight=3)
+    lock = threading.Lock()
+    running = [0, 0]  # 当前并发数、最大并发数
+
+    def request(i):
+        with lock:
+            running[0] += 1
+            running[1] = max(running[1], running[0])
+        time.sleep(0.01 * (i % 3))
+        with lock:
+            running[0] -= 1
+        return i * i
+
+    assert engine.map(request, [(i,) for i in range(12)]) == [i * i for i in range(12)]
+    assert running[1] <= 3
+    engine.shutdown()
+
+
+class _Message(dict):
+    def __getattr__(self, name):
+        return self[name]
+
+
+class _StubChatCompletion:
+    """批量请求回复无法解析的文本，逐张请求回复编号描述"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = 0
+        self.gate = threading.Event()  # 逐张请求等它放行
+        self.gate.set()
+
+    def create(self, messages, **kwargs):
+        with self.lock:
+            self.calls += 1
+            n = self.calls
+        images = [c for c in messages[0]['content'] if c['type'] == 'image_url']
+        if len(images) == 1:
+            self.gate.wait(10)
+        text = "不是 JSON" if len(images) > 1 else f"描述 {n}"
+        return _Message(usage=None, choices=[_Message(message=_Message(content=text))])
+
+
+def test_group_fallback_does_not_block_workers(monkeypatch):
+    monkeypatch.delenv("VLM_BATCH_SIZE", raising=False)
+    qa_gen = QAGenerator(api_key="sk-test", base_url="https://api.openai.com/v1",
+                         max_in_flight=1, cache_dir=None, batch_size=2, max_retries=0)
+    stub = _StubChatCompletion()
+    qa_gen.client = type("Client", (), {"ChatCompletion": stub, "error": qa_gen.client.error})
+
+    roi = np.full((40, 60, 3), 128, np.uint8)
+    images = [(f"roi_{i}.jpg", f"00:0{i}", 1.0, roi) for i in range(4)]
+    results = [f.result(timeout=10) for f in qa_gen.submit_images(images)]
+
+    assert all(r["ai_description"].startswith("描述") for r in results)
+    assert qa_gen.batches == 2 and qa_gen.batch_fallbacks == 2
+    # 两个批量请求 + 四个逐张请求
+    assert stub.calls == 6
+
+    # 退回逐张请求时只提交，不在调用线程（请求引擎的工作线程）中等待结果
+    stub.gate.clear()
+    jobs = [(path, ts, d, qa_gen._prepare(path, image)) for path, ts, d, image in images[:2]]
+    started = time.perf_counter()
+    futures = qa_gen._group_fallback(ValueError("批量回复无法解析"), jobs)
+    assert time.perf_counter() - started < 1
+    assert not any(f.done() for f in futures)
+    stub.gate.set()
+    assert all(f.result(timeout=10)["ai_description"].startswith("描述") for f in futures)
+    qa_gen.engine.shutdown()